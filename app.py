@@ -6,16 +6,18 @@ import datetime
 from typing import Dict, List, Any, Optional, Tuple
 from pathlib import Path
 
-from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask import Flask, Response, render_template, request, jsonify, send_from_directory, stream_with_context
 from werkzeug.middleware.proxy_fix import ProxyFix
 
 from services.placement import PlacementService
 from services.retrieval import RetrievalService
 from services.waste import WasteService
 from services.simulation import SimulationService
+from services.occupancy import OccupancyRegistry
+from services.optimization import PackingOptimizer
 from models.item import Item
 from models.container import Container
-from models.placement import ItemPlacement, RearrangementStep, WasteItem, WasteReturnStep, PlacementRequest, PlacementResponse
+from models.placement import ItemPlacement, RearrangementStep, WasteItem, WasteReturnStep, PlacementRequest, PlacementResponse, PlacementSummary
 
 app = Flask(__name__,
             static_folder='frontend/src',
@@ -44,11 +46,20 @@ if not LOGS_FILE.exists():
     with open(LOGS_FILE, 'w') as f:
         json.dump([], f)
 
+# Long-lived container occupancy models shared by all services
+occupancy_registry = OccupancyRegistry()
+
 # Initialize service classes
-placement_service = PlacementService()
-retrieval_service = RetrievalService()
-waste_service = WasteService()
+# Set PLACEMENT_WORKERS > 1 to score containers in a process pool
+placement_service = PlacementService(
+    occupancy_registry, workers=int(os.environ.get("PLACEMENT_WORKERS", "0"))
+)
+retrieval_service = RetrievalService(occupancy_registry)
+waste_service = WasteService(occupancy_registry)
 simulation_service = SimulationService()
+# Background re-optimization of the whole stowage plan
+# (set OPTIMIZER_WORKERS > 1 to decode plans in a process pool)
+packing_optimizer = PackingOptimizer(workers=int(os.environ.get("OPTIMIZER_WORKERS", "0")))
 
 # Current date for simulation purposes
 CURRENT_DATE = datetime.datetime.now()
@@ -119,6 +130,35 @@ def dict_to_container(container_dict: Dict) -> Container:
     container.items = container_dict.get("items", [])
     return container
 
+# Helper function to get the search index entry of an item
+def search_entry(item_dict: Dict) -> Tuple[str, str, int, Optional[Dict]]:
+    """Get the (itemId, name, priority, currentLocation) entry of an item dict"""
+    return (item_dict['itemId'], item_dict.get('name', ''), item_dict.get('priority', 0),
+            item_dict.get('currentLocation'))
+
+# Parsed items file and the list position of every itemId, kept until the
+# file changes on disk
+items_cache: Dict[str, Any] = {"stamp": None, "items": [], "positions": {}}
+
+# Helper function to read the items file for read-only lookups
+def read_items_cached() -> Tuple[List[Dict], Dict[str, int]]:
+    """Get the stored items and their positions by itemId, parsing items.json only after it changed
+    
+    The returned items are shared between requests and must not be modified.
+    """
+    if not ITEMS_FILE.exists():
+        return [], {}
+    
+    stat = ITEMS_FILE.stat()
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    if items_cache["stamp"] != stamp:
+        with open(ITEMS_FILE, 'r') as f:
+            items = json.load(f)
+        items_cache["items"] = items
+        items_cache["positions"] = {item['itemId']: index for index, item in enumerate(items)}
+        items_cache["stamp"] = stamp
+    return items_cache["items"], items_cache["positions"]
+
 # Helper function to add a log entry
 def add_log(action: str, details: Optional[Dict[str, Any]] = None, user: str = "system", item_id: Optional[str] = None):
     """Add a log entry with the current timestamp
@@ -174,6 +214,11 @@ def calculate_placement():
     containers_data = data.get('containers', [])
     items_data = data.get('items', [])
     
+    # Provided data replaces the persisted state, so rebuild the occupancy models
+    if containers_data or items_data:
+        occupancy_registry.reset()
+        retrieval_service.reset_search_index()
+    
     if not containers_data:
         if CONTAINERS_FILE.exists():
             with open(CONTAINERS_FILE, 'r') as f:
@@ -196,7 +241,13 @@ def calculate_placement():
     # Call the placement service
     placement_response = placement_service.calculate_placement(
         items=items_dict,
-        containers=containers_dict
+        containers=containers_dict,
+        by_zone=bool(data.get('byZone', False)),  # Solve zones independently, then spill over
+        block_packing=bool(data.get('blockPacking', False)),  # Place runs of identical items as blocks
+        strategy=data.get('strategy', 'best_fit'),  # "wall" loads bulk cargo wall by wall first
+        deadline_ms=data.get('deadlineMs'),  # Time budget; leftover time improves the plan
+        restarts=int(data.get('restarts', 0)),  # Greedy passes in perturbed orders; the best plan is kept
+        seed=int(data.get('seed', 0))  # Seed of the perturbed orders
     )
     
     # Extract placements and rearrangements from the response
@@ -216,6 +267,7 @@ def calculate_placement():
                 "position": placement.position,
                 "rotation": placement.rotation
             }
+            retrieval_service.index_item(*search_entry(items_data[item_idx]))
             
             # Find the corresponding container
             container_idx = next((i for i, container in enumerate(containers_data) 
@@ -275,6 +327,229 @@ def calculate_placement():
         "rearrangements": rearrangements_dict
     })
 
+@app.route('/api/placement/incremental', methods=['POST'])
+def calculate_incremental_placement():
+    """Place only newly imported or unplaced items against the current stowage
+    
+    Request items that are not in the inventory yet are added to it. Without
+    request items, all unplaced, non-waste items are placed.
+    """
+    data = request.json or {}
+    
+    containers_data = []
+    items_data = []
+    if CONTAINERS_FILE.exists():
+        with open(CONTAINERS_FILE, 'r') as f:
+            containers_data = json.load(f)
+    if ITEMS_FILE.exists():
+        with open(ITEMS_FILE, 'r') as f:
+            items_data = json.load(f)
+    
+    item_index = {item['itemId']: i for i, item in enumerate(items_data)}
+    container_index = {c['containerId']: i for i, c in enumerate(containers_data)}
+    
+    delta_data = data.get('items')
+    if delta_data is None:
+        delta_data = [item for item in items_data
+                      if not item.get('currentLocation') and not item.get('isWaste')]
+    
+    # Only the delta is converted to model objects
+    new_items = {}
+    for item_dict in delta_data:
+        if item_dict['itemId'] not in item_index:
+            item_index[item_dict['itemId']] = len(items_data)
+            items_data.append(item_dict)
+            retrieval_service.index_item(*search_entry(item_dict))
+        stored = items_data[item_index[item_dict['itemId']]]
+        if not stored.get('currentLocation'):
+            new_items[stored['itemId']] = dict_to_item(stored)
+    
+    containers_dict = {c['containerId']: dict_to_container(c) for c in containers_data}
+    
+    # The stowed cargo is only needed until the occupancy models are loaded
+    stowed_items = None
+    if not occupancy_registry.loaded:
+        stowed_items = {item['itemId']: dict_to_item(item) for item in items_data
+                        if item.get('currentLocation')}
+    
+    placement_response = placement_service.place_new_items(
+        new_items,
+        containers_dict,
+        stowed_items=stowed_items,
+        block_packing=bool(data.get('blockPacking', False))  # Place runs of identical items as blocks
+    )
+    placements = placement_response.placements
+    
+    # Record the new locations
+    for placement in placements:
+        items_data[item_index[placement.itemId]]['currentLocation'] = {
+            "containerId": placement.containerId,
+            "position": placement.position,
+            "rotation": placement.rotation
+        }
+        retrieval_service.index_item(*search_entry(items_data[item_index[placement.itemId]]))
+        container_dict = containers_data[container_index[placement.containerId]]
+        if placement.itemId not in container_dict['items']:
+            container_dict['items'].append(placement.itemId)
+        container_dict['occupiedSpace'] += new_items[placement.itemId].get_volume()
+    
+    with open(ITEMS_FILE, 'w') as f:
+        json.dump(items_data, f, indent=2)
+    
+    with open(CONTAINERS_FILE, 'w') as f:
+        json.dump(containers_data, f, indent=2)
+    
+    placed_ids = {p.itemId for p in placements}
+    unplaced = [item_id for item_id in new_items if item_id not in placed_ids]
+    
+    add_log(
+        action="calculate_incremental_placement",
+        details={
+            "numItems": len(new_items),
+            "numPlacements": len(placements),
+            "numUnplaced": len(unplaced)
+        }
+    )
+    
+    return jsonify({
+        "placements": [
+            {
+                "itemId": p.itemId,
+                "containerId": p.containerId,
+                "position": p.position,
+                "rotation": p.rotation
+            } for p in placements
+        ],
+        "unplacedItems": unplaced
+    })
+
+@app.route('/api/placement/recommend/stream', methods=['POST'])
+def stream_placement():
+    """Stream placements as NDJSON, one line per committed placement
+    
+    The last line is a summary record with the unplaced items and the
+    rearrangement plan. The stowage is persisted once the stream completes.
+    """
+    data = request.json or {}
+    
+    containers_data = data.get('containers', [])
+    items_data = data.get('items', [])
+    
+    # Provided data replaces the persisted state, so rebuild the occupancy models
+    if containers_data or items_data:
+        occupancy_registry.reset()
+        retrieval_service.reset_search_index()
+    
+    if not containers_data:
+        if CONTAINERS_FILE.exists():
+            with open(CONTAINERS_FILE, 'r') as f:
+                containers_data = json.load(f)
+    
+    if not items_data:
+        if ITEMS_FILE.exists():
+            with open(ITEMS_FILE, 'r') as f:
+                items_data = json.load(f)
+    
+    items_dict = {item['itemId']: dict_to_item(item) for item in items_data}
+    containers_dict = {c['containerId']: dict_to_container(c) for c in containers_data}
+    item_index = {item['itemId']: i for i, item in enumerate(items_data)}
+    container_index = {c['containerId']: i for i, c in enumerate(containers_data)}
+    block_packing = bool(data.get('blockPacking', False))
+    
+    def generate():
+        for record in placement_service.stream_placement(items_dict, containers_dict,
+                                                         block_packing=block_packing):
+            if isinstance(record, PlacementSummary):
+                yield json.dumps({"type": "summary", **record.dict()}) + "\n"
+                
+                with open(ITEMS_FILE, 'w') as f:
+                    json.dump(items_data, f, indent=2)
+                
+                with open(CONTAINERS_FILE, 'w') as f:
+                    json.dump(containers_data, f, indent=2)
+                
+                add_log(
+                    action="stream_placement",
+                    details={
+                        "numItems": len(items_dict),
+                        "numPlacements": record.placedCount,
+                        "numRearrangements": len(record.rearrangements)
+                    }
+                )
+                continue
+            
+            # Record the new location before the placement goes out
+            items_data[item_index[record.itemId]]['currentLocation'] = {
+                "containerId": record.containerId,
+                "position": record.position,
+                "rotation": record.rotation
+            }
+            retrieval_service.index_item(*search_entry(items_data[item_index[record.itemId]]))
+            container_dict = containers_data[container_index[record.containerId]]
+            if record.itemId not in container_dict['items']:
+                container_dict['items'].append(record.itemId)
+            container_dict['occupiedSpace'] += items_dict[record.itemId].get_volume()
+            
+            yield json.dumps({"type": "placement", **record.dict()}) + "\n"
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/api/placement/optimize', methods=['POST'])
+def start_placement_optimization():
+    """Start re-optimizing the current stowage plan in the background"""
+    data = request.json or {}
+    
+    # Optimize a snapshot of the persisted state
+    containers_data = []
+    items_data = []
+    if CONTAINERS_FILE.exists():
+        with open(CONTAINERS_FILE, 'r') as f:
+            containers_data = json.load(f)
+    if ITEMS_FILE.exists():
+        with open(ITEMS_FILE, 'r') as f:
+            items_data = json.load(f)
+    
+    items_dict = {item['itemId']: dict_to_item(item) for item in items_data}
+    containers_dict = {c['containerId']: dict_to_container(c) for c in containers_data}
+    
+    job_id = packing_optimizer.start_job(
+        items_dict,
+        containers_dict,
+        seed=int(data.get('seed', 0)),
+        time_limit=data.get('timeLimitSeconds')  # Stop early, e.g. before the morning shift
+    )
+    
+    add_log(
+        action="start_placement_optimization",
+        details={"jobId": job_id, "numItems": len(items_dict), "numContainers": len(containers_dict)}
+    )
+    
+    return jsonify({"success": True, "jobId": job_id})
+
+@app.route('/api/placement/optimize/<job_id>')
+def get_placement_optimization(job_id):
+    """Get the progress of an optimization job, and its candidate plan once finished"""
+    job = packing_optimizer.get_job(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": f"Job {job_id} not found"}), 404
+    
+    result = job.pop("result")
+    job["result"] = None
+    if result is not None:
+        job["result"] = {
+            "placements": [p.dict() for p in result.placements],
+            "rearrangements": [r.dict() for r in result.rearrangements]
+        }
+    
+    return jsonify({"success": True, **job})
+
+@app.route('/api/placement/optimize/<job_id>/cancel', methods=['POST'])
+def cancel_placement_optimization(job_id):
+    """Stop an optimization job early; the best plan found so far is kept"""
+    if not packing_optimizer.cancel_job(job_id):
+        return jsonify({"success": False, "error": f"Job {job_id} not found"}), 404
+    return jsonify({"success": True})
+
 @app.route('/api/items/search')
 def search_item():
     """Search for an item by ID or name"""
@@ -289,23 +564,42 @@ def search_item():
         user=user_id
     )
     
-    # Load items data
-    items = []
-    if ITEMS_FILE.exists():
-        with open(ITEMS_FILE, 'r') as f:
-            items = json.load(f)
+    # Load items data (parsed again only after the file changed)
+    items, positions = read_items_cached()
     
     # Perform the search
     results = []
     if item_id:
-        results = [item for item in items if item['itemId'] == item_id]
+        if item_id in positions:
+            results = [items[positions[item_id]]]
     elif item_name:
-        # Case-insensitive partial match
+        # Case-insensitive partial match; only the items the search index
+        # matched are looked up, in stored order
+        retrieval_service.load_search_index(search_entry(item) for item in items)
+        matched = [matched_id for matched_id in retrieval_service.find_item_ids(item_name)
+                   if matched_id in positions]
         search_term = item_name.lower()
-        results = [item for item in items if search_term in item['name'].lower()]
+        for matched_id in sorted(matched, key=positions.get):
+            item = items[positions[matched_id]]
+            if search_term in item['name'].lower():
+                results.append(item)
     
     return jsonify(results)
 
+@app.route('/api/items/autocomplete')
+def autocomplete_items():
+    """Complete an item ID or name prefix, e.g. on every keystroke of the search box"""
+    prefix = request.args.get('prefix', '')
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+    
+    # The items are only read from disk the first time; afterwards the
+    # handlers that change items keep the in-memory index in sync
+    if not retrieval_service.search_index_loaded:
+        items, _ = read_items_cached()
+        retrieval_service.load_search_index(search_entry(item) for item in items)
+    
+    return jsonify({"suggestions": retrieval_service.autocomplete(prefix, limit)})
+
 @app.route('/api/items/retrieve', methods=['POST'])
 def retrieve_item():
     """Get item location and retrieval steps"""
@@ -841,6 +1135,8 @@ def complete_undocking():
             # Only remove items that are in the undocking container
             if waste_item.containerId == undocking_container_id:
                 items_to_remove.append(item_id)
+                occupancy_registry.remove_item(item_id)
+                retrieval_service.unindex_item(item_id)
                 
                 # Remove from container's items list if it exists
                 for container in containers_list:
@@ -961,11 +1257,13 @@ def import_items():
                                           if existing['itemId'] == item['itemId']), None)
                 
                 if existing_item_index is not None:
-                    # Update existing item
+                    # Update existing item (it is no longer stowed)
                     items[existing_item_index] = item
+                    occupancy_registry.remove_item(item_id)
                 else:
                     # Add new item
                     items.append(item)
+                retrieval_service.index_item(*search_entry(item))
                 
                 imported_count += 1
             except Exception as row_error:
@@ -1201,6 +1499,9 @@ def clear_data_files():
     with open(LOGS_FILE, 'w') as f:
         json.dump([], f)
     
+    occupancy_registry.reset()
+    retrieval_service.reset_search_index()
+    
     add_log(action="system_startup", details={"message": "Data files cleared for clean state"})
 
 # Call the function immediately to clear data on startup
@@ -6,9 +6,22 @@ import pandas as pd
 from datetime import datetime, timedelta
 import random
 import json
+from collections import deque
+
+from utils.voxel_grid import PackedVoxelGrid
+from utils.octree import OctreeVoxelGrid
+
+# Occupancy grid implementations a container can use
+OCCUPANCY_BACKENDS = {
+    'packed': PackedVoxelGrid,  # 1 bit per cm³, fastest box tests
+    'octree': OctreeVoxelGrid   # Memory follows the surface of the stowed items
+}
 
 class CargoVisualizer:
-    def __init__(self):
+    def __init__(self, occupancy_backend='packed'):
+        if occupancy_backend not in OCCUPANCY_BACKENDS:
+            raise ValueError(f"Unknown occupancy backend: {occupancy_backend}")
+        self.occupancy_backend = occupancy_backend  # Default for new containers
         self.containers = {}  # Dictionary to store containers by container_id
         self.items = {}  # Dictionary to store items by item_id
         self.placements = {}  # Dictionary to store item placements {item_id: (container_id, position)}
@@ -62,17 +75,78 @@ class CargoVisualizer:
             print(f"Error loading items: {e}")
             return False
     
-    def add_container(self, container_id, zone, width, depth, height):
-        """Add a container to the system"""
+    def add_container(self, container_id, zone, width, depth, height, occupancy_backend=None):
+        """Add a container to the system
+        
+        occupancy_backend picks the occupancy grid ('packed' or 'octree') and
+        defaults to the visualizer's backend.
+        """
+        backend = occupancy_backend or self.occupancy_backend
+        if backend not in OCCUPANCY_BACKENDS:
+            raise ValueError(f"Unknown occupancy backend: {backend}")
+        
         self.containers[container_id] = {
             'zone': zone,
             'width': width,
             'depth': depth,
             'height': height,
-            'occupied_space': np.zeros((width, depth, height), dtype=bool)  # 3D array to track occupied space
+            'occupancy': OCCUPANCY_BACKENDS[backend](width, depth, height)  # Occupied space
         }
         return True
     
+    def _depth_slices(self, occupancy, chunk=16):
+        """Yield the (width, height) occupancy slice of every depth, front to back, read chunk slices at a time"""
+        depth = occupancy.shape[1]
+        for first in range(0, depth, chunk):
+            slab = occupancy.slab(first, min(chunk, depth - first))
+            for index in range(slab.shape[1]):
+                yield slab[:, index, :]
+    
+    def _valid_depth_slabs(self, container, item_dims):
+        """Yield (d_start, valid) for every depth an item can start at, front to back
+        
+        valid is a boolean array indexed by (width, height) start coordinates.
+        Only the occupancy of the item's depth window is held at a time: a
+        per-column count of occupied cells slides along the depth axis, and a
+        2D summed-area table over the blocked columns tests every start
+        position of the slab at once. Nothing is kept on the container.
+        """
+        occupancy = container['occupancy']
+        width, depth, height = occupancy.shape
+        w, d, h = item_dims
+        
+        # Occupied cells of every (width, height) column over the window
+        # [d_start, d_start + d), whose slices are kept until they leave it
+        slices = self._depth_slices(occupancy)
+        window = deque(next(slices) for _ in range(d))
+        column_counts = np.sum(window, axis=0, dtype=np.int32)
+        sat = np.zeros((width + 1, height + 1), dtype=np.int32)
+        for d_start in range(depth - d + 1):
+            if d_start:
+                window.append(next(slices))
+                column_counts += window[-1]
+                column_counts -= window.popleft()
+            
+            sat[1:, 1:] = (column_counts > 0).cumsum(0, dtype=np.int32).cumsum(1)
+            counts = sat[w:, h:] - sat[:-w, h:] - sat[w:, :-h] + sat[:-w, :-h]
+            yield d_start, counts == 0
+    
+    def find_valid_positions(self, container_id, item_dims):
+        """Find every valid start position for an item, one depth slab at a time
+        
+        Returns a boolean array indexed by (width, depth, height) start
+        coordinates, or None if the item can never fit in the container.
+        """
+        if container_id not in self.containers:
+            return None
+        
+        container = self.containers[container_id]
+        w, d, h = item_dims
+        if w > container['width'] or d > container['depth'] or h > container['height']:
+            return None
+        
+        return np.stack([valid for _, valid in self._valid_depth_slabs(container, item_dims)], axis=1)
+    
     def add_item(self, item_id, name, width, depth, height, mass, priority, expiry_date, usage_limit, preferred_zone):
         """Add an item to the system"""
         self.items[item_id] = {
@@ -90,6 +164,50 @@ class CargoVisualizer:
         }
         return True
     
+    def _occupancy_spectrum(self, container):
+        """Get the spectrum of a container's occupancy grid for FFT search"""
+        return np.fft.rfftn(container['occupancy'].to_dense().astype(np.float64))
+    
+    def find_valid_positions_fft(self, container_id, item_dims, spectrum=None):
+        """Find every valid start position for an item by FFT convolution
+        
+        Correlating the occupancy grid with a box kernel of the item's size
+        gives the number of occupied cells under the item at every start
+        position; zero cells are collision-free, so the cost does not depend on
+        how full the container is. spectrum is the container's occupancy
+        spectrum from _occupancy_spectrum; it is computed (and dropped again)
+        when not given. Returns a boolean array indexed by (width, depth,
+        height) start coordinates, or None if the item can never fit.
+        """
+        if container_id not in self.containers:
+            return None
+        
+        container = self.containers[container_id]
+        w, d, h = item_dims
+        if w > container['width'] or d > container['depth'] or h > container['height']:
+            return None
+        
+        shape = container['occupancy'].shape
+        if spectrum is None:
+            spectrum = self._occupancy_spectrum(container)
+        
+        # The box kernel is separable, so its spectrum is the outer product of
+        # the spectra of three 1D box functions
+        def box_spectrum(length, size, transform):
+            box = np.zeros(length, dtype=np.float64)
+            box[:size] = 1.0
+            return np.conj(transform(box))
+        
+        kernel_fft = (
+            box_spectrum(shape[0], w, np.fft.fft)[:, None, None] *
+            box_spectrum(shape[1], d, np.fft.fft)[None, :, None] *
+            box_spectrum(shape[2], h, np.fft.rfft)[None, None, :]
+        )
+        
+        # Circular correlation; start positions where the item fits never wrap around
+        counts = np.fft.irfftn(spectrum * kernel_fft, s=shape)
+        return counts[:shape[0] - w + 1, :shape[1] - d + 1, :shape[2] - h + 1] < 0.5
+    
     def is_position_valid(self, container_id, start_coords, item_dims):
         """Check if an item can be placed at the given position"""
         if container_id not in self.containers:
@@ -105,27 +223,25 @@ class CargoVisualizer:
             h_start + h_size > container['height']):
             return False
         
-        # Check if space is already occupied
-        occupied_space = container['occupied_space']
-        
         # Check if the entire space needed for the item is free
-        item_space = occupied_space[w_start:w_start+w_size, 
-                                   d_start:d_start+d_size, 
-                                   h_start:h_start+h_size]
-        
-        if np.any(item_space):
+        if container['occupancy'].any_in_box(start_coords, item_dims):
             # Space is already occupied
             return False
         
         return True
     
-    def place_item(self, item_id, container_id, start_coords):
-        """Place an item in a container at specified position"""
+    def place_item(self, item_id, container_id, start_coords, item_dims=None):
+        """Place an item in a container at specified position
+        
+        item_dims gives the rotated (width, depth, height) of the item and
+        defaults to its original orientation.
+        """
         if item_id not in self.items or container_id not in self.containers:
             return False
         
         item = self.items[item_id]
-        item_dims = (item['width'], item['depth'], item['height'])
+        if item_dims is None:
+            item_dims = (item['width'], item['depth'], item['height'])
         
         if not self.is_position_valid(container_id, start_coords, item_dims):
             return False
@@ -135,9 +251,7 @@ class CargoVisualizer:
         w_size, d_size, h_size = item_dims
         
         container = self.containers[container_id]
-        container['occupied_space'][w_start:w_start+w_size, 
-                                   d_start:d_start+d_size, 
-                                   h_start:h_start+h_size] = True
+        container['occupancy'].fill_box(start_coords, item_dims)
         
         # Store placement
         end_coords = (w_start + w_size, d_start + d_size, h_start + h_size)
@@ -228,11 +342,18 @@ class CargoVisualizer:
         
         return len(blocking_items), retrieval_steps
     
-    def find_placement_for_item(self, item_id, containers=None):
+    def find_placement_for_item(self, item_id, containers=None, method="scan"):
         """
         Find optimal placement for an item
         This is where your placement algorithm would go
+        
+        method selects the search engine: "scan" tests the item's original
+        orientation one depth slab at a time, front to back, "fft" uses FFT
+        convolution and also tries every rotation of the item.
         """
+        if method == "fft":
+            return self.find_placement_for_item_fft(item_id, containers)
+        
         if item_id not in self.items:
             return None
         
@@ -268,60 +389,130 @@ class CargoVisualizer:
             # where we can minimize steps for retrieval (front of container)
             w, d, h = item['width'], item['depth'], item['height']
             
-            # Try to place near the open face (assuming depth=0 is the open face)
-            for h_start in range(container['height'] - h + 1):
-                for w_start in range(container['width'] - w + 1):
-                    # Try to place as close to open face as possible
-                    d_start = 0
-                    
-                    # Check if this position is valid
-                    if self.is_position_valid(container_id, (w_start, d_start, h_start), (w, d, h)):
-                        return {
-                            'container_id': container_id,
-                            'position': {
-                                'startCoordinates': {
-                                    'width': w_start,
-                                    'depth': d_start,
-                                    'height': h_start
-                                },
-                                'endCoordinates': {
-                                    'width': w_start + w,
-                                    'depth': d_start + d,
-                                    'height': h_start + h
-                                }
-                            }
-                        }
+            if w > container['width'] or d > container['depth'] or h > container['height']:
+                continue
             
-            # If no position found at depth=0, try other depths
-            for d_start in range(1, container['depth'] - d + 1):
-                for h_start in range(container['height'] - h + 1):
-                    for w_start in range(container['width'] - w + 1):
-                        
-                        # Check if this position is valid
-                        if self.is_position_valid(container_id, (w_start, d_start, h_start), (w, d, h)):
-                            return {
-                                'container_id': container_id,
-                                'position': {
-                                    'startCoordinates': {
-                                        'width': w_start,
-                                        'depth': d_start,
-                                        'height': h_start
-                                    },
-                                    'endCoordinates': {
-                                        'width': w_start + w,
-                                        'depth': d_start + d,
-                                        'height': h_start + h
-                                    }
-                                }
-                            }
+            # Prefer positions near the open face (assuming depth=0 is the open face),
+            # then the lowest, then the left-most one: the first valid cell in
+            # (depth, height, width) order, so the scan stops at the first
+            # depth slab with room
+            found = None
+            for d_start, valid in self._valid_depth_slabs(container, (w, d, h)):
+                if valid.any():
+                    by_height = valid.T
+                    h_start, w_start = (
+                        int(v) for v in np.unravel_index(np.argmax(by_height), by_height.shape)
+                    )
+                    found = (d_start, h_start, w_start)
+                    break
+            if found is None:
+                continue
+            
+            d_start, h_start, w_start = found
+            return {
+                'container_id': container_id,
+                'position': {
+                    'startCoordinates': {
+                        'width': w_start,
+                        'depth': d_start,
+                        'height': h_start
+                    },
+                    'endCoordinates': {
+                        'width': w_start + w,
+                        'depth': d_start + d,
+                        'height': h_start + h
+                    }
+                }
+            }
+        
+        # No valid position found
+        return None
+    
+    def find_placement_for_item_fft(self, item_id, containers=None):
+        """
+        Find a placement for an item using the FFT convolution engine
+        
+        Every rotation of the item is convolved with the occupancy grid of each
+        container; the front-most, then lowest, then left-most collision-free
+        start position wins. Containers in the item's preferred zone are tried
+        first. The result also holds the chosen 'rotation' (width, depth, height).
+        """
+        if item_id not in self.items:
+            return None
+        
+        item = self.items[item_id]
+        
+        # If no containers specified, use all containers
+        if containers is None:
+            containers = list(self.containers.keys())
+        
+        # Try containers in the preferred zone first
+        known_containers = [c for c in containers if c in self.containers]
+        all_containers = (
+            [c for c in known_containers if self.containers[c]['zone'] == item['preferred_zone']] +
+            [c for c in known_containers if self.containers[c]['zone'] != item['preferred_zone']]
+        )
+        
+        # Distinct orientations, original one first
+        w, d, h = item['width'], item['depth'], item['height']
+        rotations = []
+        for rotation in [(w, d, h), (w, h, d), (d, w, h), (d, h, w), (h, w, d), (h, d, w)]:
+            if rotation not in rotations:
+                rotations.append(rotation)
+        
+        for container_id in all_containers:
+            # One spectrum per container and search, shared by every rotation
+            spectrum = None
+            best = None
+            container = self.containers[container_id]
+            for rotation in rotations:
+                if (rotation[0] > container['width'] or rotation[1] > container['depth'] or
+                        rotation[2] > container['height']):
+                    continue
+                if spectrum is None:
+                    spectrum = self._occupancy_spectrum(container)
+                valid = self.find_valid_positions_fft(container_id, rotation, spectrum)
+                if valid is None or not valid.any():
+                    continue
+                
+                # First valid cell in (depth, height, width) order
+                by_depth = valid.transpose(1, 2, 0)
+                d_start, h_start, w_start = (
+                    int(v) for v in np.unravel_index(np.argmax(by_depth), by_depth.shape)
+                )
+                if best is None or (d_start, h_start, w_start) < best[0]:
+                    best = ((d_start, h_start, w_start), rotation)
+            
+            if best is None:
+                continue
+            
+            (d_start, h_start, w_start), rotation = best
+            return {
+                'container_id': container_id,
+                'position': {
+                    'startCoordinates': {
+                        'width': w_start,
+                        'depth': d_start,
+                        'height': h_start
+                    },
+                    'endCoordinates': {
+                        'width': w_start + rotation[0],
+                        'depth': d_start + rotation[1],
+                        'height': h_start + rotation[2]
+                    }
+                },
+                'rotation': rotation
+            }
         
         # No valid position found
         return None
     
-    def optimize_placement(self, items=None):
+    def optimize_placement(self, items=None, method="scan"):
         """
         Find optimal placement for multiple items
         This is a simplified algorithm - your real algorithm would be more sophisticated
+        
+        method selects the search engine used by find_placement_for_item.
         """
         if items is None:
             # Use all items that aren't placed yet
@@ -335,7 +526,7 @@ class CargoVisualizer:
         unsuccessful_items = []
         
         for item_id in sorted_items:
-            placement = self.find_placement_for_item(item_id)
+            placement = self.find_placement_for_item(item_id, method=method)
             
             if placement:
                 container_id = placement['container_id']
@@ -345,8 +536,8 @@ class CargoVisualizer:
                     placement['position']['startCoordinates']['height']
                 )
                 
-                # Try to place the item
-                if self.place_item(item_id, container_id, start_coords):
+                # Try to place the item (possibly rotated)
+                if self.place_item(item_id, container_id, start_coords, placement.get('rotation')):
                     successful_placements.append({
                         'itemId': item_id,
                         'containerId': container_id,
@@ -474,8 +665,12 @@ class CargoVisualizer:
             'changes': changes
         }
     
-    def visualize_container(self, container_id):
-        """Visualize a container and its contents in 3D"""
+    def visualize_container(self, container_id, show_occupancy=False):
+        """Visualize a container and its contents in 3D
+        
+        With show_occupancy the occupied regions recorded by the container's
+        occupancy grid are drawn as an outline overlay (e.g. the octree leaves).
+        """
         if container_id not in self.containers:
             print(f"Container {container_id} not found")
             return
@@ -592,6 +787,24 @@ class CargoVisualizer:
             text_z = (start['height'] + end['height']) / 2
             ax.text(text_x, text_y, text_z, item_id, fontsize=8)
         
+        # Overlay the occupied regions as seen by the occupancy grid
+        if show_occupancy:
+            overlay = []
+            for (w0, d0, h0), (w_size, d_size, h_size) in container['occupancy'].occupied_boxes():
+                w1, d1, h1 = w0 + w_size, d0 + d_size, h0 + h_size
+                overlay.extend([
+                    [(w0, d0, h0), (w1, d0, h0), (w1, d0, h1), (w0, d0, h1)],  # Front face
+                    [(w0, d1, h0), (w1, d1, h0), (w1, d1, h1), (w0, d1, h1)],  # Back face
+                    [(w0, d0, h0), (w0, d1, h0), (w0, d1, h1), (w0, d0, h1)],  # Left face
+                    [(w1, d0, h0), (w1, d1, h0), (w1, d1, h1), (w1, d0, h1)],  # Right face
+                    [(w0, d0, h0), (w1, d0, h0), (w1, d1, h0), (w0, d1, h0)],  # Bottom face
+                    [(w0, d0, h1), (w1, d0, h1), (w1, d1, h1), (w0, d1, h1)]   # Top face
+                ])
+            
+            if overlay:
+                poly = Poly3DCollection(overlay, facecolors='none', edgecolors='gray', linewidths=0.3, alpha=0.5)
+                ax.add_collection3d(poly)
+        
         # Set labels and title
         ax.set_xlabel('Width')
         ax.set_ylabel('Depth')
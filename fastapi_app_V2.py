@@ -2,21 +2,23 @@ from datetime import datetime
 import json
 import os
 import csv
-from typing import Dict, List, Optional, Any, Union
+from typing import Dict, Iterable, List, Optional, Any, Tuple, Union
 from fastapi import FastAPI, Request, Query, UploadFile, File, Body, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse
 from io import StringIO
 from pathlib import Path
 
 from models.container import Container
 from models.item import Item
-from models.placement import PlacementRequest, PlacementResponse, ItemPlacement, RearrangementStep, WasteItem
+from models.placement import PlacementRequest, PlacementResponse, PlacementSummary, ItemPlacement, RearrangementStep, WasteItem
 from services.placement import PlacementService
 from services.retrieval import RetrievalService
 from services.waste import WasteService
 from services.simulation import SimulationService
+from services.occupancy import OccupancyRegistry
+from services.optimization import PackingOptimizer
 
 app = FastAPI(title="Space Station Cargo Management System")
 
@@ -115,6 +117,30 @@ def item_to_dict(item: Item) -> dict:
 def container_to_dict(container: Container) -> dict:
     return container.dict() if hasattr(container, "dict") else dict(container)
 
+def search_entry(item_dict: Dict) -> Tuple[str, str, int, Optional[Dict]]:
+    # (itemId, name, priority, currentLocation) entry of the search index
+    return (item_dict["itemId"], item_dict.get("name", ""), item_dict.get("priority", 0),
+            item_dict.get("currentLocation"))
+
+# Position of every itemId in items_data; handlers replace and reorder
+# items_data, so positions are checked on use and rebuilt when stale
+item_positions: Dict[str, int] = {}
+
+def lookup_items(item_ids: Iterable[str]) -> List[Dict]:
+    # Items with the given IDs, in items_data order (unknown IDs are skipped)
+    found = {}
+    rebuilt = False
+    for item_id in item_ids:
+        index = item_positions.get(item_id)
+        if (index is None or index >= len(items_data) or items_data[index]["itemId"] != item_id) and not rebuilt:
+            item_positions.clear()
+            item_positions.update((item["itemId"], i) for i, item in enumerate(items_data))
+            rebuilt = True
+            index = item_positions.get(item_id)
+        if index is not None and index < len(items_data) and items_data[index]["itemId"] == item_id:
+            found[index] = items_data[index]
+    return [found[index] for index in sorted(found)]
+
 # --- Logging ---
 def add_log(action: str, details: Optional[Dict[str, Any]] = None, user: str = "system", item_id: Optional[str] = None):
     global logs_data, CURRENT_DATE
@@ -134,10 +160,17 @@ def add_log(action: str, details: Optional[Dict[str, Any]] = None, user: str = "
     return log_entry
 
 # --- Services ---
-placement_service = PlacementService()
-retrieval_service = RetrievalService()
-waste_service = WasteService()
+occupancy_registry = OccupancyRegistry()
+# Set PLACEMENT_WORKERS > 1 to score containers in a process pool
+placement_service = PlacementService(
+    occupancy_registry, workers=int(os.environ.get("PLACEMENT_WORKERS", "0"))
+)
+retrieval_service = RetrievalService(occupancy_registry)
+waste_service = WasteService(occupancy_registry)
 simulation_service = SimulationService()
+# Background re-optimization of the whole stowage plan
+# (set OPTIMIZER_WORKERS > 1 to decode plans in a process pool)
+packing_optimizer = PackingOptimizer(workers=int(os.environ.get("OPTIMIZER_WORKERS", "0")))
 
 # --- ROUTES ---
 
@@ -159,12 +192,22 @@ async def calculate_placement(payload: dict = Body(...)):
     # Load data if not provided
     containers_in = payload.get("containers") or containers_data
     items_in = payload.get("items") or items_data
+    # Provided data replaces the persisted state, so rebuild the occupancy models
+    if payload.get("containers") or payload.get("items"):
+        occupancy_registry.reset()
+        retrieval_service.reset_search_index()
     containers = [dict_to_container(c) for c in containers_in]
     items = [dict_to_item(i) for i in items_in]
     items_dict = {item.itemId: item for item in items}
     containers_dict = {c.containerId: c for c in containers}
     placement_response = placement_service.calculate_placement(
-        items=items_dict, containers=containers_dict
+        items=items_dict, containers=containers_dict,
+        by_zone=bool(payload.get("byZone", False)),  # Solve zones independently, then spill over
+        block_packing=bool(payload.get("blockPacking", False)),  # Place runs of identical items as blocks
+        strategy=payload.get("strategy", "best_fit"),  # "wall" loads bulk cargo wall by wall first
+        deadline_ms=payload.get("deadlineMs"),  # Time budget; leftover time improves the plan
+        restarts=int(payload.get("restarts", 0)),  # Greedy passes in perturbed orders; the best plan is kept
+        seed=int(payload.get("seed", 0))  # Seed of the perturbed orders
     )
     placements = placement_response.placements
     rearrangements = placement_response.rearrangements
@@ -178,6 +221,7 @@ async def calculate_placement(payload: dict = Body(...)):
                 "position": placement.position,
                 "rotation": placement.rotation
             }
+            retrieval_service.index_item(*search_entry(items_in[item_idx]))
             container_idx = next((i for i, c in enumerate(containers_in) if c['containerId'] == placement.containerId), None)
             if container_idx is not None:
                 if placement.itemId not in containers_in[container_idx]['items']:
@@ -200,6 +244,148 @@ async def calculate_placement(payload: dict = Body(...)):
     rearrangements_dict = [r.dict() for r in rearrangements]
     return {"placements": placements_dict, "rearrangements": rearrangements_dict}
 
+# --- Incremental Placement ---
+@app.post("/api/placement/incremental")
+async def calculate_incremental_placement(payload: dict = Body(default={})):
+    # Request items not in the inventory yet are added to it; without request
+    # items, all unplaced, non-waste items are placed
+    item_index = {item['itemId']: i for i, item in enumerate(items_data)}
+    container_index = {c['containerId']: i for i, c in enumerate(containers_data)}
+
+    delta_in = payload.get("items")
+    if delta_in is None:
+        delta_in = [item for item in items_data if not item.get("currentLocation") and not item.get("isWaste")]
+
+    # Only the delta is converted to model objects
+    new_items = {}
+    for item_dict in delta_in:
+        if item_dict["itemId"] not in item_index:
+            item_index[item_dict["itemId"]] = len(items_data)
+            items_data.append(item_dict)
+            retrieval_service.index_item(*search_entry(item_dict))
+        stored = items_data[item_index[item_dict["itemId"]]]
+        if not stored.get("currentLocation"):
+            new_items[stored["itemId"]] = dict_to_item(stored)
+
+    containers_dict = {c["containerId"]: dict_to_container(c) for c in containers_data}
+
+    # The stowed cargo is only needed until the occupancy models are loaded
+    stowed_items = None
+    if not occupancy_registry.loaded:
+        stowed_items = {item["itemId"]: dict_to_item(item) for item in items_data if item.get("currentLocation")}
+
+    placement_response = placement_service.place_new_items(
+        new_items, containers_dict, stowed_items=stowed_items,
+        block_packing=bool(payload.get("blockPacking", False))  # Place runs of identical items as blocks
+    )
+    placements = placement_response.placements
+
+    # Record the new locations
+    for placement in placements:
+        items_data[item_index[placement.itemId]]["currentLocation"] = {
+            "containerId": placement.containerId,
+            "position": placement.position,
+            "rotation": placement.rotation
+        }
+        retrieval_service.index_item(*search_entry(items_data[item_index[placement.itemId]]))
+        container_dict = containers_data[container_index[placement.containerId]]
+        if placement.itemId not in container_dict["items"]:
+            container_dict["items"].append(placement.itemId)
+        container_dict["occupiedSpace"] += new_items[placement.itemId].get_volume()
+    save_data(containers_data, items_data, logs_data, CURRENT_DATE)
+
+    placed_ids = {p.itemId for p in placements}
+    unplaced = [item_id for item_id in new_items if item_id not in placed_ids]
+    add_log(
+        action="calculate_incremental_placement",
+        details={"numItems": len(new_items), "numPlacements": len(placements), "numUnplaced": len(unplaced)}
+    )
+    return {"placements": [p.dict() for p in placements], "unplacedItems": unplaced}
+
+# --- Streaming Placement ---
+@app.post("/api/placement/recommend/stream")
+async def stream_placement(payload: dict = Body(default={})):
+    # NDJSON, one line per committed placement and a final summary record;
+    # the stowage is persisted once the stream completes
+    containers_in = payload.get("containers") or containers_data
+    items_in = payload.get("items") or items_data
+    # Provided data replaces the persisted state, so rebuild the occupancy models
+    if payload.get("containers") or payload.get("items"):
+        occupancy_registry.reset()
+        retrieval_service.reset_search_index()
+    items_dict = {i["itemId"]: dict_to_item(i) for i in items_in}
+    containers_dict = {c["containerId"]: dict_to_container(c) for c in containers_in}
+    item_index = {item["itemId"]: i for i, item in enumerate(items_in)}
+    container_index = {c["containerId"]: i for i, c in enumerate(containers_in)}
+    block_packing = bool(payload.get("blockPacking", False))
+
+    def generate():
+        global containers_data, items_data
+        for record in placement_service.stream_placement(items_dict, containers_dict, block_packing=block_packing):
+            if isinstance(record, PlacementSummary):
+                yield json.dumps({"type": "summary", **record.dict()}) + "\n"
+                containers_data = containers_in
+                items_data = items_in
+                save_data(containers_data, items_data, logs_data, CURRENT_DATE)
+                add_log(
+                    action="stream_placement",
+                    details={"numItems": len(items_dict), "numPlacements": record.placedCount,
+                             "numRearrangements": len(record.rearrangements)}
+                )
+                continue
+
+            # Record the new location before the placement goes out
+            items_in[item_index[record.itemId]]["currentLocation"] = {
+                "containerId": record.containerId,
+                "position": record.position,
+                "rotation": record.rotation
+            }
+            retrieval_service.index_item(*search_entry(items_in[item_index[record.itemId]]))
+            container_dict = containers_in[container_index[record.containerId]]
+            if record.itemId not in container_dict["items"]:
+                container_dict["items"].append(record.itemId)
+            container_dict["occupiedSpace"] += items_dict[record.itemId].get_volume()
+            yield json.dumps({"type": "placement", **record.dict()}) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+# --- Background Plan Optimization ---
+@app.post("/api/placement/optimize")
+async def start_placement_optimization(payload: dict = Body(default={})):
+    items_dict = {item['itemId']: dict_to_item(item) for item in items_data}
+    containers_dict = {c['containerId']: dict_to_container(c) for c in containers_data}
+    job_id = packing_optimizer.start_job(
+        items_dict,
+        containers_dict,
+        seed=int(payload.get("seed", 0)),
+        time_limit=payload.get("timeLimitSeconds")  # Stop early, e.g. before the morning shift
+    )
+    add_log(
+        action="start_placement_optimization",
+        details={"jobId": job_id, "numItems": len(items_dict), "numContainers": len(containers_dict)}
+    )
+    return {"success": True, "jobId": job_id}
+
+@app.get("/api/placement/optimize/{job_id}")
+async def get_placement_optimization(job_id: str):
+    job = packing_optimizer.get_job(job_id)
+    if job is None:
+        return {"success": False, "error": f"Job {job_id} not found"}
+    result = job.pop("result")
+    job["result"] = None
+    if result is not None:
+        job["result"] = {
+            "placements": [p.dict() for p in result.placements],
+            "rearrangements": [r.dict() for r in result.rearrangements]
+        }
+    return {"success": True, **job}
+
+@app.post("/api/placement/optimize/{job_id}/cancel")
+async def cancel_placement_optimization(job_id: str):
+    if not packing_optimizer.cancel_job(job_id):
+        return {"success": False, "error": f"Job {job_id} not found"}
+    return {"success": True}
+
 # --- Item Search ---
 @app.get("/api/items/search")
 async def search_item(itemId: Optional[str] = Query(None), itemName: Optional[str] = Query(None), userId: Optional[str] = Query("anonymous")):
@@ -208,15 +394,25 @@ async def search_item(itemId: Optional[str] = Query(None), itemName: Optional[st
         details={"itemId": itemId, "itemName": itemName},
         user=userId
     )
-    items = items_data
     results = []
     if itemId:
-        results = [item for item in items if item['itemId'] == itemId]
+        results = lookup_items([itemId])
     elif itemName:
+        # Candidates come from the search index and only they are looked up;
+        # the name check drops ID-only matches
+        retrieval_service.load_search_index(search_entry(item) for item in items_data)
+        matched = retrieval_service.find_item_ids(itemName)
         search_term = itemName.lower()
-        results = [item for item in items if search_term in item['name'].lower()]
+        results = [item for item in lookup_items(matched) if search_term in item['name'].lower()]
     return results
 
+# --- Item Autocomplete ---
+@app.get("/api/items/autocomplete")
+async def autocomplete_items(prefix: str = Query(""), limit: int = Query(10, ge=1, le=50)):
+    # Served from the in-memory index, so it can run on every keystroke
+    retrieval_service.load_search_index(search_entry(item) for item in items_data)
+    return {"suggestions": retrieval_service.autocomplete(prefix, limit)}
+
 # --- Item Retrieval ---
 @app.post("/api/items/retrieve")
 async def retrieve_item(payload: dict = Body(...)):
@@ -455,6 +651,8 @@ async def complete_undocking(payload: dict = Body(...)):
             item_id = waste_item.itemId
             if waste_item.containerId == undocking_container_id:
                 items_to_remove.append(item_id)
+                occupancy_registry.remove_item(item_id)
+                retrieval_service.unindex_item(item_id)
                 container = next((c for c in containers_data if c['containerId'] == waste_item.containerId), None)
                 if container and item_id in container.get('items', []):
                     container['items'].remove(item_id)
@@ -521,8 +719,10 @@ async def import_items(file: UploadFile = File(...)):
             existing_item_index = next((i for i, existing in enumerate(items) if existing['itemId'] == item['itemId']), None)
             if existing_item_index is not None:
                 items[existing_item_index] = item
+                occupancy_registry.remove_item(item_id)
             else:
                 items.append(item)
+            retrieval_service.index_item(*search_entry(item))
             imported_count += 1
         except Exception as row_error:
             errors.append(f"Row {row_num}: {str(row_error)}")
@@ -613,6 +813,8 @@ def clear_data_files():
         json.dump([], f)
     with open(LOGS_FILE, 'w') as f:
         json.dump([], f)
+    occupancy_registry.reset()
+    retrieval_service.reset_search_index()
     add_log(action="system_startup", details={"message": "Data files cleared for clean state"})
 
 # Uncomment the next line to clear data at each startup:
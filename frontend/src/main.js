@@ -9,6 +9,7 @@ document.addEventListener('DOMContentLoaded', () => {
 let containersData = [];
 let itemsData = [];
 let containerViewer = null;
+let autocompleteRequestId = 0;
 
 // API endpoint base URL
 const API_BASE_URL = '/api';
@@ -109,6 +110,9 @@ function setupEventListeners() {
                 handleSearchSubmit();
             }
         });
+        
+        // Suggest completions as the user types
+        searchInput.addEventListener('input', handleSearchAutocomplete);
     }
     
     // Calculate placement button
@@ -605,6 +609,45 @@ async function handleSearchSubmit() {
     }
 }
 
+async function handleSearchAutocomplete() {
+    const searchInput = document.getElementById('searchInput');
+    const suggestions = document.getElementById('searchSuggestions');
+    if (!searchInput || !suggestions) return;
+    
+    const prefix = searchInput.value.trim();
+    const requestId = ++autocompleteRequestId;
+    
+    if (!prefix) {
+        suggestions.innerHTML = '';
+        return;
+    }
+    
+    try {
+        const searchParams = new URLSearchParams({ prefix: prefix, limit: 8 });
+        const response = await fetch(`${API_BASE_URL}/items/autocomplete?${searchParams.toString()}`);
+        if (!response.ok) {
+            throw new Error('Autocomplete failed');
+        }
+        
+        const result = await response.json();
+        
+        // Answers to older keystrokes may arrive late; only the latest counts
+        if (requestId !== autocompleteRequestId) return;
+        
+        suggestions.innerHTML = '';
+        result.suggestions.forEach(suggestion => {
+            const option = document.createElement('option');
+            option.value = suggestion.itemId.toLowerCase().startsWith(prefix.toLowerCase())
+                ? suggestion.itemId
+                : suggestion.name;
+            option.label = `${suggestion.name} (ID: ${suggestion.itemId}, priority ${suggestion.priority})`;
+            suggestions.appendChild(option);
+        });
+    } catch (error) {
+        console.error('Error loading search suggestions:', error);
+    }
+}
+
 function displaySearchResults(items) {
     const searchResults = document.getElementById('searchResults');
     if (!searchResults) return;
@@ -54,6 +54,12 @@ class RearrangementStep(BaseModel):
 class PlacementRequest(BaseModel):
     items: List
     containers: Optional[List] = None
+    byZone: bool = False  # Solve each zone independently, then spill over
+    blockPacking: bool = False  # Place runs of identical items as blocks
+    strategy: str = "best_fit"  # "wall" loads bulk cargo wall by wall first
+    deadlineMs: Optional[float] = None  # Time budget; leftover time improves the plan
+    restarts: int = 0  # Greedy passes in perturbed orders; the best plan is kept
+    seed: int = 0  # Seed of the perturbed orders
     
     class Config:
         json_schema_extra = {
@@ -105,6 +111,21 @@ class PlacementResponse(BaseModel):
             }
         }
 
+class PlacementSummary(BaseModel):
+    """Final record of a streamed placement, after all placements"""
+    placedCount: int
+    unplacedItems: List[str]
+    rearrangements: List[RearrangementStep]
+    
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "placedCount": 1,
+                "unplacedItems": [],
+                "rearrangements": []
+            }
+        }
+
 class ItemLocation(BaseModel):
     itemId: str
     name: str
@@ -0,0 +1,475 @@
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+import itertools
+import threading
+import time
+
+from models.item import Item
+from models.container import Container
+from utils.space3d import Space3D, EPSILON
+
+class OccupancyRegistry:
+    """Long-lived 3D occupancy models of all containers, keyed by containerId
+
+    The models are loaded once from the persisted item locations and then
+    updated in place whenever an item is placed, retrieved or undocked.
+    Placement, retrieval and waste services share one registry so their
+    cost follows the change instead of the size of the inventory.
+    """
+
+    def __init__(self):
+        self.spaces: Dict[str, Space3D] = {}
+        self.item_containers: Dict[str, str] = {}  # itemId -> containerId
+        self.loaded = False
+
+        # Containers sorted by the volume of their largest free box
+        self.capacity_index: List[Tuple[float, str]] = []
+        self.capacity_keys: Dict[str, float] = {}
+
+        # Stowed items of every zone sorted by priority per volume, the
+        # cheapest to move out of the way first
+        self.eviction_index: Dict[str, List[Tuple[float, str]]] = {}
+        self.eviction_keys: Dict[str, Tuple[str, float, float]] = {}  # itemId -> (zone, key, priority)
+
+        # Containers of every zone sorted by their usable largest free box and
+        # free volume, i.e. less what is reserved for planned moves
+        self.zone_capacity: Dict[str, List[Tuple[float, float, str]]] = {}
+        self.zone_capacity_keys: Dict[str, Tuple[str, float, float]] = {}  # containerId -> (zone, box, volume)
+        self.container_zones: Dict[str, str] = {}
+        self.used_volumes: Dict[str, float] = {}
+
+        # Space booked for planned moves: reservationId -> (containerId, volume, expiry)
+        self.reservations: Dict[str, Tuple[str, float, Optional[float]]] = {}
+        self.reserved_volumes: Dict[str, float] = {}
+        self._reservation_ids = itertools.count(1)
+        self._reservation_lock = threading.Lock()
+
+        # Request threads and the optimizer thread share the registry, so
+        # changes to the models and indexes are serialized. It is taken
+        # before the reservation lock, never while holding it
+        self._lock = threading.RLock()
+
+    def load(self, items: Dict[str, Item], containers: Dict[str, Container]) -> None:
+        """Load the stowed items into the occupancy models (only done once)"""
+        with self._lock:
+            if self.loaded:
+                return
+
+            for container in containers.values():
+                self.get_space(container)
+
+            for item in items.values():
+                self.track_item(item, containers)
+
+            self.loaded = True
+
+    def sync_items(self, items: Iterable[Item], containers: Dict[str, Container]) -> None:
+        """Bring the models in line with the persisted locations of the given items
+
+        Placement passes call this once before placing anything, so no new
+        item can be put where a stowed item not tracked yet already sits.
+        """
+        with self._lock:
+            for item in items:
+                self.track_item(item, containers)
+
+    def reset(self) -> None:
+        """Forget all occupancy state, e.g. after the persisted data was replaced"""
+        with self._lock:
+            self.spaces = {}
+            self.item_containers = {}
+            self.loaded = False
+            self.capacity_index = []
+            self.capacity_keys = {}
+            self.eviction_index = {}
+            self.eviction_keys = {}
+            self.zone_capacity = {}
+            self.zone_capacity_keys = {}
+            self.container_zones = {}
+            self.used_volumes = {}
+            with self._reservation_lock:
+                self.reservations = {}
+                self.reserved_volumes = {}
+
+    def copy(self) -> "OccupancyRegistry":
+        """Independent copy of the models and indexes, e.g. for trial plans
+
+        Space models are copied structurally (Space3D.copy) and reservations
+        are carried over, so the copy answers every lookup as the original.
+        """
+        with self._lock:
+            clone = OccupancyRegistry()
+            clone.spaces = {container_id: space.copy() for container_id, space in self.spaces.items()}
+            clone.item_containers = dict(self.item_containers)
+            clone.loaded = self.loaded
+            clone.capacity_index = list(self.capacity_index)
+            clone.capacity_keys = dict(self.capacity_keys)
+            clone.eviction_index = {zone: list(entries) for zone, entries in self.eviction_index.items()}
+            clone.eviction_keys = dict(self.eviction_keys)
+            clone.container_zones = dict(self.container_zones)
+            clone.used_volumes = dict(self.used_volumes)
+            with self._reservation_lock:
+                clone.zone_capacity = {zone: list(bucket) for zone, bucket in self.zone_capacity.items()}
+                clone.zone_capacity_keys = dict(self.zone_capacity_keys)
+                clone.reservations = dict(self.reservations)
+                clone.reserved_volumes = dict(self.reserved_volumes)
+            return clone
+
+    def get_space(self, container: Container) -> Space3D:
+        """Get the occupancy model of a container, creating it if needed
+
+        If the container was re-imported with different dimensions the model
+        is rebuilt with the items it already holds.
+        """
+        with self._lock:
+            zone_changed = self.container_zones.get(container.containerId) != container.zone
+            self.container_zones[container.containerId] = container.zone
+            space = self.spaces.get(container.containerId)
+            if (space is not None and
+                    space.width == container.width and
+                    space.depth == container.depth and
+                    space.height == container.height):
+                if zone_changed:
+                    self._refresh_capacity(container.containerId)
+                return space
+
+            new_space = Space3D(container.width, container.depth, container.height)
+            if space is not None:
+                for item_id, box in space.placed_items.items():
+                    if not new_space.place_item(*box, item_id=item_id):
+                        # No longer fits in the resized container
+                        self.item_containers.pop(item_id, None)
+                        self._unindex_eviction(item_id)
+
+            self.spaces[container.containerId] = new_space
+            self.used_volumes[container.containerId] = new_space.get_used_volume()
+            self._refresh_capacity(container.containerId)
+            return new_space
+
+    def get_item_box(self, item_id: str) -> Optional[Tuple[float, float, float, float, float, float]]:
+        """Get the (x, y, z, width, depth, height) box an item occupies"""
+        container_id = self.item_containers.get(item_id)
+        if container_id is None:
+            return None
+        return self.spaces[container_id].placed_items.get(item_id)
+
+    def track_item(self, item: Item, containers: Dict[str, Container]) -> bool:
+        """Make sure an item's persisted location is reflected in the models
+
+        This is a dictionary lookup when the registry is already in sync.
+        """
+        with self._lock:
+            location = item.currentLocation
+            if not location or "containerId" not in location:
+                self.remove_item(item.itemId)
+                return False
+
+            container = containers.get(location["containerId"])
+            if container is None:
+                return False
+
+            position = tuple(location.get("position") or (0, 0, 0))
+            rotation = tuple(location.get("rotation") or (item.width, item.depth, item.height))
+
+            box = self.get_item_box(item.itemId)
+            if (box is not None and
+                    self.item_containers[item.itemId] == container.containerId and
+                    all(abs(a - b) <= EPSILON for a, b in zip(box, position + rotation))):
+                self.update_priority(item.itemId, item.priority)
+                return True
+
+            self.remove_item(item.itemId)
+            return self.place_item(item.itemId, container, position, rotation, priority=item.priority)
+
+    def place_item(
+        self,
+        item_id: str,
+        container: Container,
+        position: Tuple[float, float, float],
+        rotation: Tuple[float, float, float],
+        priority: Optional[float] = None
+    ) -> bool:
+        """Record an item as stowed in a container
+
+        Items placed with a priority become eviction candidates of the
+        container's zone.
+        """
+        with self._lock:
+            space = self.get_space(container)
+            x, y, z = position
+            width, depth, height = rotation
+
+            if not space.place_item(x, y, z, width, depth, height, item_id=item_id):
+                return False
+
+            self.item_containers[item_id] = container.containerId
+            self.used_volumes[container.containerId] += width * depth * height
+            self._refresh_capacity(container.containerId)
+            if priority is not None:
+                self._index_eviction(item_id, container.zone, priority)
+            return True
+
+    def remove_item(self, item_id: str) -> bool:
+        """Record an item as no longer stowed (retrieved, moved or undocked)"""
+        with self._lock:
+            container_id = self.item_containers.pop(item_id, None)
+            if container_id is None:
+                return False
+
+            box = self.spaces[container_id].placed_items.get(item_id)
+            removed = self.spaces[container_id].remove_item(item_id)
+            if removed:
+                self.used_volumes[container_id] -= box[3] * box[4] * box[5]
+            self._refresh_capacity(container_id)
+            self._unindex_eviction(item_id)
+            return removed
+
+    def update_priority(self, item_id: str, priority: float) -> None:
+        """Re-sort a stowed item in the eviction index after its priority changed"""
+        with self._lock:
+            entry = self.eviction_keys.get(item_id)
+            if entry is not None and entry[2] != priority:
+                self._index_eviction(item_id, entry[0], priority)
+
+    def eviction_candidates(self, zone: str, below_priority: float) -> Iterator[str]:
+        """Iterate the items stowed in a zone with a lower priority, cheapest first
+
+        Items come in order of priority per volume, so the ones holding the
+        most space for the least priority are offered first.
+        """
+        for _, item_id in self.eviction_index.get(zone, ()):
+            if self.eviction_keys[item_id][2] < below_priority:
+                yield item_id
+
+    def candidate_containers(
+        self,
+        rotations: Sequence[Tuple[float, float, float]],
+        container_ids: Optional[Iterable[str]] = None
+    ) -> Set[str]:
+        """Get the containers that might still hold a box in one of the given rotations
+
+        Containers whose largest free box is smaller than the box, or whose
+        free extents cannot take any rotation, are pruned without looking
+        at their free spaces. container_ids limits the lookup to a few
+        containers (all by default).
+        """
+        if not rotations:
+            return set()
+
+        width, depth, height = rotations[0]
+        volume = width * depth * height
+
+        if container_ids is None:
+            start = bisect_left(self.capacity_index, (volume - EPSILON, ""))
+            entries = self.capacity_index[start:]
+        else:
+            entries = [
+                (self.capacity_keys[container_id], container_id) for container_id in container_ids
+                if container_id in self.capacity_keys and self.capacity_keys[container_id] >= volume - EPSILON
+            ]
+
+        candidates = set()
+        for _, container_id in entries:
+            max_width, max_depth, max_height, _ = self.spaces[container_id].free_summary()
+            if any(w <= max_width + EPSILON and d <= max_depth + EPSILON and h <= max_height + EPSILON
+                   for w, d, h in rotations):
+                candidates.add(container_id)
+        return candidates
+
+    def fitting_containers(
+        self,
+        rotations: Sequence[Tuple[float, float, float]],
+        zone: Optional[str] = None,
+        exclude: Iterable[str] = ()
+    ) -> List[str]:
+        """Get the containers with usable room for a box, the least room first
+
+        Only containers of the given zone are considered (all if None).
+        Reserved space counts as taken. The zone buckets are sorted by usable
+        largest free box, so the lookup starts at the first container large
+        enough; the free extents then have to take one of the rotations.
+        """
+        with self._reservation_lock:
+            return self._fitting_containers(rotations, zone, set(exclude))
+
+    def reserve(self, container_id: str, volume: float, ttl: Optional[float] = None) -> str:
+        """Book space in a container for a planned move and get the reservation ID
+
+        The space counts as taken for the capacity lookups until the
+        reservation is released or, with a ttl in seconds, expires.
+        """
+        with self._reservation_lock:
+            return self._book(container_id, volume, ttl)
+
+    def reserve_space(
+        self,
+        rotations: Sequence[Tuple[float, float, float]],
+        zone: Optional[str] = None,
+        exclude: Iterable[str] = (),
+        ttl: Optional[float] = None
+    ) -> Optional[Tuple[str, str]]:
+        """Find a container for a box and book the space in one step
+
+        Returns (containerId, reservationId), or None if nothing has room.
+        Concurrent plans cannot both book the last room of a container.
+        """
+        if not rotations:
+            return None
+        width, depth, height = rotations[0]
+        with self._reservation_lock:
+            fitting = self._fitting_containers(rotations, zone, set(exclude))
+            if not fitting:
+                return None
+            return fitting[0], self._book(fitting[0], width * depth * height, ttl)
+
+    def release(self, reservation_id: str) -> None:
+        """Give back the space of a reservation (unknown IDs are ignored)"""
+        with self._reservation_lock:
+            self._drop_reservation(reservation_id)
+
+    def _fitting_containers(
+        self,
+        rotations: Sequence[Tuple[float, float, float]],
+        zone: Optional[str],
+        excluded: Set[str]
+    ) -> List[str]:
+        """Capacity lookup behind fitting_containers (the lock must be held)"""
+        if not rotations:
+            return []
+
+        self._expire_reservations()
+        width, depth, height = rotations[0]
+        volume = width * depth * height
+        zones = [zone] if zone is not None else list(self.zone_capacity)
+
+        fitting = []
+        for zone_id in zones:
+            bucket = self.zone_capacity.get(zone_id, [])
+            for entry in bucket[bisect_left(bucket, (volume - EPSILON, float("-inf"), "")):]:
+                container_id = entry[2]
+                if container_id in excluded:
+                    continue
+                max_width, max_depth, max_height, _ = self.spaces[container_id].free_summary()
+                if any(w <= max_width + EPSILON and d <= max_depth + EPSILON and h <= max_height + EPSILON
+                       for w, d, h in rotations):
+                    fitting.append(entry)
+        fitting.sort()
+        return [entry[2] for entry in fitting]
+
+    def _book(self, container_id: str, volume: float, ttl: Optional[float]) -> str:
+        """Record a reservation and re-sort its container (the lock must be held)"""
+        reservation_id = f"res-{next(self._reservation_ids)}"
+        expiry = time.monotonic() + ttl if ttl is not None else None
+        self.reservations[reservation_id] = (container_id, volume, expiry)
+        self.reserved_volumes[container_id] = self.reserved_volumes.get(container_id, 0.0) + volume
+        self._refresh_zone_capacity(container_id)
+        return reservation_id
+
+    def _expire_reservations(self) -> None:
+        """Drop the reservations past their expiry (the lock must be held)"""
+        now = time.monotonic()
+        for reservation_id in [reservation_id for reservation_id, (_, _, expiry) in self.reservations.items()
+                               if expiry is not None and expiry <= now]:
+            self._drop_reservation(reservation_id)
+
+    def _drop_reservation(self, reservation_id: str) -> None:
+        """Remove a reservation and re-sort its container (the lock must be held)"""
+        reservation = self.reservations.pop(reservation_id, None)
+        if reservation is None:
+            return
+        container_id, volume, _ = reservation
+        self.reserved_volumes[container_id] -= volume
+        if self.reserved_volumes[container_id] <= EPSILON:
+            del self.reserved_volumes[container_id]
+        if container_id in self.spaces:
+            self._refresh_zone_capacity(container_id)
+
+    def _refresh_capacity(self, container_id: str) -> None:
+        """Re-sort a container in the capacity indexes after its free space changed"""
+        old_key = self.capacity_keys.pop(container_id, None)
+        if old_key is not None:
+            index = bisect_left(self.capacity_index, (old_key, container_id))
+            del self.capacity_index[index]
+
+        key = self.spaces[container_id].free_summary()[3]
+        insort(self.capacity_index, (key, container_id))
+        self.capacity_keys[container_id] = key
+
+        with self._reservation_lock:
+            self._refresh_zone_capacity(container_id)
+
+    def _refresh_zone_capacity(self, container_id: str) -> None:
+        """Re-sort a container in its zone's bucket (the lock must be held)"""
+        old_entry = self.zone_capacity_keys.pop(container_id, None)
+        if old_entry is not None:
+            bucket = self.zone_capacity[old_entry[0]]
+            del bucket[bisect_left(bucket, (old_entry[1], old_entry[2], container_id))]
+
+        # A reservation may come out of the largest free box, so it is
+        # taken off both measures
+        space = self.spaces[container_id]
+        reserved = self.reserved_volumes.get(container_id, 0.0)
+        zone = self.container_zones.get(container_id, "")
+        box = space.free_summary()[3] - reserved
+        volume = space.width * space.depth * space.height - self.used_volumes[container_id] - reserved
+        insort(self.zone_capacity.setdefault(zone, []), (box, volume, container_id))
+        self.zone_capacity_keys[container_id] = (zone, box, volume)
+
+    def _index_eviction(self, item_id: str, zone: str, priority: float) -> None:
+        """Sort a stowed item into its zone's eviction index by priority per volume"""
+        self._unindex_eviction(item_id)
+        width, depth, height = self.get_item_box(item_id)[3:]
+        key = priority / max(0.1, width * depth * height)
+        insort(self.eviction_index.setdefault(zone, []), (key, item_id))
+        self.eviction_keys[item_id] = (zone, key, priority)
+
+    def _unindex_eviction(self, item_id: str) -> None:
+        """Drop an item from the eviction index"""
+        entry = self.eviction_keys.pop(item_id, None)
+        if entry is not None:
+            zone_index = self.eviction_index[entry[0]]
+            del zone_index[bisect_left(zone_index, (entry[1], item_id))]
+
+    def get_blockers(self, item_id: str, transitive: bool = False) -> List[str]:
+        """Get the items blocking an item, from its container's blocking graph
+
+        With transitive, items blocking those blockers are included too. The
+        result is in removal order: every item comes after the items blocking
+        it, otherwise front to back, top to bottom and left to right.
+        """
+        container_id = self.item_containers.get(item_id)
+        if container_id is None:
+            return []
+
+        space = self.spaces[container_id]
+        graph = space.blocking
+        blockers = graph.transitive_blockers(item_id) if transitive else graph.blockers[item_id]
+
+        def position_key(other_id):
+            x, y, z = space.placed_items[other_id][:3]
+            return (y, -z, x, other_id)
+
+        return graph.removal_order(sorted(blockers, key=position_key))
+
+    def removal_order(self, item_ids: Iterable[str]) -> List[str]:
+        """Reorder items so none is taken out before the items blocking it
+
+        Items keep their given order where their containers' blocking graphs
+        allow it; untracked items keep their slots.
+        """
+        item_ids = list(dict.fromkeys(item_ids))
+
+        # Order each container's items within the slots they already hold
+        slots: Dict[str, List[int]] = {}
+        for index, item_id in enumerate(item_ids):
+            container_id = self.item_containers.get(item_id)
+            if container_id is not None:
+                slots.setdefault(container_id, []).append(index)
+
+        result = list(item_ids)
+        for container_id, indices in slots.items():
+            graph = self.spaces[container_id].blocking
+            ordered = graph.removal_order(item_ids[index] for index in indices)
+            for index, item_id in zip(indices, ordered):
+                result[index] = item_id
+        return result
@@ -0,0 +1,546 @@
+from typing import Callable, Dict, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+import copy
+import random
+import threading
+import time
+import uuid
+
+from models.item import Item
+from models.container import Container
+from models.placement import ItemPlacement, RearrangementStep, PlacementResponse
+from services.occupancy import OccupancyRegistry
+from services.placement import PlacementService
+from utils.space3d import Space3D, EPSILON
+
+# Chromosome: the order items are placed in and a preferred rotation per item
+# (indices into the optimizer's item list and into Item.get_all_rotations())
+Chromosome = Tuple[List[int], List[int]]
+
+# Fitness: volume placed, items placed, items in their zone, minus total blocking
+Fitness = Tuple[float, int, int, int]
+
+
+class _Decoder:
+    """Turn chromosomes into stowage plans with Space3D models
+
+    Items are placed one by one in chromosome order, each at the position
+    Space3D.find_position picks in the first container that can take it:
+    containers of the item's preferred zone first, the item's preferred
+    rotation first. Items that are not optimized (waste) stay where they are.
+
+    Args:
+        items: Items the chromosomes order
+        fixed: Boxes that stay in place, as itemId -> (containerId, box)
+        containers: All containers, in a fixed order
+    """
+
+    def __init__(
+        self,
+        items: List[Item],
+        fixed: Dict[str, Tuple[str, Tuple[float, float, float, float, float, float]]],
+        containers: List[Container]
+    ):
+        self.items = items
+        self.fixed = fixed
+        self.containers = containers
+
+        # Containers to try per zone: that zone's containers first
+        self.container_orders: Dict[str, List[Container]] = {}
+        for item in items:
+            if item.preferredZone not in self.container_orders:
+                self.container_orders[item.preferredZone] = (
+                    [c for c in containers if c.zone == item.preferredZone] +
+                    [c for c in containers if c.zone != item.preferredZone]
+                )
+
+    def empty_spaces(self) -> Dict[str, Space3D]:
+        """Space models holding only the fixed boxes"""
+        spaces = {c.containerId: Space3D(c.width, c.depth, c.height) for c in self.containers}
+        for item_id, (container_id, box) in self.fixed.items():
+            spaces[container_id].place_item(*box, item_id=item_id)
+        return spaces
+
+    def decode(self, chromosome: Chromosome) -> Tuple[Fitness, List[ItemPlacement]]:
+        """Build the plan of a chromosome and rate it"""
+        order, rotation_genes = chromosome
+        spaces = self.empty_spaces()
+        placements = []
+
+        for index in order:
+            item = self.items[index]
+            rotations = item.get_all_rotations()
+            preferred = rotations[rotation_genes[index] % len(rotations)]
+            rotations = [preferred] + [rotation for rotation in rotations if rotation != preferred]
+
+            for container in self.container_orders[item.preferredZone]:
+                space = spaces[container.containerId]
+                for rotation in rotations:
+                    position = space.find_position(*rotation)
+                    if position is not None and space.place_item(*position, *rotation, item_id=item.itemId):
+                        placements.append(ItemPlacement(
+                            itemId=item.itemId,
+                            containerId=container.containerId,
+                            position=position,
+                            rotation=rotation
+                        ))
+                        break
+                else:
+                    continue
+                break
+
+        return self.fitness(placements, spaces), placements
+
+    def fitness(self, placements: List[ItemPlacement], spaces: Dict[str, Space3D]) -> Fitness:
+        """Rate a plan whose boxes are held by the given space models"""
+        items = {item.itemId: item for item in self.items}
+        zones = {c.containerId: c.zone for c in self.containers}
+        volume = 0.0
+        zone_matches = 0
+        complexity = 0
+        for placement in placements:
+            item = items[placement.itemId]
+            volume += item.get_volume()
+            if zones[placement.containerId] == item.preferredZone:
+                zone_matches += 1
+            # Boxes in front of it, as Space3D.calculate_retrieval_complexity
+            # counts them (the footprint index is faster for large footprints)
+            x, y, z, width, _, height = spaces[placement.containerId].placed_items[item.itemId]
+            complexity += len(spaces[placement.containerId].footprints.query(
+                x, z, width, height, y_max=y - EPSILON
+            ))
+        return volume, len(placements), zone_matches, -complexity
+
+
+# Decoder of a worker process, set up once per pool
+_worker_decoder: Optional[_Decoder] = None
+
+
+def _init_worker(decoder: _Decoder) -> None:
+    global _worker_decoder
+    _worker_decoder = decoder
+
+
+def _decode_in_worker(chromosome: Chromosome) -> Tuple[Fitness, List[ItemPlacement]]:
+    return _worker_decoder.decode(chromosome)
+
+
+class PackingOptimizer:
+    """Evolutionary re-optimization of a whole stowage plan, run as background jobs
+
+    A chromosome orders the items and picks a preferred rotation for each;
+    it is decoded by placing the items into empty Space3D models in that
+    order. Populations evolve by tournament selection, order crossover of
+    the sequences, uniform crossover of the rotations and swap/rotation
+    mutations, keeping the best chromosomes of every generation. The current
+    plan and the greedy order seed the first population, and a result is
+    only proposed if it places every item stowed now and beats the current
+    plan.
+
+    Finished jobs are kept for job_ttl seconds, and at most max_jobs of
+    them; older ones are forgotten when jobs are started or looked up.
+
+    Args:
+        population_size: Chromosomes per generation
+        generations: Generations per job (unless the time limit ends it first)
+        mutation_rate: Chance per gene to be mutated
+        elite: Best chromosomes copied unchanged into the next generation
+        workers: Decode chromosomes in this many worker processes (0 or 1
+            decodes in the job's thread)
+        job_ttl: Seconds a finished job stays available
+        max_jobs: Finished jobs kept at most
+    """
+
+    def __init__(
+        self,
+        population_size: int = 24,
+        generations: int = 50,
+        mutation_rate: float = 0.05,
+        elite: int = 2,
+        workers: int = 0,
+        job_ttl: float = 3600.0,
+        max_jobs: int = 100
+    ):
+        self.population_size = max(2, population_size)
+        self.generations = generations
+        self.mutation_rate = mutation_rate
+        self.elite = elite
+        self.workers = workers
+        self.job_ttl = job_ttl
+        self.max_jobs = max_jobs
+
+        self.jobs: Dict[str, dict] = {}
+        self.finished: Dict[str, float] = {}  # jobId -> time.monotonic() it finished, oldest first
+        self.lock = threading.Lock()
+
+    def _prune_jobs(self) -> None:
+        """Forget finished jobs past their TTL or beyond max_jobs (call with the lock held)"""
+        now = time.monotonic()
+        for job_id, finished_at in list(self.finished.items()):
+            if now - finished_at < self.job_ttl and len(self.finished) <= self.max_jobs:
+                break
+            del self.finished[job_id]
+            del self.jobs[job_id]
+
+    def start_job(
+        self,
+        items: Dict[str, Item],
+        containers: Dict[str, Container],
+        seed: int = 0,
+        time_limit: Optional[float] = None
+    ) -> str:
+        """Start optimizing a snapshot of the current stowage in the background
+
+        Args:
+            items: All items by itemId (copied; the originals are not changed)
+            containers: All containers by containerId (copied as well)
+            seed: Seed of the evolution
+            time_limit: Stop after this many seconds even if generations remain
+
+        Returns:
+            ID of the job, for get_job and cancel_job
+        """
+        job_id = uuid.uuid4().hex
+        items, containers = copy.deepcopy((items, containers))
+        job = {
+            "jobId": job_id,
+            "status": "running",
+            "generation": 0,
+            "generations": self.generations,
+            "bestFitness": None,
+            "currentFitness": None,
+            "result": None,
+            "error": None,
+            "cancel": threading.Event()
+        }
+        with self.lock:
+            self._prune_jobs()
+            self.jobs[job_id] = job
+
+        def progress(generation, best, current):
+            with self.lock:
+                job["generation"] = generation
+                job["bestFitness"] = best
+                job["currentFitness"] = current
+
+        def run():
+            try:
+                result = self.optimize(
+                    items, containers, seed=seed, time_limit=time_limit,
+                    progress=progress, cancel=job["cancel"]
+                )
+                with self.lock:
+                    job["result"] = result
+                    job["status"] = "cancelled" if job["cancel"].is_set() else "completed"
+                    self.finished[job_id] = time.monotonic()
+            except Exception as e:
+                with self.lock:
+                    job["error"] = str(e)
+                    job["status"] = "failed"
+                    self.finished[job_id] = time.monotonic()
+
+        threading.Thread(target=run, name=f"packing-optimizer-{job_id}", daemon=True).start()
+        return job_id
+
+    def get_job(self, job_id: str) -> Optional[dict]:
+        """Get the status of a job, with its result once it has finished"""
+        with self.lock:
+            self._prune_jobs()
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            return {key: value for key, value in job.items() if key != "cancel"}
+
+    def cancel_job(self, job_id: str) -> bool:
+        """Ask a job to stop after the current generation (its best plan is kept)"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job is None:
+            return False
+        job["cancel"].set()
+        return True
+
+    def optimize(
+        self,
+        items: Dict[str, Item],
+        containers: Dict[str, Container],
+        seed: int = 0,
+        time_limit: Optional[float] = None,
+        progress: Optional[Callable[[int, Fitness, Fitness], None]] = None,
+        cancel: Optional[threading.Event] = None
+    ) -> PlacementResponse:
+        """Evolve a better plan for the current stowage
+
+        Every non-waste item may move; waste items stay where they are.
+        Plans that leave out an item stowed now are never proposed, since
+        following them would unload it.
+
+        Returns:
+            The best plan found as placements of all optimized items, with the
+            rearrangement steps leading to it from the current stowage. If
+            nothing beats the current plan, the current placements are
+            returned without rearrangements.
+        """
+        started = time.monotonic()
+        rng = random.Random(seed)
+
+        container_list = list(containers.values())
+        movable = [
+            item for item in PlacementService()._sort_items(items)
+            if not item.isWaste
+        ]
+        fixed = {}
+        current = []
+        for item in items.values():
+            location = item.currentLocation
+            if not location or location.get("containerId") not in containers:
+                continue
+            position = tuple(location.get("position") or (0, 0, 0))
+            rotation = tuple(location.get("rotation") or (item.width, item.depth, item.height))
+            if item.isWaste:
+                fixed[item.itemId] = (location["containerId"], position + rotation)
+            else:
+                current.append(ItemPlacement(
+                    itemId=item.itemId,
+                    containerId=location["containerId"],
+                    position=position,
+                    rotation=rotation
+                ))
+
+        decoder = _Decoder(movable, fixed, container_list)
+        current_fitness = self._current_fitness(decoder, current)
+        stowed = {placement.itemId for placement in current}
+
+        def rank_key(result: Tuple[Fitness, List[ItemPlacement]]) -> Tuple[bool, Fitness]:
+            # Plans that re-place every stowed item rank above all others
+            return stowed <= {placement.itemId for placement in result[1]}, result[0]
+
+        # Seed with the current plan (placed items in front-to-back order)
+        # and the greedy order, the rest at random
+        current_by_id = {placement.itemId: placement for placement in current}
+        current_order = sorted(
+            range(len(movable)),
+            key=lambda index: (
+                movable[index].itemId not in current_by_id,
+                -current_by_id[movable[index].itemId].position[1] if movable[index].itemId in current_by_id else 0,
+                index
+            )
+        )
+        current_rotations = [
+            self._rotation_gene(item, current_by_id.get(item.itemId)) for item in movable
+        ]
+        population: List[Chromosome] = [
+            (current_order, current_rotations),
+            (list(range(len(movable))), [0] * len(movable))
+        ]
+        while len(population) < self.population_size:
+            order = list(range(len(movable)))
+            rng.shuffle(order)
+            population.append((order, [rng.randrange(6) for _ in movable]))
+
+        executor = None
+        if self.workers > 1:
+            executor = ProcessPoolExecutor(
+                max_workers=self.workers, initializer=_init_worker, initargs=(decoder,)
+            )
+
+        best: Optional[Tuple[Fitness, List[ItemPlacement]]] = None
+        try:
+            for generation in range(self.generations + 1):
+                if executor is not None:
+                    results = list(executor.map(_decode_in_worker, population))
+                else:
+                    results = [decoder.decode(chromosome) for chromosome in population]
+
+                ranked = sorted(range(len(population)), key=lambda i: rank_key(results[i]), reverse=True)
+                candidate = results[ranked[0]]
+                if rank_key(candidate)[0] and (best is None or candidate[0] > best[0]):
+                    best = candidate
+                if progress is not None:
+                    progress(generation, best[0] if best is not None else None, current_fitness)
+
+                if (generation == self.generations or
+                        (cancel is not None and cancel.is_set()) or
+                        (time_limit is not None and time.monotonic() - started >= time_limit)):
+                    break
+
+                population = self._next_generation(
+                    [population[i] for i in ranked],
+                    [results[i][0] for i in ranked],
+                    rng
+                )
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True)
+
+        if best is None or best[0] <= current_fitness:
+            return PlacementResponse(placements=current, rearrangements=[])
+
+        return PlacementResponse(
+            placements=best[1],
+            rearrangements=self._rearrangement_steps(items, containers, best[1])
+        )
+
+    def _current_fitness(self, decoder: _Decoder, current: List[ItemPlacement]) -> Fitness:
+        """Rate the plan items are stowed in now with the decoder's measure"""
+        spaces = decoder.empty_spaces()
+        for placement in current:
+            spaces[placement.containerId].place_item(
+                *placement.position, *placement.rotation, item_id=placement.itemId
+            )
+        return decoder.fitness(
+            [placement for placement in current
+             if placement.itemId in spaces[placement.containerId].placed_items],
+            spaces
+        )
+
+    @staticmethod
+    def _rotation_gene(item: Item, placement: Optional[ItemPlacement]) -> int:
+        """Index of an item's current rotation (0 if it is not stowed)"""
+        if placement is None:
+            return 0
+        for index, rotation in enumerate(item.get_all_rotations()):
+            if all(abs(a - b) <= EPSILON for a, b in zip(rotation, placement.rotation)):
+                return index
+        return 0
+
+    def _next_generation(
+        self,
+        ranked: List[Chromosome],
+        fitnesses: List[Fitness],
+        rng: random.Random
+    ) -> List[Chromosome]:
+        """Breed the next generation from a population sorted best first"""
+        def tournament():
+            first, second = rng.randrange(len(ranked)), rng.randrange(len(ranked))
+            return ranked[min(first, second)]  # Lower index = fitter
+
+        population = ranked[:self.elite]
+        while len(population) < self.population_size:
+            mother, father = tournament(), tournament()
+            order = self._order_crossover(mother[0], father[0], rng)
+            rotations = [
+                mother[1][i] if rng.random() < 0.5 else father[1][i]
+                for i in range(len(order))
+            ]
+
+            # Swap mutation of the sequence, re-roll mutation of rotations
+            for i in range(len(order)):
+                if rng.random() < self.mutation_rate:
+                    j = rng.randrange(len(order))
+                    order[i], order[j] = order[j], order[i]
+                if rng.random() < self.mutation_rate:
+                    rotations[i] = rng.randrange(6)
+            population.append((order, rotations))
+        return population
+
+    @staticmethod
+    def _order_crossover(mother: List[int], father: List[int], rng: random.Random) -> List[int]:
+        """OX crossover: a slice of the mother, the rest in the father's order"""
+        if len(mother) < 2:
+            return list(mother)
+        start, end = sorted(rng.sample(range(len(mother) + 1), 2))
+        kept = set(mother[start:end])
+        rest = [gene for gene in father if gene not in kept]
+        return rest[:start] + mother[start:end] + rest[start:]
+
+    def _rearrangement_steps(
+        self,
+        items: Dict[str, Item],
+        containers: Dict[str, Container],
+        target: List[ItemPlacement]
+    ) -> List[RearrangementStep]:
+        """Steps turning the current stowage into the target plan
+
+        Items that move are taken out first, together with everything in
+        front of them (blocking items that keep their place go back in
+        afterwards) and everything standing in front of a target position.
+        Then all of them are placed, back to front and bottom to top.
+
+        Raises:
+            ValueError: If the target leaves out a non-waste item stowed now
+        """
+        def same(a: Optional[ItemPlacement], b: Optional[ItemPlacement]) -> bool:
+            return (a is not None and b is not None and a.containerId == b.containerId and
+                    all(abs(p - q) <= EPSILON for p, q in zip(a.position + a.rotation, b.position + b.rotation)))
+
+        # Where every stowed item is now, and where it will be (waste stays put)
+        now_registry = OccupancyRegistry()
+        now_registry.load(items, containers)
+        now = {}
+        for item_id in items:
+            box = now_registry.get_item_box(item_id)
+            if box is not None:
+                now[item_id] = ItemPlacement(
+                    itemId=item_id,
+                    containerId=now_registry.item_containers[item_id],
+                    position=box[:3],
+                    rotation=box[3:]
+                )
+        then = {placement.itemId: placement for placement in target}
+        dropped = sorted(item_id for item_id in now if item_id not in then and not items[item_id].isWaste)
+        if dropped:
+            raise ValueError(f"Target plan leaves out stowed items: {', '.join(dropped)}")
+        then.update((item_id, placement) for item_id, placement in now.items() if items[item_id].isWaste)
+
+        then_spaces = {c.containerId: Space3D(c.width, c.depth, c.height) for c in containers.values()}
+        for placement in then.values():
+            then_spaces[placement.containerId].place_item(
+                *placement.position, *placement.rotation, item_id=placement.itemId
+            )
+
+        moving = {item_id for item_id in set(now) | set(then) if not same(now.get(item_id), then.get(item_id))}
+
+        def in_front(spaces: Dict[str, Space3D], placement: ItemPlacement) -> set:
+            space = spaces[placement.containerId]
+            x, y, z, width, _, height = space.placed_items[placement.itemId]
+            return space.depth_buffer.items_in_front(x, z, width, height, y - EPSILON)
+
+        # Everything in front of a moving item, before and after, comes out too
+        handled = set(moving)
+        pending = list(moving)
+        while pending:
+            item_id = pending.pop()
+            in_the_way = set()
+            if item_id in now:
+                in_the_way |= in_front(now_registry.spaces, now[item_id])
+            if item_id in then:
+                in_the_way |= in_front(then_spaces, then[item_id])
+            for other in in_the_way - handled:
+                handled.add(other)
+                pending.append(other)
+
+        # Front to back, so nothing is taken out from behind another item
+        steps = []
+        for item_id in sorted(
+            (item_id for item_id in handled if item_id in now),
+            key=lambda item_id: (now[item_id].containerId, now[item_id].position[1], item_id)
+        ):
+            steps.append(RearrangementStep(
+                step=len(steps) + 1,
+                action="remove",
+                itemId=item_id,
+                fromContainer=now[item_id].containerId,
+                position=now[item_id].position
+            ))
+
+        # Items that keep their place are in then as well, so they go back
+        for item_id in sorted(
+            (item_id for item_id in handled if item_id in then),
+            key=lambda item_id: (
+                then[item_id].containerId,
+                -then[item_id].position[1],
+                then[item_id].position[2],
+                then[item_id].position[0],
+                item_id
+            )
+        ):
+            steps.append(RearrangementStep(
+                step=len(steps) + 1,
+                action="place",
+                itemId=item_id,
+                fromContainer=now[item_id].containerId if item_id in now else None,
+                toContainer=then[item_id].containerId,
+                position=then[item_id].position
+            ))
+        return steps
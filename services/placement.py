@@ -1,35 +1,922 @@
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Iterator, Optional, Tuple, Union
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import copy
+import heapq
 import math
+import random
+import threading
+import time
 import numpy as np
 from datetime import datetime
 from utils.space3d import Space3D, FreeSpace
 
 from models.item import Item
 from models.container import Container
-from models.placement import ItemPlacement, RearrangementStep, PlacementResponse
+from models.placement import ItemPlacement, RearrangementStep, PlacementResponse, PlacementSummary
+from services.occupancy import OccupancyRegistry
+from utils.fit_kernel import evaluate_fit_candidates, FitCandidates, ShapeFitCache
+from utils.space3d import EPSILON
+from utils.parallel_fit import ContainerBest, ParallelFitEvaluator, container_bests
+
+
+def _solve_zone(
+    zone_items: List[Item],
+    stowed_items: Dict[str, Item],
+    zone_containers: Dict[str, Container],
+    block_packing: bool = False,
+    deadline: Optional[float] = None
+) -> List[ItemPlacement]:
+    """Place one zone's items into that zone's containers (runs in a worker)"""
+    service = PlacementService()
+    all_items = dict(stowed_items)
+    all_items.update((item.itemId, item) for item in zone_items)
+    service.occupancy.load(all_items, zone_containers)
+    
+    placements = []
+    service._place_items(zone_items, zone_containers, placements, set(), block_packing, deadline)
+    return placements
+
+
+def _solve_ordering(
+    ordered_items: List[Item],
+    stowed_items: Dict[str, Item],
+    containers: Dict[str, Container],
+    block_packing: bool = False,
+    deadline: Optional[float] = None
+) -> Tuple[Tuple[int, int, int], List[ItemPlacement]]:
+    """Place items greedily in the given order on a private copy of the containers
+    
+    Returns the quality of the plan (see PlacementService._plan_quality)
+    and the plan itself. Runs in a worker for multi-start placement.
+    """
+    service = PlacementService()
+    all_items = dict(stowed_items)
+    all_items.update((item.itemId, item) for item in ordered_items)
+    service.occupancy.load(all_items, containers)
+    
+    placements = []
+    service._place_items(ordered_items, containers, placements, set(), block_packing, deadline)
+    return service._plan_quality(placements, all_items, containers), placements
+
+
+# Location of an item during local search: (containerId, position, rotation)
+Location = Tuple[str, Tuple[float, float, float], Tuple[float, float, float]]
+
+
+class _LocalSearch:
+    """Hill climbing over a greedy placement plan
+    
+    Moves insert unplaced items (evicting a lower-priority plan item if
+    needed), relocate low-priority items, re-rotate items in place and swap
+    the positions of two items. A move is kept only if it places more
+    priority in total or, with the same, raises the summed placement score
+    (zone preference and priority minus the retrieval penalty); otherwise it
+    is undone. Only the items placed by this plan move, never stowed cargo.
+    
+    Args:
+        service: Placement service whose occupancy models hold the plan
+        sorted_items: All items in placement order
+        containers: All containers by containerId
+        placed_items: IDs of the items placed by the plan (updated in place)
+        seed: Seed of the move selection
+    """
+    
+    def __init__(
+        self,
+        service: "PlacementService",
+        sorted_items: List[Item],
+        containers: Dict[str, Container],
+        placed_items: set,
+        seed: int = 0
+    ):
+        self.service = service
+        self.items = {item.itemId: item for item in sorted_items}
+        self.order = [item.itemId for item in sorted_items]
+        self.containers = containers
+        self.placed_items = placed_items
+        self.rng = random.Random(seed)
+        
+        self.container_list = list(containers.values())
+        self.container_dims = np.array(
+            [(c.width, c.depth, c.height) for c in self.container_list], dtype=float
+        ).reshape(-1, 3)
+        self.container_spaces = {
+            container_id: service.occupancy.get_space(container)
+            for container_id, container in containers.items()
+        }
+        self.fit_cache = ShapeFitCache()
+        
+        # State of the current move: where the items it touches were, and
+        # their placement scores and blocking pairs at that point
+        self.journal: Dict[str, Optional[Location]] = {}
+        self.base_before = 0.0
+        self.pairs_before: set = set()
+    
+    def run(self, deadline: float, stall_limit: int = 32) -> int:
+        """Apply improving moves until the plan stops improving
+        
+        Moves are tried in passes over the plan's neighbourhood, in random
+        order: every unplaced item is inserted, every lower-priority plan
+        item relocated, and every plan item re-rotated and swapped with a
+        random partner. The search stops after a pass that kept no move,
+        after stall_limit moves in a row were undone, or at the deadline (a
+        time.monotonic() value), whichever comes first.
+        Returns the number of moves kept.
+        """
+        kept = 0
+        stalled = 0
+        while True:
+            kept_in_pass = 0
+            for move, item_id in self._neighbourhood():
+                if time.monotonic() >= deadline or stalled >= stall_limit:
+                    return kept
+                if self._try(move, item_id):
+                    kept += 1
+                    kept_in_pass += 1
+                    stalled = 0
+                else:
+                    stalled += 1
+            if not kept_in_pass:
+                return kept
+    
+    def _neighbourhood(self) -> List[Tuple[Any, str]]:
+        """Moves of one pass as (move, item ID) pairs, shuffled"""
+        plan = self._plan()
+        low_priority = sorted(plan, key=lambda item_id: self.items[item_id].priority)[:max(1, len(plan) // 2)]
+        moves = (
+            [(self._insert, item_id) for item_id in self._unplaced()] +
+            [(self._relocate, item_id) for item_id in low_priority] +
+            [(self._rerotate, item_id) for item_id in plan] +
+            [(self._swap, item_id) for item_id in plan]
+        )
+        self.rng.shuffle(moves)
+        return moves
+    
+    def _base_score(self, item_id: str) -> float:
+        """Zone and priority score of an item where it is now (0 if unplaced)"""
+        location = self._location(item_id)
+        if location is None:
+            return 0.0
+        item = self.items[item_id]
+        zone_score = 1000 if self.containers[location[0]].zone == item.preferredZone else 0
+        return zone_score + 500 * (item.priority / 100)
+    
+    def _blocking_pairs(self, item_id: str) -> set:
+        """(front, back) pairs involving an item where it is now
+        
+        Every pair costs its back item, if it belongs to the plan, the same
+        retrieval penalty the greedy pass charges per blocking item.
+        """
+        location = self._location(item_id)
+        if location is None:
+            return set()
+        space = self.container_spaces[location[0]]
+        x, y, z, width, _, height = space.placed_items[item_id]
+        
+        pairs = {(other, item_id) for _, other in space.footprints.query(x, z, width, height, y_max=y - EPSILON)}
+        pairs.update(
+            (item_id, other)
+            for _, other in space.footprints.query(x, z, width, height, y_min=y + EPSILON)
+            if other in self.placed_items
+        )
+        return pairs
+    
+    def _location(self, item_id: str) -> Optional[Location]:
+        if item_id not in self.placed_items:
+            return None
+        location = self.items[item_id].currentLocation
+        return location["containerId"], tuple(location["position"]), tuple(location["rotation"])
+    
+    def _plan(self) -> List[str]:
+        """Plan items in placement order"""
+        return [item_id for item_id in self.order if item_id in self.placed_items]
+    
+    def _unplaced(self) -> List[str]:
+        """Items that are neither in the plan nor stowed, in placement order"""
+        return [
+            item_id for item_id in self.order
+            if not self.items[item_id].currentLocation or
+               "containerId" not in self.items[item_id].currentLocation
+        ]
+    
+    def _touch(self, *item_ids: str) -> None:
+        """Record items before the current move changes anything around them"""
+        for item_id in item_ids:
+            if item_id in self.journal:
+                continue
+            self.journal[item_id] = self._location(item_id)
+            self.base_before += self._base_score(item_id)
+            self.pairs_before |= self._blocking_pairs(item_id)
+    
+    def _take(self, item_id: str) -> None:
+        """Take a plan item out"""
+        location = self._location(item_id)
+        if location is not None:
+            self.service._undo_placement(self.items[item_id], self.containers[location[0]], self.placed_items)
+    
+    def _put(self, item_id: str, container_id: str, position, rotation) -> bool:
+        """Place an item at a given position"""
+        return self.service._commit_placement(
+            self.items[item_id], self.containers[container_id],
+            tuple(position), tuple(rotation), [], self.placed_items
+        )
+    
+    def _put_best(self, item_id: str) -> bool:
+        """Place an item at its best position over all containers"""
+        best = self.service._find_best_candidate(
+            self.items[item_id], self.container_list, self.container_spaces,
+            self.container_dims, fit_cache=self.fit_cache
+        )
+        if best is None:
+            return False
+        container, position, rotation = best
+        return self._put(item_id, container.containerId, position, rotation)
+    
+    def _try(self, move, item_id: str) -> bool:
+        """Apply a move to an item and keep it if it improves the plan"""
+        self.journal = {}
+        self.base_before = 0.0
+        self.pairs_before = set()
+        if not move(item_id):
+            self._revert()
+            return False
+        
+        # Only the scores of the moved items and the pairs involving them change
+        priority_gain = sum(
+            self.items[item_id].priority * ((item_id in self.placed_items) - (before is not None))
+            for item_id, before in self.journal.items()
+        )
+        base_after = sum(self._base_score(item_id) for item_id in self.journal)
+        pairs_after = set()
+        for item_id in self.journal:
+            pairs_after |= self._blocking_pairs(item_id)
+        score_gain = (
+            base_after - self.base_before -
+            50 * (len(pairs_after) - len(self.pairs_before))
+        )
+        
+        if priority_gain > 0 or (priority_gain == 0 and score_gain > EPSILON):
+            return True
+        self._revert()
+        return False
+    
+    def _revert(self) -> None:
+        """Put the items touched by the current move back where they were"""
+        for item_id in self.journal:
+            location = self._location(item_id)
+            if location is not None:
+                self.service._undo_placement(self.items[item_id], self.containers[location[0]], self.placed_items)
+        for item_id, location in self.journal.items():
+            if location is not None:
+                self.service._commit_placement(
+                    self.items[item_id], self.containers[location[0]],
+                    location[1], location[2], [], self.placed_items
+                )
+        self.journal = {}
+    
+    def _insert(self, item_id: str) -> bool:
+        """Place an unplaced item, evicting a lower-priority plan item for it if needed"""
+        item = self.items[item_id]
+        if item.currentLocation and "containerId" in item.currentLocation:
+            return False
+        self._touch(item.itemId)
+        if self._put_best(item.itemId):
+            return True
+        
+        # Free room by taking out a cheaper item at least as large
+        victims = [
+            item_id for item_id in self._plan()
+            if self.items[item_id].priority < item.priority and
+               self.items[item_id].get_volume() >= item.get_volume() - EPSILON
+        ]
+        if not victims:
+            return False
+        victim = self.rng.choice(victims)
+        self._touch(victim)
+        self._take(victim)
+        if not self._put_best(item.itemId):
+            return False
+        
+        # The evicted item goes elsewhere if it still fits anywhere
+        self._put_best(victim)
+        return True
+    
+    def _relocate(self, item_id: str) -> bool:
+        """Move a plan item to its best position given the rest"""
+        if item_id not in self.placed_items:
+            return False
+        self._touch(item_id)
+        self._take(item_id)
+        return self._put_best(item_id)
+    
+    def _rerotate(self, item_id: str) -> bool:
+        """Turn a plan item in place"""
+        if item_id not in self.placed_items:
+            return False
+        container_id, position, rotation = self._location(item_id)
+        rotations = [other for other in self.items[item_id].get_all_rotations() if tuple(other) != rotation]
+        self.rng.shuffle(rotations)
+        
+        self._touch(item_id)
+        self._take(item_id)
+        return any(self._put(item_id, container_id, position, other) for other in rotations)
+    
+    def _swap(self, first: str) -> bool:
+        """Exchange the positions of a plan item and a random other plan item of a different shape"""
+        if first not in self.placed_items:
+            return False
+        plan = self._plan()
+        if len(plan) < 2:
+            return False
+        second = self.rng.choice(plan)
+        first_item, second_item = self.items[first], self.items[second]
+        if (first_item.width, first_item.depth, first_item.height) == \
+                (second_item.width, second_item.depth, second_item.height):
+            return False
+        
+        first_location = self._location(first)
+        second_location = self._location(second)
+        self._touch(first, second)
+        self._take(first)
+        self._take(second)
+        
+        # Each item goes to the other's position, in any orientation that fits
+        return (
+            any(self._put(first, second_location[0], second_location[1], rotation)
+                for rotation in first_item.get_all_rotations()) and
+            any(self._put(second, first_location[0], first_location[1], rotation)
+                for rotation in second_item.get_all_rotations())
+        )
+
+
+class _RearrangementSearch:
+    """Best-first search for the fewest moves that make room for unplaced items
+    
+    For a target item, a state is a position in a container of its preferred
+    zone together with the lower-priority items overlapping it there, which
+    are evicted. Taking an item out means taking out everything in front of
+    it first, so a state costs all the items handled: the evicted ones, the
+    ones in front of them and the ones in front of the target's position
+    (those go back in afterwards). States over max_moves are dropped and the
+    rest are checked cheapest first. The first one whose evicted items all
+    have a free position, reachable from the open face, in another container
+    is the plan.
+    
+    Plans are checked and applied on copies of the container models, so each
+    target is planned against the state the previous plans leave behind and
+    the live models are left untouched. While planning, the destinations of
+    planned moves are booked in the registry, so concurrent plans don't count
+    on that space; the plan is only a recommendation, so the bookings are
+    released once planning ends.
+    
+    Args:
+        items: All items by itemId
+        containers: All containers by containerId
+        spaces: Container space models by containerId
+        occupancy: Registry whose eviction index lists the candidates
+    """
+    
+    max_moves = 6  # Most items handled to make room for one target
+    max_expansions = 40  # Most eviction sets checked per target
+    anchor_limit = 64  # Cheapest eviction candidates per container used as positions
+    max_searches = 8  # Most targets searched per plan
+    
+    def __init__(
+        self,
+        items: Dict[str, Item],
+        containers: Dict[str, Container],
+        spaces: Dict[str, Space3D],
+        occupancy: OccupancyRegistry
+    ):
+        self.items = items
+        self.containers = containers
+        self.spaces = spaces
+        self.occupancy = occupancy
+        self.copies: Dict[str, Space3D] = {}
+        self.candidates: Dict[str, List[str]] = {}  # zone -> itemIds, cheapest first
+        self.reservations: List[str] = []  # Bookings of the planned moves
+    
+    def plan(self, targets: List[Item], deadline: Optional[float] = None) -> List[RearrangementStep]:
+        """Plan room for the targets in turn, highest priority first
+        
+        Each zone's eviction candidates are read from the registry once, for
+        all its targets. A target is skipped without a search when its zone
+        has nothing to evict, or when one of at least its priority and no
+        larger along any axis found no plan since the last plan was applied.
+        Past the deadline (a time.monotonic() value) no more plans are
+        searched, and the steps planned so far are returned.
+        """
+        try:
+            return self._plan(targets, deadline)
+        finally:
+            for reservation_id in self.reservations:
+                self.occupancy.release(reservation_id)
+            self.reservations = []
+    
+    def _plan(self, targets: List[Item], deadline: Optional[float]) -> List[RearrangementStep]:
+        """Plan the targets, keeping the bookings of the planned moves in self.reservations"""
+        steps = []
+        failed = []  # (zone, priority, sorted dimensions)
+        searches = 0
+        for target in sorted(targets, key=lambda target: -target.priority):
+            if searches >= self.max_searches:
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            zone = target.preferredZone
+            dims = sorted((target.width, target.depth, target.height))
+            if any(failed_zone == zone and failed_priority >= target.priority and
+                   all(a <= b + EPSILON for a, b in zip(failed_dims, dims))
+                   for failed_zone, failed_priority, failed_dims in failed):
+                continue
+            
+            if zone not in self.candidates:
+                # The first target of a zone has the highest priority, so its
+                # candidates include those of all the others
+                self.candidates[zone] = list(self.occupancy.eviction_candidates(zone, target.priority))
+            if not self.candidates[zone]:
+                continue
+            
+            searches += 1
+            found = self._search(target, deadline)
+            if found is None:
+                failed.append((zone, target.priority, dims))
+                continue
+            steps.extend(self._apply(target, found, len(steps) + 1))
+            failed = []
+        return steps
+    
+    def _view(self, container_id: str) -> Space3D:
+        """Space model of a container as the plan so far leaves it"""
+        return self.copies.get(container_id, self.spaces[container_id])
+    
+    def _edit(self, container_id: str) -> Space3D:
+        """Copy of a container's space model that the search may change"""
+        if container_id not in self.copies:
+            self.copies[container_id] = self.spaces[container_id].copy()
+        return self.copies[container_id]
+    
+    @staticmethod
+    def _in_front(space: Space3D, box) -> set:
+        """Items starting closer to the open face than a box and overlapping it in x-z"""
+        x, y, z, width, _, height = box
+        return {item_id for _, item_id in space.footprints.query(x, z, width, height, y_max=y - EPSILON)}
+    
+    def _closure(self, space: Space3D, item_ids) -> set:
+        """Items that come out to reach the given ones, including themselves"""
+        handled = set(item_ids)
+        pending = list(handled)
+        while pending:
+            item_id = pending.pop()
+            for other in self._in_front(space, space.placed_items[item_id]) - handled:
+                handled.add(other)
+                pending.append(other)
+        return handled
+    
+    @staticmethod
+    def _overlapping(space: Space3D, box, max_depth: float) -> set:
+        """Items whose boxes overlap a box, given the depth of the deepest item"""
+        x, y, z, width, depth, height = box
+        return {
+            item_id for start, item_id in space.footprints.query(
+                x, z, width, height, y_min=y - max_depth, y_max=y + depth - EPSILON
+            )
+            if start + space.placed_items[item_id][4] > y + EPSILON
+        }
+    
+    def _search(self, target: Item, deadline: Optional[float] = None):
+        """Cheapest plan for one target, or None
+        
+        Candidate positions for the target are the origins of the free spaces
+        and of the cheapest evictable items, in every rotation, pushed back
+        inside the container where needed. The items overlapping the target there are
+        the eviction set.
+        """
+        def evictable(item_id):
+            return item_id in self.items and self.items[item_id].priority < target.priority
+        
+        movable = [item_id for item_id in self.candidates[target.preferredZone] if evictable(item_id)]
+        if not movable:
+            return None
+        heap = []  # (items handled, items evicted, priority evicted, depth, tie-break, plan state)
+        seen = set()
+        for container_id, container in self.containers.items():
+            if container.zone != target.preferredZone:
+                continue
+            space = self._view(container_id)
+            max_depth = max((box[4] for box in space.placed_items.values()), default=0.0)
+            anchors = {(free.x, free.y, free.z) for free in space.free_spaces}
+            anchors.update(
+                space.placed_items[item_id][:3]
+                for item_id in [item_id for item_id in movable if item_id in space.placed_items][:self.anchor_limit]
+            )
+            
+            for rotation in set(target.get_all_rotations()):
+                width, depth, height = rotation
+                if width > space.width or depth > space.depth or height > space.height:
+                    continue
+                for x, y, z in anchors:
+                    position = (min(x, space.width - width), min(y, space.depth - depth), min(z, space.height - height))
+                    if (container_id, position, rotation) in seen:
+                        continue
+                    seen.add((container_id, position, rotation))
+                    
+                    box = position + rotation
+                    evicted = self._overlapping(space, box, max_depth)
+                    if not all(evictable(item_id) for item_id in evicted):
+                        continue
+                    handled = self._closure(space, evicted | self._in_front(space, box))
+                    if len(handled) > self.max_moves:
+                        continue
+                    heapq.heappush(heap, (
+                        len(handled), len(evicted), sum(self.items[item_id].priority for item_id in evicted),
+                        position[1], len(seen),
+                        (container_id, frozenset(evicted), handled, position, rotation)
+                    ))
+        
+        # Cheapest first; the first set whose evicted items can all go elsewhere wins
+        stuck = set()
+        for _ in range(self.max_expansions):
+            if not heap:
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            state = heapq.heappop(heap)[-1]
+            if state[:2] in stuck:
+                continue
+            found = self._check(target, *state)
+            if found is not None:
+                return found
+            stuck.add(state[:2])
+        return None
+    
+    def _check(self, target: Item, container_id: str, evicted: frozenset, handled: set, position, rotation):
+        """Check a plan against the space models
+        
+        Returns the plan as (container ID, evicted items, handled items,
+        position, rotation, destinations of the evicted items), or None if
+        the target does not fit or an evicted item cannot be relocated.
+        """
+        space = self._edit(container_id)
+        boxes = {item_id: space.placed_items[item_id] for item_id in evicted}
+        order = sorted(evicted, key=lambda item_id: (boxes[item_id][1], item_id))
+        for item_id in order:
+            space.remove_item(item_id)
+        
+        destinations = {}
+        try:
+            if not space.can_place(*position, *rotation):
+                return None
+            
+            # Relocate front to back, each against the ones already relocated
+            for item_id in order:
+                found = self._relocate(self.items[item_id], container_id, target.preferredZone)
+                if found is None:
+                    return None
+                self._edit(found[0]).place_item(*found[1], *found[2], item_id=item_id)
+                destinations[item_id] = found
+            return (container_id, evicted, handled, position, rotation, dict(destinations))
+        finally:
+            for item_id, (destination_id, _, _) in destinations.items():
+                self.copies[destination_id].remove_item(item_id)
+            for item_id in order:
+                space.place_item(*boxes[item_id], item_id=item_id)
+    
+    def _relocate(self, item: Item, from_container_id: str, target_zone: str):
+        """Free position with nothing in front of it for an evicted item
+        
+        Zones are tried with the item's preferred zone first and the zone
+        being cleared last; within a zone, the containers with room come
+        from the registry's capacity index, the tightest first. Returns
+        (container ID, position, rotation) or None.
+        """
+        zones = sorted(
+            dict.fromkeys(container.zone for container in self.containers.values()),
+            key=lambda zone: (zone == target_zone, zone != item.preferredZone)
+        )
+        container_ids = [
+            container_id
+            for zone in zones
+            for container_id in self.occupancy.fitting_containers(
+                item.get_all_rotations(), zone=zone, exclude=[from_container_id]
+            )
+            if container_id in self.containers
+        ]
+        for container_id in container_ids:
+            space = self._view(container_id)
+            best = None
+            for rotation in item.get_all_rotations():
+                for free in space.free_spaces:
+                    if not free.can_fit(*rotation):
+                        continue
+                    key = (free.y, free.z, free.x)
+                    if best is not None and key >= best[0]:
+                        continue
+                    position = (free.x, free.y, free.z)
+                    if not self._in_front(space, position + rotation):
+                        best = (key, position, rotation)
+            if best is not None:
+                return container_id, best[1], best[2]
+        return None
+    
+    def _apply(self, target: Item, found, first_step: int) -> List[RearrangementStep]:
+        """Carry out a plan on the copies and list its steps"""
+        container_id, evicted, handled, position, rotation, destinations = found
+        space = self._edit(container_id)
+        boxes = {item_id: space.placed_items[item_id] for item_id in handled}
+        steps = []
+        
+        # Front to back, so nothing is taken out from behind another item
+        for item_id in sorted(handled, key=lambda item_id: (boxes[item_id][1], item_id)):
+            space.remove_item(item_id)
+            if item_id in evicted:
+                destination_id, destination, destination_rotation = destinations[item_id]
+                self._edit(destination_id).place_item(*destination, *destination_rotation, item_id=item_id)
+                self.reservations.append(self.occupancy.reserve(
+                    destination_id, boxes[item_id][3] * boxes[item_id][4] * boxes[item_id][5]
+                ))
+                steps.append(RearrangementStep(
+                    step=first_step + len(steps),
+                    action="move",
+                    itemId=item_id,
+                    fromContainer=container_id,
+                    toContainer=destination_id,
+                    position=destination
+                ))
+            else:
+                steps.append(RearrangementStep(
+                    step=first_step + len(steps),
+                    action="remove",
+                    itemId=item_id,
+                    fromContainer=container_id,
+                    position=boxes[item_id][:3]
+                ))
+        
+        space.place_item(*position, *rotation, item_id=target.itemId)
+        steps.append(RearrangementStep(
+            step=first_step + len(steps),
+            action="place",
+            itemId=target.itemId,
+            toContainer=container_id,
+            position=position
+        ))
+        
+        # The others go back where they were, back to front and bottom to top
+        for item_id in sorted(
+            handled - evicted,
+            key=lambda item_id: (-boxes[item_id][1], boxes[item_id][2], boxes[item_id][0], item_id)
+        ):
+            space.place_item(*boxes[item_id], item_id=item_id)
+            steps.append(RearrangementStep(
+                step=first_step + len(steps),
+                action="place",
+                itemId=item_id,
+                fromContainer=container_id,
+                toContainer=container_id,
+                position=boxes[item_id][:3]
+            ))
+        return steps
+
 
 class PlacementService:
     """Service for optimal placement of items in containers using advanced bin packing algorithms"""
     
+    def __init__(
+        self,
+        occupancy: Optional[OccupancyRegistry] = None,
+        workers: int = 0,
+        batch_size: int = 8
+    ):
+        """Initialize the placement service
+        
+        Args:
+            occupancy: Shared occupancy registry (a private one is created if omitted)
+            workers: Evaluate containers in this many worker processes (opt-in;
+                0 or 1 keeps everything in the calling thread). The pool is
+                started on first use and kept until close()
+            batch_size: Items scored per round trip to the worker processes
+        """
+        self.occupancy = occupancy if occupancy is not None else OccupancyRegistry()
+        self.workers = workers
+        self.batch_size = max(1, batch_size)
+        self.evaluator: Optional[ParallelFitEvaluator] = None
+        self._evaluator_lock = threading.Lock()
+    
+    def close(self) -> None:
+        """Stop the container scoring processes, if they were started"""
+        with self._evaluator_lock:
+            if self.evaluator is not None:
+                self.evaluator.close()
+                self.evaluator = None
+    
+    def _get_evaluator(self) -> Optional[ParallelFitEvaluator]:
+        """Get the service's container scoring pool, starting it on first use (None without workers)"""
+        if self.workers <= 1:
+            return None
+        with self._evaluator_lock:
+            if self.evaluator is None:
+                self.evaluator = ParallelFitEvaluator(self.workers)
+            return self.evaluator
+    
     def calculate_placement(
         self,
         items: Dict[str, Item],
-        containers: Dict[str, Container]
+        containers: Dict[str, Container],
+        by_zone: bool = False,
+        block_packing: bool = False,
+        strategy: str = "best_fit",
+        deadline_ms: Optional[float] = None,
+        restarts: int = 0,
+        seed: int = 0
     ) -> PlacementResponse:
         """Calculate optimal placement for items in containers
         
         Uses a weighted scoring system for prioritization and a modified
         Best-Fit-Decreasing algorithm with rotation strategies.
+        
+        Args:
+            items: All items by itemId; items without a location are placed
+            containers: All containers by containerId
+            by_zone: Solve each zone independently (in parallel with workers)
+                for the items preferring it, then place the leftovers in one
+                cross-zone spillover pass
+            block_packing: Once a position is found for an item, stack the
+                identical items that follow it in the same free space
+            strategy: "best_fit" searches the free spaces for every item;
+                "wall" first loads each container in depth-wise walls of
+                horizontal strips of identical boxes (for bulk cargo) and
+                then places whatever is left with best fit. Walls are only
+                built when that places at least as many items as best fit
+            deadline_ms: Time budget in milliseconds from the call. Every phase
+                stops when it runs out: items the greedy pass has not reached
+                stay unplaced, local search improves the plan with the budget
+                left until it stops finding better moves, and rearrangement
+                planning returns the steps planned so far. The best plan
+                found is returned
+            restarts: Run the greedy pass this many times, the first in the
+                usual order and the others in randomly perturbed orders, and
+                keep the best plan. The orders run in worker processes when
+                the service has workers; without them the extra orders only
+                run while they fit in deadline_ms
+            seed: Seed of the perturbed orders
         """
-        # Create container 3D space models to track used/free space
+        started = time.monotonic()
+        deadline = started + deadline_ms / 1000 if deadline_ms is not None else None
+        
+        # Get the long-lived container 3D space models (already-stowed items
+        # are loaded on first use and kept up to date afterwards)
+        self.occupancy.load(items, containers)
         container_spaces = {}
         for container_id, container in containers.items():
-            container_spaces[container_id] = Space3D(
-                container.width, 
-                container.depth, 
-                container.height
+            container_spaces[container_id] = self.occupancy.get_space(container)
+        
+        sorted_items = self._sort_items(items)
+        
+        # Track placements and rearrangements
+        placements = []
+        rearrangements = []
+        placed_items = set()
+        
+        # Without zone or multi-start passes the wall strategy commits a
+        # complete plan, and the global pass has nothing left to do
+        complete = False
+        if strategy == "wall":
+            complete = self._place_walls(
+                sorted_items, containers, placements, placed_items, block_packing, deadline,
+                complete_plan=not by_zone and restarts <= 1
             )
-            
+        
+        if by_zone:
+            self._place_by_zone(
+                sorted_items, items, containers, placements, placed_items, block_packing, deadline
+            )
+        
+        # Global pass over all containers (the spillover pass in zone mode,
+        # where the items placed in their zone are skipped)
+        if restarts > 1:
+            self._place_multi_start(
+                sorted_items, items, containers, placements, placed_items,
+                restarts, seed, block_packing, deadline
+            )
+        elif not complete:
+            self._place_items(sorted_items, containers, placements, placed_items, block_packing, deadline)
+        
+        if by_zone or strategy == "wall" or restarts > 1:
+            # Report placements in priority order, as the global pass does
+            rank = {item.itemId: index for index, item in enumerate(sorted_items)}
+            placements.sort(key=lambda placement: rank[placement.itemId])
+        
+        # Improve the greedy plan with the remaining time budget
+        if deadline is not None:
+            if placed_items and time.monotonic() < deadline:
+                search = _LocalSearch(self, sorted_items, containers, placed_items)
+                if search.run(deadline):
+                    placements[:] = [
+                        ItemPlacement(
+                            itemId=item.itemId,
+                            containerId=item.currentLocation["containerId"],
+                            position=tuple(item.currentLocation["position"]),
+                            rotation=tuple(item.currentLocation["rotation"])
+                        )
+                        for item in sorted_items if item.itemId in placed_items
+                    ]
+        
+        # Handle unplaced items with rearrangement recommendations
+        unplaced_items = [item for item in sorted_items 
+                         if item.itemId not in placed_items and
+                            (item.currentLocation is None or 
+                             "containerId" not in item.currentLocation)]
+        
+        if unplaced_items:
+            # Generate rearrangement plan for high-priority unplaced items
+            rearrangements = self._generate_rearrangement_plan(
+                unplaced_items,
+                items,
+                containers,
+                container_spaces,
+                deadline
+            )
+        
+        # Return the placement plan
+        return PlacementResponse(
+            placements=placements,
+            rearrangements=rearrangements
+        )
+    
+    def stream_placement(
+        self,
+        items: Dict[str, Item],
+        containers: Dict[str, Container],
+        block_packing: bool = False
+    ) -> Iterator[Union[ItemPlacement, PlacementSummary]]:
+        """Run the greedy placement, yielding each placement as soon as it is committed
+        
+        Gives the same placements as calculate_placement with its default
+        options, without collecting them. The last record is a summary with
+        the items that did not fit and the rearrangements proposed for them.
+        
+        Args:
+            items: All items by itemId; items without a location are placed
+            containers: All containers by containerId
+            block_packing: Stack runs of identical items, as in calculate_placement
+        """
+        self.occupancy.load(items, containers)
+        container_spaces = {
+            container_id: self.occupancy.get_space(container)
+            for container_id, container in containers.items()
+        }
+        
+        sorted_items = self._sort_items(items)
+        placed_items = set()
+        yield from self._iter_place_items(sorted_items, containers, placed_items, block_packing)
+        
+        unplaced_items = [item for item in sorted_items
+                          if item.itemId not in placed_items and
+                             (item.currentLocation is None or
+                              "containerId" not in item.currentLocation)]
+        rearrangements = []
+        if unplaced_items:
+            rearrangements = self._generate_rearrangement_plan(
+                unplaced_items, items, containers, container_spaces
+            )
+        
+        yield PlacementSummary(
+            placedCount=len(placed_items),
+            unplacedItems=[item.itemId for item in unplaced_items],
+            rearrangements=rearrangements
+        )
+    
+    def place_new_items(
+        self,
+        new_items: Dict[str, Item],
+        containers: Dict[str, Container],
+        stowed_items: Optional[Dict[str, Item]] = None,
+        block_packing: bool = False
+    ) -> PlacementResponse:
+        """Place only new or unplaced items against the cargo already stowed
+        
+        The stowed cargo is taken from the occupancy registry, which every
+        service sharing it keeps up to date, so only the new items are
+        sorted and searched: the cost follows the delta, not the inventory.
+        No rearrangements are proposed for items that do not fit.
+        
+        Args:
+            new_items: The items to place, by itemId (located ones are skipped)
+            containers: All containers by containerId
+            stowed_items: The stowed cargo, only read if the registry has not
+                been loaded yet
+            block_packing: Stack runs of identical items, as in calculate_placement
+        """
+        if not self.occupancy.loaded:
+            self.occupancy.load(stowed_items or {}, containers)
+        
+        placements = []
+        self._place_items(self._sort_items(new_items), containers, placements, set(), block_packing)
+        return PlacementResponse(placements=placements, rearrangements=[])
+    
+    def _sort_items(self, items: Dict[str, Item]) -> List[Item]:
+        """Sort items by weighted importance score (highest first)"""
         # Sort items by weighted importance score based on:
         # 1. Priority (highest first)
         # 2. Days until expiry (soonest expiry items first)
@@ -57,262 +944,755 @@ class PlacementService:
             return score
         
         # Sort items by weighted score (highest first)
-        sorted_items = sorted(
+        return sorted(
             items.values(),
             key=lambda x: (
                 -get_weighted_score(x),  # Negative to sort highest first
                 -x.get_volume()  # Negative to sort largest first as tiebreaker
             )
         )
+    
+    def _place_items(
+        self,
+        sorted_items: List[Item],
+        containers: Dict[str, Container],
+        placements: List[ItemPlacement],
+        placed_items: set,
+        block_packing: bool = False,
+        deadline: Optional[float] = None
+    ) -> None:
+        """Greedily place the unlocated items, in the given order, into the given containers"""
+        placements.extend(self._iter_place_items(sorted_items, containers, placed_items, block_packing, deadline))
+    
+    def _iter_place_items(
+        self,
+        sorted_items: List[Item],
+        containers: Dict[str, Container],
+        placed_items: set,
+        block_packing: bool = False,
+        deadline: Optional[float] = None
+    ) -> Iterator[ItemPlacement]:
+        """Greedily place the unlocated items, yielding each placement once it is committed
         
-        # Track placements and rearrangements
-        placements = []
-        rearrangements = []
-        placed_items = set()
+        Past the deadline (a time.monotonic() value) the remaining items are
+        left unplaced.
+        """
+        # Container dimensions, in a fixed order, for the fit kernel
+        container_list = list(containers.values())
+        container_dims = np.array(
+            [(c.width, c.depth, c.height) for c in container_list], dtype=float
+        ).reshape(-1, 3)
+        container_spaces = {
+            container_id: self.occupancy.get_space(container)
+            for container_id, container in containers.items()
+        }
+        
+        # Optional process pool for scoring containers. Items are scored a
+        # batch at a time there; placements are still committed here, one
+        # item at a time in priority order
+        evaluator = self._get_evaluator() if len(container_list) > 1 else None
+        prefetched: Dict[str, Tuple[List[Tuple[int, int]], Dict[int, ContainerBest]]] = {}
+        
+        # Fit candidates of each item shape, reused until a container changes
+        fit_cache = ShapeFitCache()
+        
+        # Placements committed for the current item (several with block packing)
+        committed = []
+        
+        # Sync the shared registry with every persisted location before
+        # placing anything, so no item goes where a stowed one already is
+        self.occupancy.sync_items(sorted_items, containers)
         
         # Iterate through items in priority order
-        for item in sorted_items:
+        for index, item in enumerate(sorted_items):
             # Skip items that already have a location
             if item.currentLocation is not None and "containerId" in item.currentLocation:
                 continue
+            
+            # Out of time: the items not reached yet stay unplaced
+            if deadline is not None and time.monotonic() >= deadline:
+                break
                 
-            # Find best container and placement
-            best_container = None
-            best_position = None
-            best_rotation = None
-            best_score = float('-inf')
-            best_space_model = None
+            if evaluator is not None and item.itemId not in prefetched:
+                prefetched = self._prefetch_fits(
+                    sorted_items[index:], container_list, container_spaces, container_dims, evaluator
+                )
             
-            # Get all possible rotations for this item
-            rotations = item.get_all_rotations()
+            # Find best container, rotation and position in one vectorized pass
+            best = self._find_best_candidate(
+                item, container_list, container_spaces, container_dims,
+                fit_cache=fit_cache, prefetched=prefetched.get(item.itemId)
+            )
             
-            # Try each container
-            for container_id, container in containers.items():
-                # Skip full containers
-                if container.is_full():
-                    continue
-                
-                # Calculate base score with zone preference
-                preferred_zone_match = (container.zone == item.preferredZone)
-                base_score = 1000 if preferred_zone_match else 0
-                
-                # Get container space model
-                space_model = container_spaces[container_id]
-                
-                # Try each rotation
-                for rotation in rotations:
-                    width, depth, height = rotation
-                    
-                    # Skip if dimensions don't fit in container
-                    if (width > container.width or
-                        depth > container.depth or
-                        height > container.height):
-                        continue
-                    
-                    # Find best position for this rotation using Space3D model
-                    position = space_model.find_position(width, depth, height)
-                    if position is None:
-                        continue  # No valid position found for this rotation
-                    
-                    # Calculate score for this position
-                    # Priority affects depth placement (higher priority = closer to front)
-                    # Score formula based on priority, zone match, and retrieval complexity
-                    x, y, z = position
-                    
-                    # Calculate retrieval complexity (higher is worse)
-                    retrieval_complexity = space_model.calculate_retrieval_complexity(
-                        x, y, z, width, depth, height
+            # If we found a valid placement, place the item
+            if best is not None:
+                best_container, best_position, best_rotation = best
+                if block_packing:
+                    # Stack the identical items that follow next to it
+                    self._pack_block(
+                        item, sorted_items[index + 1:], best_container,
+                        best_position, best_rotation, committed, placed_items
                     )
-                    
-                    # Calculate final position score
-                    position_score = (
-                        base_score +
-                        500 * (item.priority / 100) -
-                        retrieval_complexity * 50  # Penalty for difficult retrieval
+                else:
+                    self._commit_placement(
+                        item, best_container, best_position, best_rotation,
+                        committed, placed_items
                     )
-                    
-                    # Update best score
-                    if position_score > best_score:
-                        best_score = position_score
-                        best_container = container
-                        best_position = position
-                        best_rotation = rotation
-                        best_space_model = space_model
-            
-            # If we found a valid placement, place the item
-            if best_container is not None and best_position is not None and best_rotation is not None and best_space_model is not None:
-                # Add item to the placement plan
-                placement = ItemPlacement(
-                    itemId=item.itemId,
-                    containerId=best_container.containerId,
-                    position=best_position,
-                    rotation=best_rotation
-                )
-                placements.append(placement)
-                
-                # Update 3D space model
-                width, depth, height = best_rotation
-                x, y, z = best_position
-                best_space_model.place_item(x, y, z, width, depth, height)
-                
-                # Update container
-                best_container.add_item(item.itemId, item.get_volume())
                 
-                # Update item location
-                if item.currentLocation is None:
-                    item.currentLocation = {}
-                item.currentLocation["containerId"] = best_container.containerId
-                item.currentLocation["position"] = best_position
-                item.currentLocation["rotation"] = best_rotation
-                
-                # Mark item as placed
-                placed_items.add(item.itemId)
+                yield from committed
+                committed.clear()
+    
+    def _prefetch_fits(
+        self,
+        upcoming: List[Item],
+        container_list: List[Container],
+        container_spaces: Dict[str, Space3D],
+        container_dims: np.ndarray,
+        evaluator: ParallelFitEvaluator
+    ) -> Dict[str, Tuple[List[Tuple[int, int]], Dict[int, ContainerBest]]]:
+        """Score the next batch of unlocated items in the worker processes
         
-        # Handle unplaced items with rearrangement recommendations
-        unplaced_items = [item for item in sorted_items 
-                         if item.itemId not in placed_items and
-                            (item.currentLocation is None or 
-                             "containerId" not in item.currentLocation)]
+        Returns, per itemId, the (model id, version) stamp of every container
+        when the batch was scored and the item's best candidate per container
+        index; _find_best_candidate re-evaluates the containers changed since.
+        """
+        batch = []
+        for item in upcoming:
+            if item.currentLocation is None or "containerId" not in item.currentLocation:
+                batch.append(item)
+                if len(batch) == self.batch_size:
+                    break
         
-        if unplaced_items:
-            # Generate rearrangement plan for high-priority unplaced items
-            rearrangements = self._generate_rearrangement_plan(
-                unplaced_items,
-                items,
-                containers,
-                container_spaces
-            )
+        spaces = [container_spaces[container.containerId] for container in container_list]
+        stamps = [(id(space), space.version) for space in spaces]
+        results = evaluator.evaluate(
+            [(item.get_all_rotations(), self._base_scores(item, container_list)) for item in batch],
+            container_dims,
+            spaces,
+            [container.containerId for container in container_list],
+            complexity_penalty=50
+        )
+        return {item.itemId: (stamps, bests) for item, bests in zip(batch, results)}
+    
+    def _commit_placement(
+        self,
+        item: Item,
+        container: Container,
+        position: Tuple[float, float, float],
+        rotation: Tuple[float, float, float],
+        placements: List[ItemPlacement],
+        placed_items: set
+    ) -> bool:
+        """Record an item as placed in the plan, the occupancy model, the container and the item"""
+        # Update the shared 3D space model
+        if not self.occupancy.place_item(item.itemId, container, position, rotation, priority=item.priority):
+            return False
         
-        # Return the placement plan
-        return PlacementResponse(
-            placements=placements,
-            rearrangements=rearrangements
+        # Add item to the placement plan
+        placements.append(ItemPlacement(
+            itemId=item.itemId,
+            containerId=container.containerId,
+            position=position,
+            rotation=rotation
+        ))
+        
+        # Update container
+        container.add_item(item.itemId, item.get_volume())
+        
+        # Update item location
+        if item.currentLocation is None:
+            item.currentLocation = {}
+        item.currentLocation["containerId"] = container.containerId
+        item.currentLocation["position"] = position
+        item.currentLocation["rotation"] = rotation
+        
+        # Mark item as placed
+        placed_items.add(item.itemId)
+        return True
+    
+    def _undo_placement(self, item: Item, container: Container, placed_items: set) -> None:
+        """Take an item placed by the current plan back out of it"""
+        self.occupancy.remove_item(item.itemId)
+        container.remove_item(item.itemId, item.get_volume())
+        item.currentLocation = None
+        placed_items.discard(item.itemId)
+    
+    def _pack_block(
+        self,
+        item: Item,
+        following_items: List[Item],
+        container: Container,
+        position: Tuple[float, float, float],
+        rotation: Tuple[float, float, float],
+        placements: List[ItemPlacement],
+        placed_items: set
+    ) -> int:
+        """Place an item together with the run of identical items after it as one block
+        
+        The copies fill the largest free space starting at the item's position
+        as a grid of the same rotation: along the width first, then upwards,
+        then towards the back. Returns the number of items placed.
+        
+        Args:
+            item: First item of the run, placed at position
+            following_items: Items after it in placement order
+            container: Container chosen for the item
+            position: Position chosen for the item
+            rotation: Rotation chosen for the item
+            placements: Placement plan to append to
+            placed_items: IDs of the items placed so far
+        """
+        def run_key(other):
+            return (other.width, other.depth, other.height, other.preferredZone, other.priority)
+        
+        key = run_key(item)
+        run = [item]
+        for other in following_items:
+            if run_key(other) != key or other.currentLocation:
+                break
+            run.append(other)
+        
+        # Largest free space the block can grow in
+        x, y, z = position
+        width, depth, height = rotation
+        spaces = [
+            free for free in self.occupancy.get_space(container).free_spaces
+            if abs(free.x - x) <= EPSILON and abs(free.y - y) <= EPSILON and
+               abs(free.z - z) <= EPSILON and free.can_fit(width, depth, height)
+        ]
+        if not spaces:
+            return int(self._commit_placement(item, container, position, rotation, placements, placed_items))
+        free = max(spaces, key=lambda space: space.get_volume())
+        
+        count_x = int((free.width + EPSILON) // width)
+        count_y = int((free.depth + EPSILON) // depth)
+        count_z = int((free.height + EPSILON) // height)
+        slots = [
+            (x + i * width, y + k * depth, z + j * height)
+            for k in range(count_y) for j in range(count_z) for i in range(count_x)
+        ]
+        
+        placed = 0
+        for other, slot in zip(run, slots):
+            if placed and container.is_full():
+                break
+            if not self._commit_placement(other, container, slot, rotation, placements, placed_items):
+                break
+            placed += 1
+        return placed
+    
+    def _place_by_zone(
+        self,
+        sorted_items: List[Item],
+        items: Dict[str, Item],
+        containers: Dict[str, Container],
+        placements: List[ItemPlacement],
+        placed_items: set,
+        block_packing: bool = False,
+        deadline: Optional[float] = None
+    ) -> None:
+        """Place the items preferring each zone into that zone's containers
+        
+        Zones share no containers, so they are solved independently: in worker
+        processes when the service has workers (their plans are then replayed
+        here in priority order), otherwise one zone after the other.
+        """
+        # Containers per zone, in container order
+        zone_containers: Dict[str, Dict[str, Container]] = {}
+        for container_id, container in containers.items():
+            zone_containers.setdefault(container.zone, {})[container_id] = container
+        
+        self.occupancy.sync_items(sorted_items, containers)
+        zone_items: Dict[str, List[Item]] = {}
+        for item in sorted_items:
+            if item.currentLocation is not None and "containerId" in item.currentLocation:
+                continue
+            if item.preferredZone in zone_containers:
+                zone_items.setdefault(item.preferredZone, []).append(item)
+        
+        if self.workers <= 1 or len(zone_items) <= 1:
+            for zone, zone_item_list in zone_items.items():
+                self._place_items(
+                    zone_item_list, zone_containers[zone], placements, placed_items, block_packing, deadline
+                )
+            return
+        
+        # Each worker gets its zone's containers and the items already in them
+        tasks = []
+        for zone, zone_item_list in zone_items.items():
+            zone_ids = zone_containers[zone]
+            stowed = {
+                item_id: item for item_id, item in items.items()
+                if item.currentLocation and item.currentLocation.get("containerId") in zone_ids
+            }
+            tasks.append((zone_item_list, stowed, zone_ids, block_packing, deadline))
+        
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(tasks))) as executor:
+            zone_plans = list(executor.map(_solve_zone, *zip(*tasks)))
+        
+        # Replay the zone plans in global priority order
+        rank = {item.itemId: index for index, item in enumerate(sorted_items)}
+        zone_placements = sorted(
+            (placement for plan in zone_plans for placement in plan),
+            key=lambda placement: rank[placement.itemId]
         )
+        for placement in zone_placements:
+            self._commit_placement(
+                items[placement.itemId],
+                containers[placement.containerId],
+                placement.position,
+                placement.rotation,
+                placements,
+                placed_items
+            )
     
-    def _generate_rearrangement_plan(
+    def _place_multi_start(
         self,
-        unplaced_items: List[Item],
-        all_items: Dict[str, Item],
+        sorted_items: List[Item],
+        items: Dict[str, Item],
         containers: Dict[str, Container],
-        container_spaces: Dict[str, Space3D]
-    ) -> List[RearrangementStep]:
-        """Generate a rearrangement plan to make space for unplaced high-priority items"""
-        rearrangement_steps = []
-        step_count = 1
-        
-        # Focus on high-priority unplaced items first (up to 5)
-        high_priority_unplaced = sorted(
-            unplaced_items,
-            key=lambda x: -x.priority
-        )[:5]
-        
-        # For each priority item that couldn't be placed
-        for target_item in high_priority_unplaced:
-            preferred_zone = target_item.preferredZone
-            
-            # Find low-priority items in the preferred zone
-            low_priority_candidates = []
-            
-            # Search all containers in the preferred zone
-            for container_id, container in containers.items():
-                if container.zone != preferred_zone:
-                    continue
-                    
-                # Find items in this container
-                for item_id in container.items:
-                    if item_id in all_items:
-                        item = all_items[item_id]
-                        # Add to candidates if lower priority than our target
-                        if item.priority < target_item.priority:
-                            # Calculate a "value density" score (priority per volume)
-                            # Lower is better to move
-                            value_density = item.priority / max(0.1, item.get_volume())
-                            low_priority_candidates.append({
-                                'item': item,
-                                'container': container,
-                                'value_density': value_density
-                            })
-            
-            # Sort candidates by value density (lower first)
-            low_priority_candidates.sort(key=lambda x: x['value_density'])
+        placements: List[ItemPlacement],
+        placed_items: set,
+        restarts: int,
+        seed: int,
+        block_packing: bool = False,
+        deadline: Optional[float] = None
+    ) -> None:
+        """Run the greedy pass in several orders and commit the best plan
+        
+        The first order is the usual one, so the result is never worse than
+        a single pass by the plan quality measure. The others jitter every
+        item by up to a tenth of the list, which keeps the priority order
+        roughly intact. Ties go to the earliest order.
+        
+        With workers the orders run side by side. Without them they run one
+        after another on structural copies of the occupancy models, so they
+        only run with a deadline: an order is started only if a pass as long
+        as the slowest so far still ends before it. Without workers or a
+        deadline this is a single greedy pass.
+        """
+        if self.workers <= 1 and deadline is None:
+            self._place_items(sorted_items, containers, placements, placed_items, block_packing)
+            return
+        
+        self.occupancy.sync_items(sorted_items, containers)
+        pending = [
+            item for item in sorted_items
+            if item.currentLocation is None or "containerId" not in item.currentLocation
+        ]
+        if not pending:
+            return
+        
+        rng = random.Random(seed)
+        window = max(2.0, len(pending) / 10)
+        orders = [pending]
+        for _ in range(restarts - 1):
+            keys = [index + rng.uniform(0, window) for index in range(len(pending))]
+            orders.append([item for _, item in sorted(zip(keys, pending), key=lambda pair: pair[0])])
+        
+        stowed = {
+            item_id: item for item_id, item in items.items()
+            if item.currentLocation and item.currentLocation.get("containerId") in containers
+        }
+        
+        if self.workers > 1:
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(orders))) as executor:
+                results = list(executor.map(
+                    _solve_ordering,
+                    orders,
+                    [stowed] * len(orders),
+                    [containers] * len(orders),
+                    [block_packing] * len(orders),
+                    [deadline] * len(orders)
+                ))
+        else:
+            # Every order works on its own copy of the new items, the
+            # containers and the occupancy models; stowed items are not copied
+            results = []
+            slowest = 0.0
+            for order in orders:
+                started = time.monotonic()
+                if results and started + slowest >= deadline:
+                    break
+                trial = PlacementService(self.occupancy.copy())
+                trial_order, trial_containers = copy.deepcopy((order, containers))
+                plan = []
+                trial._place_items(trial_order, trial_containers, plan, set(), block_packing, deadline)
+                results.append((trial._plan_quality(plan, items, trial_containers), plan))
+                slowest = max(slowest, time.monotonic() - started)
+        
+        best = max(range(len(results)), key=lambda index: (results[index][0], -index))
+        for placement in results[best][1]:
+            self._commit_placement(
+                items[placement.itemId],
+                containers[placement.containerId],
+                placement.position,
+                placement.rotation,
+                placements,
+                placed_items
+            )
+    
+    def _plan_quality(
+        self,
+        plan: List[ItemPlacement],
+        items: Dict[str, Item],
+        containers: Dict[str, Container]
+    ) -> Tuple[int, int, int]:
+        """Rank a committed plan: placed count, zone matches, then least blocking
+        
+        Returns (items placed, items in their preferred zone, minus the total
+        retrieval complexity of the placed items); higher is better.
+        """
+        zone_matches = 0
+        complexity = 0
+        for placement in plan:
+            item = items[placement.itemId]
+            container = containers[placement.containerId]
+            if container.zone == item.preferredZone:
+                zone_matches += 1
+            space = self.occupancy.get_space(container)
+            complexity += space.calculate_retrieval_complexity(
+                *space.placed_items[item.itemId], ignore_item_id=item.itemId
+            )
+        return len(plan), zone_matches, -complexity
+    
+    def _place_walls(
+        self,
+        sorted_items: List[Item],
+        containers: Dict[str, Container],
+        placements: List[ItemPlacement],
+        placed_items: set,
+        block_packing: bool = False,
+        deadline: Optional[float] = None,
+        complete_plan: bool = False
+    ) -> bool:
+        """Build walls, unless plain best fit places more items
+        
+        Walls followed by a best-fit pass, and a best-fit pass alone, are
+        tried on copies of the new items, the containers and the occupancy
+        models; walls win ties, and the second trial is skipped when no
+        shape had enough copies for a wall. With complete_plan the winning plan is
+        committed as a whole and True is returned. Otherwise only the wall
+        placements (if walls win) are committed, the rest is left to the
+        caller's passes, and False is returned.
+        """
+        self.occupancy.sync_items(sorted_items, containers)
+        pending = [
+            item for item in sorted_items
+            if item.currentLocation is None or "containerId" not in item.currentLocation
+        ]
+        if not pending:
+            return complete_plan
+        
+        plans = []
+        for walls in (True, False):
+            trial = PlacementService(self.occupancy.copy())
+            trial_items, trial_containers = copy.deepcopy((pending, containers))
+            plan = []
+            trial_placed = set()
+            if walls:
+                trial._build_walls(trial_items, trial_containers, plan, trial_placed, deadline)
+            wall_count = len(plan)
+            trial._place_items(trial_items, trial_containers, plan, trial_placed, block_packing, deadline)
+            plans.append((plan, wall_count))
+            if walls and wall_count == 0:
+                # No shape made a wall, so the plan is plain best fit already
+                break
+        
+        wall_plan, wall_count = plans[0]
+        if len(plans) == 1 or len(wall_plan) >= len(plans[1][0]):
+            chosen = wall_plan if complete_plan else wall_plan[:wall_count]
+        else:
+            chosen = plans[1][0] if complete_plan else []
+        
+        by_id = {item.itemId: item for item in pending}
+        for placement in chosen:
+            self._commit_placement(
+                by_id[placement.itemId],
+                containers[placement.containerId],
+                placement.position,
+                placement.rotation,
+                placements,
+                placed_items
+            )
+        return complete_plan
+    
+    def _build_walls(
+        self,
+        sorted_items: List[Item],
+        containers: Dict[str, Container],
+        placements: List[ItemPlacement],
+        placed_items: set,
+        deadline: Optional[float] = None,
+        min_run: int = 4
+    ) -> None:
+        """Load the unlocated items into the containers of their zone wall by wall
+        
+        Wall-building heuristic: the empty depth behind the cargo already in a
+        container is filled with walls spanning its full width and height. The
+        depth of a wall is set by the highest-ranked pending item, and the wall
+        is filled bottom-up with horizontal strips of items no deeper than it.
+        Items are handled per shape, so the cost grows with the number of
+        walls and distinct shapes rather than with item count.
+        
+        Walls only pay off for runs of identical boxes, so only shapes with
+        at least min_run pending copies in a zone go into walls. Odd-sized
+        items, and items that end up in no wall, are left for the best-fit
+        pass.
+        """
+        # Pending items per zone, grouped by shape (in any orientation) in
+        # priority order
+        pending: Dict[str, Dict[Tuple[float, float, float], deque]] = {}
+        rank = {}
+        self.occupancy.sync_items(sorted_items, containers)
+        for index, item in enumerate(sorted_items):
+            if item.currentLocation is not None and "containerId" in item.currentLocation:
+                continue
+            shape = tuple(sorted((item.width, item.depth, item.height)))
+            pending.setdefault(item.preferredZone, {}).setdefault(shape, deque()).append(item)
+            rank[item.itemId] = index
+        for zone, shapes in pending.items():
+            pending[zone] = {shape: queue for shape, queue in shapes.items() if len(queue) >= min_run}
+        
+        for container in containers.values():
+            shapes = pending.get(container.zone)
+            if not shapes:
+                continue
             
-            # Move items until we free enough space
-            target_volume = target_item.get_volume()
-            moved_volume = 0
+            # Walls start behind the deepest cargo already in the container
+            placed = self.occupancy.get_space(container).placed_array()
+            wall_y = float((placed[:, 1] + placed[:, 4]).max()) if len(placed) else 0.0
             
-            for candidate in low_priority_candidates:
-                item = candidate['item']
-                container = candidate['container']
-                
-                # Skip if we've freed enough space
-                if moved_volume >= target_volume:
+            while shapes and not container.is_full():
+                if deadline is not None and time.monotonic() >= deadline:
+                    return
+                # The highest-ranked pending item sets the wall depth, in the
+                # orientation covering most of the wall face
+                lead_shape = min(shapes, key=lambda shape: rank[shapes[shape][0].itemId])
+                rotations = [
+                    rotation for rotation in shapes[lead_shape][0].get_all_rotations()
+                    if rotation[0] <= container.width + EPSILON and
+                       rotation[1] <= container.depth - wall_y + EPSILON and
+                       rotation[2] <= container.height + EPSILON
+                ]
+                if not rotations:
                     break
-                    
-                # Add rearrangement step
-                rearrangements = []
-                
-                # Find alternative container for this item (not in preferred zone)
-                best_alt_container = None
+                wall_depth = max(rotations, key=lambda rotation: (
+                    int((container.width + EPSILON) // rotation[0]) * rotation[0] *
+                    int((container.height + EPSILON) // rotation[2]) * rotation[2],
+                    -rotation[1]
+                ))[1]
                 
-                for alt_container_id, alt_container in containers.items():
-                    # Skip containers in the same zone or if full
-                    if (alt_container.zone == preferred_zone or 
-                        alt_container.is_full() or
-                        item.get_volume() > alt_container.get_available_space()):
-                        continue
-                        
-                    # This is a viable alternative
-                    best_alt_container = alt_container
+                if not self._fill_wall(container, wall_y, wall_depth, shapes, rank, placements, placed_items):
                     break
+                wall_y += wall_depth
+    
+    def _fill_wall(
+        self,
+        container: Container,
+        wall_y: float,
+        wall_depth: float,
+        shapes: Dict[Tuple[float, float, float], deque],
+        rank: Dict[str, int],
+        placements: List[ItemPlacement],
+        placed_items: set
+    ) -> int:
+        """Fill one wall with horizontal strips of pending items
+        
+        Each strip takes its height from the first item placed in it and is
+        then filled along the width, shape by shape in priority order, with as
+        many copies of each shape as fit. Returns the number of items placed.
+        
+        Args:
+            container: Container the wall is built in
+            wall_y: Depth at which the wall starts
+            wall_depth: Depth of the wall
+            shapes: Pending items by shape, consumed as they are placed
+            rank: Position of each item in placement order
+            placements: Placement plan to append to
+            placed_items: IDs of the items placed so far
+        """
+        def best_rotation(item, max_width, max_height):
+            """Fitting orientation using most of the wall depth, then of the strip height"""
+            fitting = [
+                rotation for rotation in item.get_all_rotations()
+                if rotation[0] <= max_width + EPSILON and
+                   rotation[1] <= wall_depth + EPSILON and
+                   rotation[2] <= max_height + EPSILON
+            ]
+            if not fitting:
+                return None
+            return max(fitting, key=lambda rotation: (rotation[1], rotation[2], -rotation[0]))
+        
+        placed = 0
+        strip_z = 0.0
+        while shapes and strip_z < container.height - EPSILON:
+            strip_height = None
+            x = 0.0
+            for shape in sorted(shapes, key=lambda shape: rank[shapes[shape][0].itemId]):
+                queue = shapes[shape]
                 
-                # If we found an alternative container, move the item
-                if best_alt_container:
-                    rearrangement_steps.append(
-                        RearrangementStep(
-                            step=step_count,
-                            action="move",
-                            itemId=item.itemId,
-                            fromContainer=container.containerId,
-                            toContainer=best_alt_container.containerId
-                        )
+                # Copies of a shape, turned again for the width left over
+                while queue and not container.is_full():
+                    rotation = best_rotation(
+                        queue[0], container.width - x,
+                        container.height - strip_z if strip_height is None else strip_height
                     )
-                    step_count += 1
+                    if rotation is None:
+                        break
+                    if strip_height is None:
+                        strip_height = rotation[2]
                     
-                    # Track the volume we've moved
-                    moved_volume += item.get_volume()
-                else:
-                    # No alternative container, try temporary storage
-                    rearrangement_steps.append(
-                        RearrangementStep(
-                            step=step_count,
-                            action="move",
-                            itemId=item.itemId,
-                            fromContainer=container.containerId,
-                            toContainer="temporary_storage"
-                        )
-                    )
-                    step_count += 1
-                    
-                    # Track the volume we've moved
-                    moved_volume += item.get_volume()
+                    count = min(len(queue), int((container.width - x + EPSILON) // rotation[0]))
+                    for _ in range(count):
+                        if container.is_full():
+                            break
+                        item = queue.popleft()
+                        if self._commit_placement(
+                            item, container, (x, wall_y, strip_z), rotation, placements, placed_items
+                        ):
+                            placed += 1
+                        x += rotation[0]
+                if not queue:
+                    del shapes[shape]
+                if container.width - x < EPSILON or container.is_full():
+                    break
             
-            # Add step to place the target item
-            if moved_volume >= target_volume:
-                preferred_containers = [c for c_id, c in containers.items() 
-                                      if c.zone == preferred_zone]
-                if preferred_containers:
-                    # Add placement step
-                    rearrangement_steps.append(
-                        RearrangementStep(
-                            step=step_count,
-                            action="place",
-                            itemId=target_item.itemId,
-                            toContainer=preferred_containers[0].containerId
-                        )
-                    )
-                    step_count += 1
+            # Nothing fits in the rest of the wall
+            if strip_height is None:
+                break
+            strip_z += strip_height
+        return placed
+    
+    def _base_scores(
+        self,
+        item: Item,
+        container_list: List[Container],
+        only: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """Score of an item per container before the retrieval penalty
+        
+        Zone preference plus priority; full containers and containers whose
+        largest free box cannot take the item get -inf and are skipped. With
+        a boolean mask only, the containers outside it get -inf as well.
+        """
+        fitting = self.occupancy.candidate_containers(
+            item.get_all_rotations(),
+            None if only is None else [c.containerId for c, use in zip(container_list, only) if use]
+        )
+        return np.array([
+            float('-inf') if container.is_full() or container.containerId not in fitting else
+            (1000 if container.zone == item.preferredZone else 0) + 500 * (item.priority / 100)
+            for container in container_list
+        ], dtype=float)
+    
+    def _find_best_candidate(
+        self,
+        item: Item,
+        container_list: List[Container],
+        container_spaces: Dict[str, Space3D],
+        container_dims: np.ndarray,
+        fit_cache: Optional[ShapeFitCache] = None,
+        prefetched: Optional[Tuple[List[Tuple[int, int]], Dict[int, ContainerBest]]] = None
+    ) -> Optional[Tuple[Container, Tuple[float, float, float], Tuple[float, float, float]]]:
+        """Find the best (container, position, rotation) for an item
+        
+        All rotations are tested against the free spaces of all containers at
+        once. Each candidate is scored by zone preference and priority, with a
+        penalty for every item blocking its retrieval. With a fit cache the
+        candidates of unchanged containers are reused, and with prefetched
+        results from _prefetch_fits only the containers changed since are
+        evaluated here; all give the same result.
+        """
+        rotations = item.get_all_rotations()
+        spaces = [container_spaces[container.containerId] for container in container_list]
         
-        return rearrangement_steps
+        if prefetched is not None:
+            # Scores of unchanged containers still hold; changed ones are
+            # scored and evaluated again
+            stamps, bests = prefetched
+            changed = np.array([(id(space), space.version) != stamp for space, stamp in zip(spaces, stamps)])
+            bests = {index: best for index, best in bests.items() if not changed[index]}
+            if changed.any():
+                bests.update(container_bests(
+                    self._fit_candidates(
+                        rotations, container_dims, spaces,
+                        self._base_scores(item, container_list, only=changed), fit_cache
+                    ),
+                    range(len(spaces))
+                ))
+            if not bests:
+                return None
+            key, rotation_index, position = min(bests.values())
+            return container_list[key[1]], position, rotations[rotation_index]
+        
+        base_scores = self._base_scores(item, container_list)
+        if not np.isfinite(base_scores).any():
+            return None
+        
+        candidates = self._fit_candidates(rotations, container_dims, spaces, base_scores, fit_cache)
+        best_index = candidates.best_index()
+        if best_index is None:
+            return None
+        
+        container = container_list[candidates.container_index[best_index]]
+        position = tuple(float(v) for v in candidates.positions[best_index])
+        rotation = rotations[candidates.rotation_index[best_index]]
+        return container, position, rotation
+    
+    def _fit_candidates(
+        self,
+        rotations: List[Tuple[float, float, float]],
+        container_dims: np.ndarray,
+        spaces: List[Space3D],
+        base_scores: np.ndarray,
+        fit_cache: Optional[ShapeFitCache] = None
+    ) -> FitCandidates:
+        """Run the fit kernel over the containers with a finite base score"""
+        if fit_cache is not None:
+            return fit_cache.evaluate(
+                tuple(rotations[0]),
+                rotations,
+                container_dims,
+                spaces,
+                base_scores,
+                complexity_penalty=50  # Penalty for difficult retrieval
+            )
+        
+        # Pruned containers contribute no free spaces to the kernel
+        no_boxes = np.empty((0, 6))
+        return evaluate_fit_candidates(
+            rotations,
+            container_dims,
+            [space.free_space_array() if np.isfinite(score) else no_boxes
+             for space, score in zip(spaces, base_scores)],
+            [space.placed_array() if np.isfinite(score) else no_boxes
+             for space, score in zip(spaces, base_scores)],
+            base_scores,
+            complexity_penalty=50  # Penalty for difficult retrieval
+        )
+    
+    def _generate_rearrangement_plan(
+        self,
+        unplaced_items: List[Item],
+        all_items: Dict[str, Item],
+        containers: Dict[str, Container],
+        container_spaces: Dict[str, Space3D],
+        deadline: Optional[float] = None
+    ) -> List[RearrangementStep]:
+        """Generate a rearrangement plan to make space for unplaced high-priority items
+        
+        Every step is checked against the container space models: moved items
+        go to free positions reachable from the open face, and the items in
+        front of them are taken out first and put back afterwards. All
+        unplaced items are handled in one pass, highest priority first, with
+        the eviction candidates of each zone taken from the occupancy
+        registry. Items no plan within the move bound is found for are left
+        out, as are the ones not reached by the deadline (a time.monotonic()
+        value).
+        """
+        search = _RearrangementSearch(all_items, containers, container_spaces, self.occupancy)
+        return search.plan(unplaced_items, deadline)
     
     def _find_best_position(
         self,
@@ -1,4 +1,4 @@
-from typing import Dict, List, Tuple, Optional, Any, Set
+from typing import Dict, Iterable, List, Tuple, Optional, Any, Set
 import copy
 import heapq
 from datetime import datetime
@@ -6,11 +6,111 @@ from datetime import datetime
 from models.item import Item
 from models.container import Container
 from models.placement import ItemLocation, RearrangementStep
-from utils.space3d import Space3D
+from utils.space3d import EPSILON
+from utils.trigram_index import TrigramIndex
+from utils.prefix_index import PrefixIndex
+from services.occupancy import OccupancyRegistry
 
 class RetrievalService:
     """Service for retrieving items from containers with optimized search and access algorithms"""
     
+    def __init__(self, occupancy: Optional[OccupancyRegistry] = None):
+        """Initialize the retrieval service
+        
+        Args:
+            occupancy: Shared occupancy registry (a private one is created if omitted)
+        """
+        self.occupancy = occupancy if occupancy is not None else OccupancyRegistry()
+        
+        # Trigram index over item IDs and names, loaded on the first search
+        # and kept in sync by the callers that import, add, move or undock items
+        self.search_index = TrigramIndex()
+        self.search_index_loaded = False
+        
+        # Prefix index over the same texts for autocompletion, ranked by
+        # priority and then by depth from the open face (easier to retrieve),
+        # with the names and priorities to show for the completions
+        self.completion_index = PrefixIndex()
+        self.completion_items: Dict[str, Tuple[str, int]] = {}
+    
+    def load_search_index(self, entries: Iterable[Tuple[str, str, int, Optional[Dict[str, Any]]]]) -> None:
+        """Index the (itemId, name, priority, currentLocation) entries of the inventory (only done once)"""
+        if self.search_index_loaded:
+            return
+        
+        # The prefix index is sorted once for the whole inventory
+        completions = []
+        for item_id, name, priority, location in entries:
+            self.search_index.add(item_id, (item_id, name))
+            completions.append((item_id, (item_id, name), self._completion_rank(priority, location)))
+            self.completion_items[item_id] = (name, priority)
+        self.completion_index.add_many(completions)
+        
+        self.search_index_loaded = True
+    
+    def reset_search_index(self) -> None:
+        """Forget the search index, e.g. after the persisted data was replaced"""
+        self.search_index = TrigramIndex()
+        self.search_index_loaded = False
+        self.completion_index = PrefixIndex()
+        self.completion_items = {}
+    
+    def index_item(
+        self,
+        item_id: str,
+        name: str,
+        priority: int = 0,
+        location: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """Add an item to the search index, or update it after it changed
+        
+        Args:
+            item_id: ID of the item
+            name: Name of the item
+            priority: Priority of the item (higher completes first)
+            location: Current location of the item, None if not stowed
+        """
+        self.search_index.add(item_id, (item_id, name))
+        self.completion_index.add(item_id, (item_id, name), self._completion_rank(priority, location))
+        self.completion_items[item_id] = (name, priority)
+    
+    @staticmethod
+    def _completion_rank(priority: int, location: Optional[Dict[str, Any]]) -> Tuple[int, float]:
+        """Rank of an item among the completions (lower is better)"""
+        # Stowed items nearer the open face are quicker to retrieve; items
+        # that are not stowed come last within their priority
+        depth = float("inf")
+        if location and "containerId" in location:
+            depth = location["position"][1]
+        return (-priority, depth)
+    
+    def unindex_item(self, item_id: str) -> None:
+        """Drop an item from the search index, e.g. after undocking"""
+        self.search_index.remove(item_id)
+        self.completion_index.remove(item_id)
+        self.completion_items.pop(item_id, None)
+    
+    def find_item_ids(self, query: str) -> Set[str]:
+        """Get the IDs of the indexed items whose ID or name contains the query"""
+        return self.search_index.search(query)
+    
+    def autocomplete(self, prefix: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Complete an item ID or name prefix from the in-memory index
+        
+        Args:
+            prefix: Start of an item ID or name (case insensitive)
+            limit: Maximum number of completions
+            
+        Returns:
+            Completions with the item ID, name and priority, highest priority
+            first and then easiest to retrieve
+        """
+        completions = []
+        for item_id in self.completion_index.complete(prefix, limit):
+            name, priority = self.completion_items[item_id]
+            completions.append({"itemId": item_id, "name": name, "priority": priority})
+        return completions
+    
     def search_items(
         self,
         query: str,
@@ -21,26 +121,24 @@ class RetrievalService:
         
         Returns a list of item locations sorted by retrieval ease and expiry date
         """
+        self.occupancy.load(items, containers)
+        self.load_search_index(
+            (item_id, item.name, item.priority, item.currentLocation) for item_id, item in items.items()
+        )
         matching_items = []
         
-        # Look for exact ID match first
+        # Exact ID matches and partial ID or name matches, from the search
+        # index, so only the matching items are located
+        candidate_ids = self.find_item_ids(query)
         if query in items:
-            item_location = self.get_item_location(query, items, containers)
-            if item_location:
-                matching_items.append(item_location)
+            candidate_ids.add(query)
         
-        # Then look for partial name matches
-        query_lower = query.lower()
-        for item_id, item in items.items():
-            # Skip if already added from ID match
-            if item_id == query:
+        for item_id in sorted(candidate_ids):
+            if item_id not in items:
                 continue
-                
-            # Check for name match
-            if query_lower in item.name.lower():
-                item_location = self.get_item_location(item_id, items, containers)
-                if item_location:
-                    matching_items.append(item_location)
+            item_location = self.get_item_location(item_id, items, containers)
+            if item_location:
+                matching_items.append(item_location)
         
         # Sort results based on:
         # 1. Retrieval steps (fewer is better)
@@ -81,6 +179,8 @@ class RetrievalService:
         if item_id not in items:
             return None
         
+        self.occupancy.load(items, containers)
+        
         item = items[item_id]
         
         # Check if the item has a location
@@ -133,6 +233,8 @@ class RetrievalService:
         if item_id not in items:
             return False, []
         
+        self.occupancy.load(items, containers)
+        
         item = items[item_id]
         
         # Check if the item has a location
@@ -147,30 +249,40 @@ class RetrievalService:
         position = item.currentLocation.get("position", (0, 0, 0))
         rotation = item.currentLocation.get("rotation", (item.width, item.depth, item.height))
         
-        # Generate optimized retrieval steps
-        steps = self._generate_optimized_retrieval_steps(
-            target_item=item,
-            container=container,
-            position=position,
-            rotation=rotation,
-            items=items,
-            containers=containers
-        )
-        
-        # Update the item's usage count
-        if item.usageLimit > 0:
-            item.usageLimit -= 1
+        # Generate optimized retrieval steps; the temporary storage stays
+        # booked only while this retrieval is carried out, as the blocking
+        # items go straight back afterwards
+        reservations = []
+        try:
+            steps = self._generate_optimized_retrieval_steps(
+                target_item=item,
+                container=container,
+                position=position,
+                rotation=rotation,
+                items=items,
+                containers=containers,
+                reservations=reservations
+            )
             
-            # Check if the item is now waste
-            if item.usageLimit == 0:
-                item.isWaste = True
-        
-        # Remove the item from its container
-        item_volume = item.get_volume()
-        container.remove_item(item_id, item_volume)
-        
-        # Clear the item's location
-        item.currentLocation = None
+            # Update the item's usage count
+            if item.usageLimit > 0:
+                item.usageLimit -= 1
+                
+                # Check if the item is now waste
+                if item.usageLimit == 0:
+                    item.isWaste = True
+            
+            # Remove the item from its container and the shared occupancy model
+            item_volume = item.get_volume()
+            container.remove_item(item_id, item_volume)
+            self.occupancy.remove_item(item_id)
+            
+            # Clear the item's location
+            item.currentLocation = None
+            self.index_item(item_id, item.name, item.priority, item.currentLocation)
+        finally:
+            for reservation_id in reservations:
+                self.occupancy.release(reservation_id)
         
         return True, steps
     
@@ -195,85 +307,40 @@ class RetrievalService:
         # from the front face of the container (y=0)
         # Items that intersect with this access path are considered blocking
         
-        # First, create a 3D model of the container and its contents
+        # Use the shared 3D model of the container and its contents
         # to better analyze spatial relationships
-        space_model = Space3D(container.width, container.depth, container.height)
+        space_model = self.occupancy.get_space(container)
         
-        # Place all items except the target in the space model
-        container_items = {}
-        for other_id, other_item in items.items():
-            if other_id == target_item.itemId:
-                continue
-                
-            # Skip items that aren't in this container
-            if (not other_item.currentLocation or 
-                "containerId" not in other_item.currentLocation or
-                other_item.currentLocation["containerId"] != container.containerId):
+        # Items in this container that start in front of the target (closer
+        # to the open face) and overlap it in the x-z plane, from the
+        # container's footprint index
+        candidates = space_model.footprints.query(
+            x, z, target_width, target_height, y_max=y - EPSILON
+        )
+        
+        for _, other_id in candidates:
+            other_item = items.get(other_id)
+            if other_id == target_item.itemId or other_item is None or not other_item.currentLocation:
                 continue
-                
-            # Get position and rotation
-            other_pos = other_item.currentLocation.get("position", (0, 0, 0))
-            other_rot = other_item.currentLocation.get("rotation", 
-                                                      (other_item.width, 
-                                                       other_item.depth, 
-                                                       other_item.height))
-            
-            # Store information about this item
-            container_items[other_id] = {
-                "item": other_item,
-                "position": other_pos,
-                "rotation": other_rot
-            }
             
-            # Place in space model (just for visualization purposes)
-            other_x, other_y, other_z = other_pos
-            other_width, other_depth, other_height = other_rot
-            space_model.place_item(other_x, other_y, other_z, 
-                                  other_width, other_depth, other_height)
-        
-        # Calculate items blocking access along the retrieval path
-        # For our model, we'll use a 2D projection and check what's in front
-        
-        # Method 1: Check if items are directly in front of the target
-        for other_id, info in container_items.items():
-            other_item = info["item"]
-            other_pos = info["position"]
-            other_rot = info["rotation"]
-            
-            other_x, other_y, other_z = other_pos
-            other_width, other_depth, other_height = other_rot
-            
-            # Check if this item blocks the retrieval path
-            # We need to check if it's in front of our target item and overlaps in the x-z plane
-            
-            # Item must be in front of the target
-            if other_y < y:
-                continue  # Not blocking if behind the target
-                
-            # Check if there's x-z overlap
-            x_overlap = (
-                (other_x < x + target_width and x < other_x + other_width) or
-                (x < other_x + other_width and other_x < x + target_width)
+            other_pos = other_item.currentLocation.get("position", (0, 0, 0))
+            other_x, other_y, other_z, other_width, other_depth, other_height = (
+                space_model.placed_items[other_id]
             )
             
-            z_overlap = (
-                (other_z < z + target_height and z < other_z + other_height) or
-                (z < other_z + other_height and other_z < z + target_height)
+            # This item blocks the access path
+            blocking_depth = space_model.calculate_retrieval_complexity(
+                other_x, other_y, other_z, 
+                other_width, other_depth, other_height,
+                ignore_item_id=target_item.itemId
             )
             
-            if x_overlap and z_overlap:
-                # This item blocks the access path
-                blocking_depth = space_model.calculate_retrieval_complexity(
-                    other_x, other_y, other_z, 
-                    other_width, other_depth, other_height
-                )
-                
-                blocked_by.append({
-                    "itemId": other_id,
-                    "name": other_item.name,
-                    "position": other_pos,
-                    "depth": blocking_depth
-                })
+            blocked_by.append({
+                "itemId": other_id,
+                "name": other_item.name,
+                "position": other_pos,
+                "depth": blocking_depth
+            })
         
         # Sort blocking items by their depth (move closest items first)
         blocked_by.sort(key=lambda x: x.get("depth", 0))
@@ -290,7 +357,8 @@ class RetrievalService:
         position: Tuple[float, float, float],
         rotation: Tuple[float, float, float],
         items: Dict[str, Item],
-        containers: Dict[str, Container]
+        containers: Dict[str, Container],
+        reservations: Optional[List[str]] = None
     ) -> List[RearrangementStep]:
         """Generate optimized steps to retrieve an item
         
@@ -298,54 +366,50 @@ class RetrievalService:
         1. Minimize the number of moves
         2. Consider alternative containers for temporary storage
         3. Prioritize moving items based on their properties
+        
+        Args:
+            reservations: When given, the temporary storage is booked in the
+                registry and the reservation IDs are appended here for the
+                caller to release; otherwise containers are only looked up
         """
-        # Get blocking items
-        _, blocked_by = self._calculate_retrieval_complexity(
-            target_item=target_item,
-            container=container,
-            position=position,
-            rotation=rotation,
-            items=items
-        )
+        # Get blocking items, including the items blocking them, from the
+        # container's blocking graph in the order they have to be moved
+        self.occupancy.track_item(target_item, containers)
+        blocking_ids = [
+            blocking_id
+            for blocking_id in self.occupancy.get_blockers(target_item.itemId, transitive=True)
+            if blocking_id in items
+        ]
         
         steps = []
-        moved_to_temp = set()
+        moved_to_temp = []
         step_count = 1
         
-        # Find the best temporary container for each item
-        # instead of always using "temporary_storage"
-        available_containers = {}
-        for cont_id, cont in containers.items():
-            if cont.containerId != container.containerId:
-                # Calculate available space
-                available_space = cont.get_available_space()
-                if available_space > 0:
-                    available_containers[cont_id] = {
-                        "container": cont,
-                        "available_space": available_space
-                    }
-        
         # First, move blocking items in the optimal order
-        for blocking_item_info in blocked_by:
-            blocking_id = blocking_item_info["itemId"]
+        for blocking_id in blocking_ids:
             blocking_item = items[blocking_id]
             
-            # Determine best container to move this item to
+            # Use the tightest container in the same zone (for easier return)
+            # that still has room, booking it when the retrieval is carried
+            # out so concurrent retrievals don't count on the same space
             best_temp_container = "temporary_storage"
-            item_volume = blocking_item.get_volume()
-            
-            for cont_id, info in available_containers.items():
-                cont = info["container"]
-                avail_space = info["available_space"]
-                
-                # Check if this container has enough space
-                if avail_space >= item_volume:
-                    # Prefer containers in same zone for easier return
-                    if cont.zone == container.zone:
-                        best_temp_container = cont_id
-                        # Update available space
-                        info["available_space"] -= item_volume
-                        break
+            if reservations is not None:
+                booked = self.occupancy.reserve_space(
+                    blocking_item.get_all_rotations(),
+                    zone=container.zone,
+                    exclude=[container.containerId]
+                )
+                if booked is not None:
+                    best_temp_container = booked[0]
+                    reservations.append(booked[1])
+            else:
+                fitting = self.occupancy.fitting_containers(
+                    blocking_item.get_all_rotations(),
+                    zone=container.zone,
+                    exclude=[container.containerId]
+                )
+                if fitting:
+                    best_temp_container = fitting[0]
             
             # Add step to move the blocking item
             steps.append(RearrangementStep(
@@ -358,7 +422,7 @@ class RetrievalService:
             step_count += 1
             
             # Track which items we've moved
-            moved_to_temp.add((blocking_id, best_temp_container))
+            moved_to_temp.append((blocking_id, best_temp_container))
         
         # Next, retrieve the target item
         steps.append(RearrangementStep(
@@ -370,7 +434,7 @@ class RetrievalService:
         step_count += 1
         
         # Finally, move blocking items back in reverse order
-        for blocking_id, temp_container in reversed(list(moved_to_temp)):
+        for blocking_id, temp_container in reversed(moved_to_temp):
             steps.append(RearrangementStep(
                 step=step_count,
                 action="move",
@@ -395,6 +459,8 @@ class RetrievalService:
         if item_id not in items:
             return False, []
         
+        self.occupancy.load(items, containers)
+        
         item = items[item_id]
         
         # Check if the item has a location
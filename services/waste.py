@@ -6,10 +6,19 @@ from models.item import Item
 from models.container import Container
 from models.placement import WasteItem, WasteReturnStep
 from utils.space3d import Space3D
+from services.occupancy import OccupancyRegistry
 
 class WasteService:
     """Service for advanced waste management and return planning"""
     
+    def __init__(self, occupancy: Optional[OccupancyRegistry] = None):
+        """Initialize the waste service
+        
+        Args:
+            occupancy: Shared occupancy registry (a private one is created if omitted)
+        """
+        self.occupancy = occupancy if occupancy is not None else OccupancyRegistry()
+    
     def identify_waste_items(
         self,
         items: Dict[str, Item],
@@ -23,6 +32,7 @@ class WasteService:
         - Total waste mass
         - Initial retrieval steps
         """
+        self.occupancy.load(items, containers)
         waste_items = []
         total_waste_mass = 0.0
         
@@ -272,6 +282,9 @@ class WasteService:
             else:
                 sorted_items = selected_container_items
             
+            # Never take an item out before the items blocking it
+            sorted_items = self._in_removal_order(sorted_items)
+            
             # Add steps to retrieve and move each item
             for item in sorted_items:
                 # First remove from original container
@@ -352,6 +365,10 @@ class WasteService:
                     )
                 )
                 
+                # Respect the container's blocking graph: an item only comes
+                # after everything blocking it, even through other items
+                sorted_by_accessibility = self._in_removal_order(sorted_by_accessibility)
+                
                 # Add steps for retrieving items in accessibility order
                 for item in sorted_by_accessibility:
                     steps.append(WasteReturnStep(
@@ -385,6 +402,12 @@ class WasteService:
         
         return steps
         
+    def _in_removal_order(self, waste_items: List[WasteItem]) -> List[WasteItem]:
+        """Reorder waste items by the shared blocking graphs, keeping their order otherwise"""
+        item_map = {item.itemId: item for item in waste_items}
+        ordered_ids = self.occupancy.removal_order(item.itemId for item in waste_items)
+        return [item_map[item_id] for item_id in ordered_ids]
+    
     def _generate_waste_return_steps(
         self,
         waste_items: List[WasteItem]
@@ -424,6 +447,9 @@ class WasteService:
                         container = containers[container_id]
                         container.remove_item(item_id, item.get_volume())
                 
+                # Free its space in the shared occupancy model
+                self.occupancy.remove_item(item_id)
+                
                 # Mark as completely removed from the system
                 item.currentLocation = None
                 
@@ -0,0 +1,47 @@
+from models.container import Container
+from models.item import Item
+from services.occupancy import OccupancyRegistry
+from services.retrieval import RetrievalService
+from utils.space3d import Space3D
+
+
+def _row_of_three():
+    """Three boxes one behind the other, front at the open face"""
+    items = {}
+    for index, item_id in enumerate(["front", "mid", "back"]):
+        item = Item(itemId=item_id, name=item_id, width=10, depth=10, height=10, mass=1,
+                    priority=50, expiryDate="N/A", usageLimit=5, preferredZone="A")
+        item.currentLocation = {
+            "containerId": "c1",
+            "position": (0.0, index * 10.0, 0.0),
+            "rotation": (10.0, 10.0, 10.0)
+        }
+        items[item_id] = item
+    container = Container(containerId="c1", zone="A", width=10, depth=30, height=10)
+    container.items = list(items)
+    return items, {"c1": container}
+
+
+def test_front_item_has_no_blockers():
+    space = Space3D(10, 30, 10)
+    for index, item_id in enumerate(["front", "mid", "back"]):
+        assert space.place_item(0, index * 10, 0, 10, 10, 10, item_id=item_id)
+
+    assert space.blocking.blockers["front"] == set()
+    assert space.blocking.blockers["mid"] == {"front"}
+    assert space.blocking.transitive_blockers("back") == {"front", "mid"}
+    assert space.blocking.removal_order(["back", "mid", "front"]) == ["front", "mid", "back"]
+
+
+def test_retrieving_the_front_item_moves_nothing():
+    items, containers = _row_of_three()
+    service = RetrievalService(OccupancyRegistry())
+
+    front = service.get_item_location("front", items, containers)
+    assert front.retrievalSteps == 1
+    assert front.blockedBy == []
+
+    back = service.get_item_location("back", items, containers)
+    assert [blocker["itemId"] for blocker in back.blockedBy] == ["front", "mid"]
+    assert service.occupancy.get_blockers("back", transitive=True) == ["front", "mid"]
+    assert service.occupancy.removal_order(["back", "mid", "front"]) == ["front", "mid", "back"]
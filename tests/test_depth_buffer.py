@@ -0,0 +1,38 @@
+import random
+
+from utils.depth_buffer import FrontDepthBuffer
+from utils.spatial_index import FootprintIndex
+
+EPSILON = 1e-9
+
+
+def test_fractional_footprints_touching_in_one_cell_do_not_block():
+    buffer = FrontDepthBuffer(cell_size=1.0, tolerance=EPSILON)
+    buffer.add("front", 0.2, 0.2, 0.4, 0.4, 0.0)  # x and z in [0.2, 0.6]
+
+    # Shares the first cell with "front" but only touches its edge
+    assert buffer.items_in_front(0.6, 0.2, 0.9, 0.4, 5.0) == set()
+    # Overlaps it by 0.05 cm
+    assert buffer.items_in_front(0.55, 0.2, 0.9, 0.4, 5.0) == {"front"}
+
+
+def test_matches_footprint_index_for_fractional_coordinates():
+    rng = random.Random(7)
+    buffer = FrontDepthBuffer(tolerance=EPSILON)
+    index = FootprintIndex(tolerance=EPSILON)
+    for i in range(200):
+        box = (rng.uniform(0, 90), rng.uniform(0, 90), rng.uniform(0.1, 15), rng.uniform(0.1, 15), rng.uniform(0, 90))
+        buffer.add(f"i{i}", *box)
+        index.insert(f"i{i}", *box)
+
+    for i in range(0, 200, 3):
+        buffer.remove(f"i{i}")
+        index.remove(f"i{i}")
+
+    for _ in range(200):
+        x, z, width, height, y = (rng.uniform(0, 90), rng.uniform(0, 90), rng.uniform(0.1, 20),
+                                  rng.uniform(0.1, 20), rng.uniform(0, 90))
+        expected_front = {item_id for _, item_id in index.query(x, z, width, height, y_max=y)}
+        expected_behind = {item_id for _, item_id in index.query(x, z, width, height, y_min=y)}
+        assert buffer.items_in_front(x, z, width, height, y) == expected_front
+        assert buffer.items_behind(x, z, width, height, y) == expected_behind
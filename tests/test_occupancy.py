@@ -0,0 +1,29 @@
+import threading
+
+from models.container import Container
+from services.occupancy import OccupancyRegistry
+
+
+def test_registry_changes_wait_for_the_registry_lock():
+    registry = OccupancyRegistry()
+    container = Container(containerId="c1", zone="A", width=10, depth=10, height=10)
+    registry.place_item("old", container, (0, 0, 0), (5, 5, 5))
+
+    changes = [
+        threading.Thread(target=registry.place_item, args=("new", container, (5, 0, 0), (5, 5, 5))),
+        threading.Thread(target=registry.remove_item, args=("old",)),
+    ]
+    with registry._lock:
+        for thread in changes:
+            thread.start()
+        for thread in changes:
+            thread.join(0.1)
+            assert thread.is_alive()
+        assert registry.get_item_box("new") is None
+        assert registry.get_item_box("old") is not None
+
+    for thread in changes:
+        thread.join()
+    assert registry.get_item_box("new") == (5, 0, 0, 5, 5, 5)
+    assert registry.get_item_box("old") is None
+    assert registry.used_volumes["c1"] == 125
@@ -0,0 +1,117 @@
+import time
+
+import pytest
+
+from models.container import Container
+from models.item import Item
+from models.placement import ItemPlacement
+from services.optimization import PackingOptimizer
+from utils.space3d import Space3D
+
+
+def _item(item_id, size, location=None, waste=False):
+    item = Item(itemId=item_id, name=item_id, width=size[0], depth=size[1], height=size[2], mass=1,
+                priority=50, expiryDate="N/A", usageLimit=5, preferredZone="A")
+    if location is not None:
+        item.currentLocation = {"containerId": location[0], "position": location[1], "rotation": size}
+    item.isWaste = waste
+    return item
+
+
+def _replay(items, containers, target, steps):
+    """Apply rearrangement steps, checking every removal and placement is reachable from the open face"""
+    spaces = {c.containerId: Space3D(c.width, c.depth, c.height) for c in containers.values()}
+    for item in items.values():
+        if item.currentLocation:
+            assert spaces[item.currentLocation["containerId"]].place_item(
+                *item.currentLocation["position"], *item.currentLocation["rotation"], item_id=item.itemId
+            )
+
+    for step in steps:
+        if step.action == "remove":
+            space = spaces[step.fromContainer]
+            x, y, z, width, _, height = space.placed_items[step.itemId]
+            assert not space.depth_buffer.items_in_front(x, z, width, height, y - 1e-9)
+            assert space.remove_item(step.itemId)
+        else:
+            space = spaces[step.toContainer]
+            x, y, z = step.position
+            dims = next(placement.rotation for placement in target if placement.itemId == step.itemId)
+            assert not space.depth_buffer.items_in_front(x, z, dims[0], dims[2], y - 1e-9)
+            assert space.place_item(x, y, z, *dims, item_id=step.itemId)
+    return spaces
+
+
+def test_rearrangement_steps_reach_the_target_from_the_open_face():
+    containers = {
+        "c1": Container(containerId="c1", zone="A", width=10, depth=30, height=10),
+        "c2": Container(containerId="c2", zone="A", width=10, depth=30, height=10),
+    }
+    items = {
+        "front": _item("front", (10, 10, 10), ("c1", (0, 0, 0))),
+        "mid": _item("mid", (10, 10, 10), ("c1", (0, 10, 0))),
+        "back": _item("back", (10, 10, 10), ("c1", (0, 20, 0))),
+        "waste": _item("waste", (10, 10, 10), ("c2", (0, 20, 0)), waste=True),
+    }
+    # The back item moves to the front of c2; the others keep their place
+    target = [
+        ItemPlacement(itemId="front", containerId="c1", position=(0, 0, 0), rotation=(10, 10, 10)),
+        ItemPlacement(itemId="mid", containerId="c1", position=(0, 10, 0), rotation=(10, 10, 10)),
+        ItemPlacement(itemId="back", containerId="c2", position=(0, 0, 0), rotation=(10, 10, 10)),
+    ]
+    steps = PackingOptimizer()._rearrangement_steps(items, containers, target)
+
+    assert [(step.action, step.itemId) for step in steps] == [
+        ("remove", "front"), ("remove", "mid"), ("remove", "back"),
+        ("place", "mid"), ("place", "front"), ("place", "back"),
+    ]
+    spaces = _replay(items, containers, target, steps)
+    for placement in target:
+        assert spaces[placement.containerId].placed_items[placement.itemId][:3] == placement.position
+    assert set(spaces["c2"].placed_items) == {"back", "waste"}
+
+
+def test_rearrangement_steps_refuse_a_plan_that_drops_a_stowed_item():
+    containers = {"c1": Container(containerId="c1", zone="A", width=10, depth=20, height=10)}
+    items = {
+        "front": _item("front", (10, 10, 10), ("c1", (0, 0, 0))),
+        "back": _item("back", (10, 10, 10), ("c1", (0, 10, 0))),
+    }
+    target = [ItemPlacement(itemId="back", containerId="c1", position=(0, 0, 0), rotation=(10, 10, 10))]
+
+    with pytest.raises(ValueError, match="front"):
+        PackingOptimizer()._rearrangement_steps(items, containers, target)
+
+
+def test_optimize_never_unloads_a_stowed_item_for_more_volume():
+    # Only one of the two fits; the bigger unstowed one would win on volume alone
+    containers = {"c1": Container(containerId="c1", zone="A", width=10, depth=10, height=10)}
+    items = {
+        "small": _item("small", (5, 5, 5), ("c1", (0, 0, 0))),
+        "big": _item("big", (10, 10, 10)),
+    }
+    result = PackingOptimizer(population_size=8, generations=5).optimize(items, containers, seed=1)
+
+    assert [placement.itemId for placement in result.placements] == ["small"]
+    assert result.rearrangements == []
+
+
+def test_finished_jobs_are_evicted():
+    containers = {"c1": Container(containerId="c1", zone="A", width=10, depth=10, height=10)}
+    items = {"small": _item("small", (5, 5, 5))}
+    optimizer = PackingOptimizer(population_size=2, generations=1, max_jobs=2)
+
+    job_ids = []
+    for seed in range(4):
+        job_ids.append(optimizer.start_job(items, containers, seed=seed))
+        while optimizer.get_job(job_ids[-1])["status"] == "running":
+            time.sleep(0.01)
+
+    assert optimizer.get_job(job_ids[0]) is None
+    assert optimizer.get_job(job_ids[1]) is None
+    assert optimizer.get_job(job_ids[-1])["status"] == "completed"
+    assert len(optimizer.jobs) == 2
+
+    optimizer.job_ttl = 0.0
+    assert optimizer.get_job(job_ids[-1]) is None
+    assert optimizer.jobs == {}
@@ -0,0 +1,49 @@
+import numpy as np
+
+from services.placement import PlacementService
+from tests.test_placement import _cargo, _plan
+from utils import parallel_fit
+from utils.parallel_fit import _SharedTable, _table
+
+
+def _two_requests(service):
+    """Place half the cargo, then all of it around the now stowed half"""
+    items, containers = _cargo(4, 150, containers=12)
+    first = service.calculate_placement(dict(list(items.items())[:75]), containers)
+    return _plan(first), _plan(service.calculate_placement(items, containers))
+
+
+def test_workers_place_like_the_serial_loop():
+    serial = _two_requests(PlacementService())
+
+    service = PlacementService(workers=2, batch_size=4)
+    try:
+        assert _two_requests(service) == serial
+        evaluator = service.evaluator
+        # The pool outlives a single request
+        assert evaluator is not None
+        assert _two_requests(service) == serial
+        assert service.evaluator is evaluator
+    finally:
+        service.close()
+    assert service.evaluator is None
+    assert evaluator.free_tables == {} and evaluator.placed_tables == {}
+
+
+def test_workers_close_the_old_mapping_of_a_grown_table():
+    table = _SharedTable(slot=7)
+    try:
+        table.write(np.ones((2, 6)))
+        first = _table(table.ref())
+        old_block = parallel_fit._attached[7][1]
+        assert first.sum() == 12
+
+        table.write(np.full((50, 6), 2.0))  # Outgrows the block, which gets a new name
+        second = _table(table.ref())
+        assert second.shape == (50, 6) and second.sum() == 600
+        assert parallel_fit._attached[7][0] == table.block.name
+        assert old_block.buf is None
+    finally:
+        del first, second
+        parallel_fit._attached.pop(7)[1].close()
+        table.close()
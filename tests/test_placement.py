@@ -0,0 +1,134 @@
+import random
+import time
+
+import pytest
+
+from models.container import Container
+from models.item import Item
+from services.placement import PlacementService
+
+
+def _cargo(seed, count, zones=("A", "B", "C", "D"), containers=8):
+    rng = random.Random(seed)
+    container_map = {
+        f"c{index}": Container(containerId=f"c{index}", zone=zones[index % len(zones)],
+                               width=100, depth=85, height=200)
+        for index in range(containers)
+    }
+    items = {
+        f"i{index}": Item(itemId=f"i{index}", name=f"Item {index}", width=rng.randint(5, 40),
+                          depth=rng.randint(5, 40), height=rng.randint(5, 50), mass=1,
+                          priority=rng.randint(1, 100), expiryDate="N/A", usageLimit=5,
+                          preferredZone=rng.choice(zones))
+        for index in range(count)
+    }
+    return items, container_map
+
+
+@pytest.mark.parametrize("options", [
+    {},
+    {"by_zone": True},
+    {"restarts": 3},
+    {"strategy": "wall"},
+])
+def test_placement_returns_by_the_deadline(options):
+    items, containers = _cargo(0, 2000)
+    started = time.monotonic()
+    result = PlacementService().calculate_placement(items, containers, deadline_ms=200, **options)
+    elapsed = time.monotonic() - started
+
+    assert elapsed < 0.2 + 0.3  # One item or move past the deadline at most
+    assert 0 < len(result.placements) < len(items)
+
+
+def test_zero_budget_places_nothing():
+    items, containers = _cargo(0, 200)
+    result = PlacementService().calculate_placement(items, containers, deadline_ms=0)
+
+    assert result.placements == []
+
+
+def test_local_search_stops_once_no_move_improves():
+    items, containers = _cargo(1, 30)
+    started = time.monotonic()
+    result = PlacementService().calculate_placement(items, containers, deadline_ms=10000)
+
+    assert len(result.placements) == 30
+    assert time.monotonic() - started < 2.0
+
+
+def _plan(result):
+    return [(p.itemId, p.containerId, p.position, p.rotation) for p in result.placements]
+
+
+def _multi_start(seed, workers=0, **options):
+    items, containers = _cargo(2, 120, containers=4)
+    service = PlacementService(workers=workers)
+    # Part of the cargo is stowed already and must be kept out of the way
+    service.calculate_placement({item_id: items[item_id] for item_id in list(items)[:60]}, containers)
+    return service.calculate_placement(items, containers, restarts=4, seed=seed, **options)
+
+
+def test_multi_start_is_deterministic_per_seed():
+    first = _plan(_multi_start(3, deadline_ms=60000))
+    assert first == _plan(_multi_start(3, deadline_ms=60000))
+    assert first
+    # Worker processes try the same orders
+    assert first == _plan(_multi_start(3, workers=2, deadline_ms=60000))
+
+
+def test_multi_start_without_workers_or_deadline_is_a_single_pass():
+    items, containers = _cargo(2, 120, containers=4)
+    service = PlacementService()
+    service.calculate_placement({item_id: items[item_id] for item_id in list(items)[:60]}, containers)
+    single = service.calculate_placement(items, containers)
+
+    assert _plan(_multi_start(3)) == _plan(single)
+
+
+def _bulk_cargo(seed, count, containers=2):
+    rng = random.Random(seed)
+    shapes = [(20, 30, 25), (40, 20, 20), (25, 25, 50)]
+    container_map = {
+        f"c{index}": Container(containerId=f"c{index}", zone="A", width=100, depth=85, height=200)
+        for index in range(containers)
+    }
+    items = {}
+    for index in range(count):
+        # Mostly runs of a few box sizes, with some odd-sized items
+        width, depth, height = rng.choice(shapes) if rng.random() < 0.85 else (
+            rng.randint(5, 40), rng.randint(5, 40), rng.randint(5, 50)
+        )
+        items[f"i{index}"] = Item(itemId=f"i{index}", name=f"Item {index}", width=width, depth=depth,
+                                  height=height, mass=1, priority=rng.randint(1, 100), expiryDate="N/A",
+                                  usageLimit=5, preferredZone="A")
+    return items, container_map
+
+
+@pytest.mark.parametrize("cargo", [
+    lambda seed: _cargo(seed, 150, containers=2),
+    lambda seed: _bulk_cargo(seed, 250),
+])
+@pytest.mark.parametrize("seed", range(3))
+def test_wall_strategy_places_at_least_as_many_items_as_best_fit(cargo, seed):
+    best_fit = PlacementService().calculate_placement(*cargo(seed))
+    walls = PlacementService().calculate_placement(*cargo(seed), strategy="wall")
+
+    assert len(walls.placements) >= len(best_fit.placements)
+
+
+def test_stowed_items_are_synced_before_new_items_are_placed():
+    containers = {"c1": Container(containerId="c1", zone="A", width=10, depth=10, height=10)}
+    service = PlacementService()
+    service.calculate_placement({}, containers)  # Registry loaded while c1 was empty
+
+    # Stowed since, with a lower priority than the new item sorted before it
+    stowed = Item(itemId="stowed", name="stowed", width=10, depth=10, height=5, mass=1, priority=10,
+                  expiryDate="N/A", usageLimit=5, preferredZone="A")
+    stowed.currentLocation = {"containerId": "c1", "position": (0, 0, 0), "rotation": (10, 10, 5)}
+    new = Item(itemId="new", name="new", width=10, depth=10, height=10, mass=1, priority=90,
+               expiryDate="N/A", usageLimit=5, preferredZone="A")
+    result = service.calculate_placement({"stowed": stowed, "new": new}, containers)
+
+    assert result.placements == []
+    assert service.occupancy.get_item_box("stowed") == (0, 0, 0, 10, 10, 5)
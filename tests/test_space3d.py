@@ -0,0 +1,58 @@
+import random
+
+import numpy as np
+import pytest
+
+from utils.space3d import Space3D
+
+
+def _free_boxes(space):
+    return sorted(tuple(round(v, 6) for v in free.as_tuple()) for free in space.free_spaces)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_removals_leave_the_same_free_spaces_as_a_rebuild(seed):
+    rng = random.Random(seed)
+    space = Space3D(37, 29, 23)
+    for step in range(100):
+        if space.placed_items and rng.random() < 0.35:
+            space.remove_item(rng.choice(sorted(space.placed_items)))
+        else:
+            dims = (rng.randint(2, 12), rng.randint(2, 10), rng.randint(2, 8))
+            position = space.find_position(*dims)
+            if position is not None:
+                space.place_item(*position, *dims, item_id=f"i{step}")
+
+        rebuilt = Space3D(37, 29, 23)
+        for item_id, box in space.placed_items.items():
+            assert rebuilt.place_item(*box, item_id=item_id)
+        assert _free_boxes(space) == _free_boxes(rebuilt)
+        assert np.array_equal(space.free_space_array(), space._as_array(space.free_spaces))
+
+
+class _WatchedBoxes(dict):
+    """Placed boxes that record lookups and refuse full scans"""
+
+    def __init__(self, boxes):
+        super().__init__(boxes)
+        self.looked_up = set()
+
+    def __getitem__(self, item_id):
+        self.looked_up.add(item_id)
+        return super().__getitem__(item_id)
+
+    def values(self):
+        raise AssertionError("scanned every placed box")
+
+
+def test_removal_only_looks_at_boxes_around_the_freed_one():
+    space = Space3D(100, 50, 10)
+    for index in range(10):
+        assert space.place_item(10 * index, 0, 0, 10, 10, 10, item_id=f"front{index}")
+        assert space.place_item(10 * index, 40, 0, 10, 10, 10, item_id=f"back{index}")
+    space.placed_items = _WatchedBoxes(space.placed_items)
+
+    assert space.remove_item("front4")
+    # The back row lies beyond the free space the freed slot opens onto
+    assert space.placed_items.looked_up == {f"front{index}" for index in range(10) if index != 4}
+    assert _free_boxes(space) == [(0.0, 10.0, 0.0, 100.0, 30.0, 10.0), (40.0, 0.0, 0.0, 10.0, 40.0, 10.0)]
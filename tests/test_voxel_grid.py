@@ -0,0 +1,72 @@
+import random
+
+import numpy as np
+import pytest
+
+from cargo_visualization import CargoVisualizer
+from utils.octree import OctreeVoxelGrid
+from utils.voxel_grid import PackedVoxelGrid
+
+
+def _random_box(rng, shape):
+    dims = tuple(rng.randint(1, max(1, size // 2)) for size in shape)
+    start = tuple(rng.randint(0, size - dim) for size, dim in zip(shape, dims))
+    return start, dims
+
+
+@pytest.mark.parametrize("backend", [PackedVoxelGrid, OctreeVoxelGrid])
+def test_backends_match_a_boolean_grid(backend):
+    rng = random.Random(11)
+    shape = (13, 9, 21)  # height is not a multiple of 8
+    grid = backend(*shape)
+    dense = np.zeros(shape, dtype=bool)
+    for _ in range(15):
+        (x, y, z), (w, d, h) = _random_box(rng, shape)
+        grid.fill_box((x, y, z), (w, d, h))
+        dense[x:x + w, y:y + d, z:z + h] = True
+
+    assert np.array_equal(grid.to_dense(), dense)
+    assert grid.count() == dense.sum()
+    for d_start in range(shape[1]):
+        for d_size in range(1, shape[1] - d_start + 1):
+            assert np.array_equal(grid.slab(d_start, d_size), dense[:, d_start:d_start + d_size])
+    for _ in range(200):
+        (x, y, z), (w, d, h) = _random_box(rng, shape)
+        box = dense[x:x + w, y:y + d, z:z + h]
+        assert grid.any_in_box((x, y, z), (w, d, h)) == box.any()
+        assert grid.count_in_box((x, y, z), (w, d, h)) == box.sum()
+
+
+@pytest.mark.parametrize("backend", ["packed", "octree"])
+def test_valid_positions_match_a_brute_force_scan(backend):
+    rng = random.Random(5)
+    visualizer = CargoVisualizer(occupancy_backend=backend)
+    visualizer.add_container("c1", "A", 12, 10, 11)
+    dense = np.zeros((12, 10, 11), dtype=bool)
+    for index in range(6):
+        (x, y, z), (w, d, h) = _random_box(rng, (12, 10, 11))
+        visualizer.add_item(f"i{index}", "box", w, d, h, 1, 50, None, 1, "A")
+        if visualizer.place_item(f"i{index}", "c1", (x, y, z)):
+            dense[x:x + w, y:y + d, z:z + h] = True
+
+    for item_dims in [(1, 1, 1), (3, 2, 4), (5, 5, 2), (12, 1, 1)]:
+        w, d, h = item_dims
+        expected = np.array([
+            [[not dense[x:x + w, y:y + d, z:z + h].any() for z in range(11 - h + 1)]
+             for y in range(10 - d + 1)]
+            for x in range(12 - w + 1)
+        ])
+        assert np.array_equal(visualizer.find_valid_positions("c1", item_dims), expected)
+        assert np.array_equal(visualizer.find_valid_positions_fft("c1", item_dims), expected)
+
+
+def test_searches_keep_only_the_occupancy_grid():
+    visualizer = CargoVisualizer()
+    visualizer.add_container("c1", "A", 40, 40, 40)
+    for index in range(10):
+        visualizer.add_item(f"i{index}", "box", 10, 10, 10, 1, 50, None, 1, "A")
+
+    assert len(visualizer.optimize_placement(method="scan")["placements"]) == 10
+    visualizer.add_item("extra", "box", 10, 10, 10, 1, 50, None, 1, "A")
+    assert len(visualizer.optimize_placement(method="fft")["placements"]) == 1
+    assert set(visualizer.containers["c1"]) == {"zone", "width", "depth", "height", "occupancy"}
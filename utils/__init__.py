@@ -0,0 +1 @@
+# The utils package
\ No newline at end of file
@@ -0,0 +1,108 @@
+from typing import Dict, Iterable, List, Set
+import heapq
+
+from utils.spatial_index import FootprintIndex
+
+
+class BlockingGraph:
+    """Directed "A blocks B" graph over the boxes stowed in one container
+
+    A box blocks another if it starts closer to the open face (lower y) and
+    overlaps it in the x-z plane, the same rule Space3D uses to count
+    blockers. Edges always point further back, so the graph is acyclic.
+    Adding or removing a box only updates the edges of its neighbours, found
+    through the container's footprint index.
+
+    Args:
+        tolerance: depth differences up to this do not make a box block another
+    """
+
+    def __init__(self, tolerance: float = 0.0):
+        self.tolerance = tolerance
+        self.blockers: Dict[str, Set[str]] = {}  # item -> items blocking it
+        self.blocked: Dict[str, Set[str]] = {}   # item -> items it blocks
+
+    def add(self, item_id: str, box, footprints: FootprintIndex) -> None:
+        """Add a box and its edges; footprints is the index it is stored in"""
+        if item_id in self.blockers:
+            self.remove(item_id)
+
+        x, y, z, width, _, height = box
+        in_front = footprints.query(x, z, width, height, y_max=y - self.tolerance)
+        behind = footprints.query(x, z, width, height, y_min=y + self.tolerance)
+
+        self.blockers[item_id] = {other for _, other in in_front if other != item_id}
+        self.blocked[item_id] = {other for _, other in behind if other != item_id}
+
+        for other in self.blockers[item_id]:
+            self.blocked[other].add(item_id)
+        for other in self.blocked[item_id]:
+            self.blockers[other].add(item_id)
+
+    def copy(self) -> "BlockingGraph":
+        """Independent copy of the graph, e.g. for trial edits"""
+        clone = BlockingGraph(self.tolerance)
+        clone.blockers = {item_id: set(others) for item_id, others in self.blockers.items()}
+        clone.blocked = {item_id: set(others) for item_id, others in self.blocked.items()}
+        return clone
+
+    def remove(self, item_id: str) -> bool:
+        """Remove a box and its edges"""
+        if item_id not in self.blockers:
+            return False
+
+        for other in self.blockers.pop(item_id):
+            self.blocked[other].discard(item_id)
+        for other in self.blocked.pop(item_id):
+            self.blockers[other].discard(item_id)
+        return True
+
+    def transitive_blockers(self, item_id: str) -> Set[str]:
+        """Get every box that has to move before this one can be taken out"""
+        found: Set[str] = set()
+        stack = list(self.blockers.get(item_id, ()))
+        while stack:
+            other = stack.pop()
+            if other in found:
+                continue
+            found.add(other)
+            stack.extend(self.blockers[other])
+        return found
+
+    def removal_order(self, item_ids: Iterable[str]) -> List[str]:
+        """Order boxes so every box comes after all boxes transitively blocking it
+
+        Boxes with no constraint between them keep their order in item_ids.
+        Boxes that are not in the graph keep their position relative to the
+        rest as well.
+        """
+        item_ids = list(dict.fromkeys(item_ids))
+        rank = {item_id: index for index, item_id in enumerate(item_ids)}
+
+        # Blockers outside the requested set still order the ones inside it
+        closure = {item_id for item_id in item_ids if item_id in self.blockers}
+        for item_id in list(closure):
+            closure |= self.transitive_blockers(item_id)
+
+        def key(item_id):
+            return (rank.get(item_id, len(item_ids)), item_id)
+
+        # Kahn's algorithm, always taking the earliest-ranked ready box
+        pending = {item_id: len(self.blockers[item_id]) for item_id in closure}
+        ready = [key(item_id) for item_id, count in pending.items() if count == 0]
+        heapq.heapify(ready)
+        ordered = []
+        while ready:
+            _, item_id = heapq.heappop(ready)
+            ordered.append(item_id)
+            for other in self.blocked[item_id]:
+                if other in pending:
+                    pending[other] -= 1
+                    if pending[other] == 0:
+                        heapq.heappush(ready, key(other))
+
+        ordered = [item_id for item_id in ordered if item_id in rank]
+
+        # Put the untracked boxes back into their slots
+        result = iter(ordered)
+        return [item_id if item_id not in self.blockers else next(result) for item_id in item_ids]
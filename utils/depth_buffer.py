@@ -0,0 +1,111 @@
+from bisect import bisect_left, insort
+from typing import Dict, List, Set, Tuple
+import math
+
+# Cell = (column along x, row along z)
+Cell = Tuple[int, int]
+
+
+class FrontDepthBuffer:
+    """Grid over the open face (y=0) of a container with the items behind each cell
+
+    Every cell of the x-z grid keeps the (y, item_id) pairs of the boxes
+    whose footprint touches it, ordered by depth. Placing or removing a box
+    only touches the cells of its footprint, and the items in front of (or
+    behind) any footprint are read from those cells alone.
+
+    Cells are coarse, so the items read from them are only candidates; each
+    one is checked against the exact footprint before it is returned, which
+    keeps results exact for any (fractional) coordinates.
+
+    Args:
+        cell_size: edge length of a grid cell in cm
+        tolerance: footprints must overlap by more than this to match
+    """
+
+    def __init__(self, cell_size: float = 10.0, tolerance: float = 0.0):
+        self.cell_size = cell_size
+        self.tolerance = tolerance
+        self.cells: Dict[Cell, List[Tuple[float, str]]] = {}
+        self.item_cells: Dict[str, Tuple[float, List[Cell]]] = {}  # item_id -> (y, cells)
+        self.footprints: Dict[str, Tuple[float, float, float, float]] = {}  # item_id -> (x0, z0, x1, z1)
+
+    def _footprint(self, x: float, z: float, width: float, height: float) -> List[Cell]:
+        """Get the cells a footprint touches"""
+        size = self.cell_size
+        first_column = math.floor(x / size)
+        last_column = math.floor((x + width) / size)
+        first_row = math.floor(z / size)
+        last_row = math.floor((z + height) / size)
+        return [
+            (column, row)
+            for column in range(first_column, last_column + 1)
+            for row in range(first_row, last_row + 1)
+        ]
+
+    def _overlaps(self, item_id: str, x: float, z: float, width: float, height: float) -> bool:
+        """Check a recorded footprint against a rectangle, as the footprint R-tree does"""
+        x0, z0, x1, z1 = self.footprints[item_id]
+        tolerance = self.tolerance
+        return (x0 < x + width - tolerance and x < x1 - tolerance and
+                z0 < z + height - tolerance and z < z1 - tolerance)
+
+    def add(self, item_id: str, x: float, z: float, width: float, height: float, y: float) -> None:
+        """Record a box starting at depth y with the given x-z footprint"""
+        if item_id in self.item_cells:
+            self.remove(item_id)
+
+        cells = self._footprint(x, z, width, height)
+        entry = (y, item_id)
+        for cell in cells:
+            insort(self.cells.setdefault(cell, []), entry)
+        self.item_cells[item_id] = (y, cells)
+        self.footprints[item_id] = (x, z, x + width, z + height)
+
+    def copy(self) -> "FrontDepthBuffer":
+        """Independent copy of the buffer, e.g. for trial edits"""
+        clone = FrontDepthBuffer(self.cell_size, self.tolerance)
+        clone.cells = {cell: list(stack) for cell, stack in self.cells.items()}
+        clone.item_cells = dict(self.item_cells)
+        clone.footprints = dict(self.footprints)
+        return clone
+
+    def remove(self, item_id: str) -> bool:
+        """Forget a box; returns False if it was not recorded"""
+        recorded = self.item_cells.pop(item_id, None)
+        if recorded is None:
+            return False
+
+        del self.footprints[item_id]
+        y, cells = recorded
+        entry = (y, item_id)
+        for cell in cells:
+            stack = self.cells[cell]
+            del stack[bisect_left(stack, entry)]
+            if not stack:
+                del self.cells[cell]
+        return True
+
+    def stack(self, column: int, row: int) -> List[str]:
+        """Get the item IDs touching one cell, closest to the open face first"""
+        return [item_id for _, item_id in self.cells.get((column, row), [])]
+
+    def items_in_front(self, x: float, z: float, width: float, height: float, y: float) -> Set[str]:
+        """Get the items starting closer to the open face than y over a footprint"""
+        candidates = set()
+        for cell in self._footprint(x, z, width, height):
+            stack = self.cells.get(cell)
+            if stack:
+                end = bisect_left(stack, (y, ""))
+                candidates.update(item_id for _, item_id in stack[:end])
+        return {item_id for item_id in candidates if self._overlaps(item_id, x, z, width, height)}
+
+    def items_behind(self, x: float, z: float, width: float, height: float, y: float) -> Set[str]:
+        """Get the items starting at depth y or further back over a footprint"""
+        candidates = set()
+        for cell in self._footprint(x, z, width, height):
+            stack = self.cells.get(cell)
+            if stack:
+                start = bisect_left(stack, (y, ""))
+                candidates.update(item_id for _, item_id in stack[start:])
+        return {item_id for item_id in candidates if self._overlaps(item_id, x, z, width, height)}
@@ -0,0 +1,207 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+from utils.space3d import EPSILON
+
+class FitCandidates:
+    """Feasible (container, rotation, position) placements for one item
+
+    All attributes are parallel arrays with one entry per candidate.
+    """
+
+    def __init__(
+        self,
+        container_index: np.ndarray,
+        rotation_index: np.ndarray,
+        positions: np.ndarray,
+        dimensions: np.ndarray,
+        complexity: np.ndarray,
+        scores: np.ndarray
+    ):
+        self.container_index = container_index
+        self.rotation_index = rotation_index
+        self.positions = positions
+        self.dimensions = dimensions
+        self.complexity = complexity
+        self.scores = scores
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+    def best_index(self) -> Optional[int]:
+        """Get the index of the best candidate, or None if there are none
+
+        Highest score wins; ties go to the earlier container, then the earlier
+        rotation, then the position closest to the open face, lowest and
+        left-most.
+        """
+        if len(self.scores) == 0:
+            return None
+
+        order = np.lexsort((
+            self.positions[:, 0],
+            self.positions[:, 2],
+            self.positions[:, 1],
+            self.rotation_index,
+            self.container_index,
+            -self.scores
+        ))
+        return int(order[0])
+
+
+def evaluate_fit_candidates(
+    rotations: Sequence[Sequence[float]],
+    container_dims: np.ndarray,
+    free_tables: List[np.ndarray],
+    placed_tables: List[np.ndarray],
+    base_scores: np.ndarray,
+    complexity_penalty: float = 50.0
+) -> FitCandidates:
+    """Test every rotation of an item against every container's free spaces at once
+
+    Args:
+        rotations: (R, 3) rotated (width, depth, height) dimensions of the item
+        container_dims: (C, 3) container (width, depth, height)
+        free_tables: per container, an (F, 6) table of maximal empty spaces
+        placed_tables: per container, a (P, 6) table of placed boxes
+        base_scores: (C,) score of placing the item in each container before
+            the retrieval penalty; -inf skips the container
+        complexity_penalty: score lost per item blocking the candidate
+
+    Returns:
+        Every feasible candidate (placed at the origin of a free space it fits
+        in) with its retrieval complexity and final score
+    """
+    rotations = np.asarray(rotations, dtype=float).reshape(-1, 3)
+    container_dims = np.asarray(container_dims, dtype=float).reshape(-1, 3)
+    base_scores = np.asarray(base_scores, dtype=float)
+
+    # Stack the free spaces of all usable containers into one table
+    counts = np.array([len(table) for table in free_tables], dtype=int)
+    owners = np.repeat(np.arange(len(free_tables)), counts)
+    free = np.concatenate(free_tables) if counts.sum() else np.empty((0, 6))
+
+    usable = np.isfinite(base_scores)[owners]
+    free = free[usable]
+    owners = owners[usable]
+
+    # (R, F) feasibility: the rotation fits both the container and the free space
+    fits_container = np.all(rotations[:, None, :] <= container_dims[None, :, :] + EPSILON, axis=2)
+    fits_space = np.all(rotations[:, None, :] <= free[None, :, 3:6] + EPSILON, axis=2)
+    feasible = fits_space & fits_container[:, owners]
+
+    rotation_index, space_index = np.nonzero(feasible)
+    container_index = owners[space_index]
+    positions = free[space_index, :3]
+    dimensions = rotations[rotation_index]
+
+    # Retrieval complexity: placed boxes of the same container in front of the
+    # candidate (lower y) that overlap it in the x-z plane
+    complexity = np.zeros(len(space_index), dtype=int)
+    order = np.argsort(container_index, kind="stable")
+    boundaries = np.flatnonzero(np.diff(container_index[order])) + 1
+    for segment in np.split(order, boundaries):
+        if len(segment) == 0:
+            continue
+
+        placed = placed_tables[container_index[segment[0]]]
+        if len(placed) == 0:
+            continue
+
+        x = positions[segment, 0:1]
+        y = positions[segment, 1:2]
+        z = positions[segment, 2:3]
+        width = dimensions[segment, 0:1]
+        height = dimensions[segment, 2:3]
+
+        blocking = (
+            (placed[None, :, 1] < y - EPSILON) &
+            (placed[None, :, 0] < x + width - EPSILON) &
+            (x < placed[None, :, 0] + placed[None, :, 3] - EPSILON) &
+            (placed[None, :, 2] < z + height - EPSILON) &
+            (z < placed[None, :, 2] + placed[None, :, 5] - EPSILON)
+        )
+        complexity[segment] = blocking.sum(axis=1)
+
+    scores = base_scores[container_index] - complexity * complexity_penalty
+
+    return FitCandidates(
+        container_index=container_index,
+        rotation_index=rotation_index,
+        positions=positions,
+        dimensions=dimensions,
+        complexity=complexity,
+        scores=scores
+    )
+
+
+class ShapeFitCache:
+    """Unscored fit candidates per (item shape, container), kept until the container changes
+
+    Identical items share their candidates: after a placement only the
+    container that received the item is evaluated again, so a run of
+    identical items costs one kernel pass per container it touches instead
+    of one pass over all containers per item.
+    """
+
+    def __init__(self):
+        # (shape, container index) -> ((model id, model version), candidates)
+        self.entries: Dict[Tuple[tuple, int], Tuple[Tuple[int, int], FitCandidates]] = {}
+
+    def container_candidates(
+        self,
+        shape: tuple,
+        rotations: Sequence[Sequence[float]],
+        container_index: int,
+        container_dims: np.ndarray,
+        space
+    ) -> FitCandidates:
+        """Get the candidates of one container (scored 0, before any penalty)"""
+        stamp = (id(space), space.version)
+        key = (shape, container_index)
+        cached = self.entries.get(key)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+
+        candidates = evaluate_fit_candidates(
+            rotations,
+            container_dims[container_index:container_index + 1],
+            [space.free_space_array()],
+            [space.placed_array()],
+            np.zeros(1),
+            complexity_penalty=0.0
+        )
+        candidates.container_index = np.full(len(candidates), container_index, dtype=int)
+        self.entries[key] = (stamp, candidates)
+        return candidates
+
+    def evaluate(
+        self,
+        shape: tuple,
+        rotations: Sequence[Sequence[float]],
+        container_dims: np.ndarray,
+        spaces: list,
+        base_scores: np.ndarray,
+        complexity_penalty: float = 50.0
+    ) -> FitCandidates:
+        """Same result as evaluate_fit_candidates, reusing cached containers"""
+        parts = [
+            self.container_candidates(shape, rotations, index, container_dims, spaces[index])
+            for index in range(len(spaces)) if np.isfinite(base_scores[index])
+        ]
+        if not parts:
+            parts = [FitCandidates(
+                np.empty(0, dtype=int), np.empty(0, dtype=int), np.empty((0, 3)),
+                np.empty((0, 3)), np.empty(0, dtype=int), np.empty(0)
+            )]
+
+        container_index = np.concatenate([part.container_index for part in parts])
+        complexity = np.concatenate([part.complexity for part in parts])
+        return FitCandidates(
+            container_index=container_index,
+            rotation_index=np.concatenate([part.rotation_index for part in parts]),
+            positions=np.concatenate([part.positions for part in parts]),
+            dimensions=np.concatenate([part.dimensions for part in parts]),
+            complexity=complexity,
+            scores=np.asarray(base_scores, dtype=float)[container_index] - complexity * complexity_penalty
+        )
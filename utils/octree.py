@@ -0,0 +1,170 @@
+from itertools import product
+from typing import List, Tuple, Union
+import sys
+import numpy as np
+
+Shape = Tuple[int, int, int]
+Bounds = Tuple[int, int, int, int, int, int]  # (x0, y0, z0, x1, y1, z1)
+
+# A node is False (all empty), True (all occupied) or a list of child nodes
+Node = Union[bool, list]
+
+
+def _split(bounds: Bounds) -> List[Bounds]:
+    """Split a node's bounds in half along every axis longer than one voxel"""
+    ranges = []
+    for axis in range(3):
+        low, high = bounds[axis], bounds[axis + 3]
+        if high - low > 1:
+            middle = (low + high) // 2
+            ranges.append(((low, middle), (middle, high)))
+        else:
+            ranges.append(((low, high),))
+    return [
+        (x[0], y[0], z[0], x[1], y[1], z[1])
+        for x, y, z in product(*ranges)
+    ]
+
+
+def _overlap(bounds: Bounds, box: Bounds) -> Shape:
+    """Get the size of the intersection of two boxes along each axis (0 if disjoint)"""
+    return tuple(
+        max(0, min(bounds[axis + 3], box[axis + 3]) - max(bounds[axis], box[axis]))
+        for axis in range(3)
+    )
+
+
+def _covers(box: Bounds, bounds: Bounds) -> bool:
+    """Check if box contains bounds"""
+    return all(box[axis] <= bounds[axis] and bounds[axis + 3] <= box[axis + 3] for axis in range(3))
+
+
+class OctreeVoxelGrid:
+    """Sparse octree occupancy grid over (width, depth, height) voxels
+
+    Fully empty and fully occupied regions are stored as a single leaf, so
+    memory and query time follow the surface of the stowed items instead of
+    the volume of the container. Box queries only descend into mixed nodes.
+    Offers the same interface as PackedVoxelGrid.
+    """
+
+    def __init__(self, width: int, depth: int, height: int):
+        self.shape: Shape = (int(width), int(depth), int(height))
+        self.root: Node = False
+
+    @property
+    def bounds(self) -> Bounds:
+        """Get the bounds of the root node (the whole container)"""
+        return (0, 0, 0) + self.shape
+
+    @property
+    def nbytes(self) -> int:
+        """Get the approximate memory used by the tree's inner nodes"""
+        total = 0
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, list):
+                total += sys.getsizeof(node)
+                stack.extend(node)
+        return total
+
+    @staticmethod
+    def _as_bounds(start: Shape, dims: Shape) -> Bounds:
+        return tuple(start) + tuple(s + d for s, d in zip(start, dims))
+
+    def _fill(self, node: Node, bounds: Bounds, box: Bounds) -> Node:
+        if node is True or 0 in _overlap(bounds, box):
+            return node
+
+        children = _split(bounds)
+        if _covers(box, bounds) or len(children) == 1:
+            return True
+
+        nodes = node if isinstance(node, list) else [False] * len(children)
+        nodes = [self._fill(child, child_bounds, box) for child, child_bounds in zip(nodes, children)]
+
+        # Collapse children that are all occupied
+        if all(child is True for child in nodes):
+            return True
+        return nodes
+
+    def _any(self, node: Node, bounds: Bounds, box: Bounds) -> bool:
+        if node is False or 0 in _overlap(bounds, box):
+            return False
+        if node is True:
+            return True
+        return any(
+            self._any(child, child_bounds, box)
+            for child, child_bounds in zip(node, _split(bounds))
+        )
+
+    def _count(self, node: Node, bounds: Bounds, box: Bounds) -> int:
+        if node is False:
+            return 0
+        overlap = _overlap(bounds, box)
+        if 0 in overlap:
+            return 0
+        if node is True:
+            return overlap[0] * overlap[1] * overlap[2]
+        return sum(
+            self._count(child, child_bounds, box)
+            for child, child_bounds in zip(node, _split(bounds))
+        )
+
+    def fill_box(self, start: Shape, dims: Shape) -> None:
+        """Mark every voxel of a box as occupied"""
+        if min(dims) <= 0:
+            return
+        self.root = self._fill(self.root, self.bounds, self._as_bounds(start, dims))
+
+    def any_in_box(self, start: Shape, dims: Shape) -> bool:
+        """Check if any voxel of a box is occupied"""
+        if min(dims) <= 0:
+            return False
+        return self._any(self.root, self.bounds, self._as_bounds(start, dims))
+
+    def count_in_box(self, start: Shape, dims: Shape) -> int:
+        """Count the occupied voxels of a box"""
+        if min(dims) <= 0:
+            return 0
+        return self._count(self.root, self.bounds, self._as_bounds(start, dims))
+
+    def count(self) -> int:
+        """Count all occupied voxels"""
+        return self._count(self.root, self.bounds, self.bounds)
+
+    def occupied_boxes(self) -> List[Tuple[Shape, Shape]]:
+        """Get the fully occupied leaves as (start, dims) boxes"""
+        boxes = []
+        stack = [(self.root, self.bounds)]
+        while stack:
+            node, bounds = stack.pop()
+            if node is True:
+                boxes.append((bounds[:3], tuple(bounds[axis + 3] - bounds[axis] for axis in range(3))))
+            elif isinstance(node, list):
+                stack.extend(zip(node, _split(bounds)))
+        return boxes
+
+    def to_dense(self) -> np.ndarray:
+        """Expand the tree into a (width, depth, height) boolean array"""
+        dense = np.zeros(self.shape, dtype=bool)
+        for (x, y, z), (width, depth, height) in self.occupied_boxes():
+            dense[x:x + width, y:y + depth, z:z + height] = True
+        return dense
+
+    def slab(self, d_start: int, d_size: int) -> np.ndarray:
+        """Expand the depth range [d_start, d_start + d_size) into a (width, d_size, height) boolean array"""
+        slab = np.zeros((self.shape[0], d_size, self.shape[2]), dtype=bool)
+        d_end = d_start + d_size
+        stack = [(self.root, self.bounds)]
+        while stack:
+            node, bounds = stack.pop()
+            if node is False or bounds[1] >= d_end or bounds[4] <= d_start:
+                continue
+            if node is True:
+                x0, y0, z0, x1, y1, z1 = bounds
+                slab[x0:x1, max(y0, d_start) - d_start:min(y1, d_end) - d_start, z0:z1] = True
+            else:
+                stack.extend(zip(node, _split(bounds)))
+        return slab
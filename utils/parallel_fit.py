@@ -0,0 +1,236 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Sequence, Tuple
+import itertools
+import threading
+import weakref
+import numpy as np
+
+from utils.fit_kernel import FitCandidates, evaluate_fit_candidates
+from utils.space3d import Space3D
+
+# (slot, name, row count) of a shared (n, 6) float64 box table; a slot is
+# one table of one evaluator and gets a new name whenever its block grows
+TableRef = Tuple[int, str, int]
+
+# Best candidate of one container: sort key, rotation index, position. The
+# key orders candidates as FitCandidates.best_index does, in global
+# container indices, so the best of several containers is the smallest key
+ContainerBest = Tuple[tuple, int, Tuple[float, float, float]]
+
+# One item to evaluate: its rotations and its base score per container
+FitRequest = Tuple[Sequence[Tuple[float, float, float]], np.ndarray]
+
+# Shared memory blocks a worker process has attached to: slot -> (name, block)
+_attached: Dict[int, Tuple[str, shared_memory.SharedMemory]] = {}
+
+
+def _table(ref: TableRef) -> np.ndarray:
+    """Get a read-only view of a shared box table inside a worker
+
+    A slot that arrives with a new name was reallocated by the parent, so the
+    mapping of its old block is closed instead of being kept forever.
+    """
+    slot, name, rows = ref
+    attached = _attached.get(slot)
+    if attached is None or attached[0] != name:
+        if attached is not None:
+            attached[1].close()
+        # Workers share the parent's resource tracker, which already knows
+        # the block; the parent unlinks it when the evaluator is closed
+        attached = (name, shared_memory.SharedMemory(name=name))
+        _attached[slot] = attached
+    return np.ndarray((rows, 6), dtype=np.float64, buffer=attached[1].buf)
+
+
+def container_bests(candidates: FitCandidates, container_indices: Sequence[int]) -> Dict[int, ContainerBest]:
+    """Get the best candidate of every container that has one
+
+    container_indices maps the candidates' container indices to global ones.
+    """
+    if len(candidates) == 0:
+        return {}
+
+    global_index = np.asarray(container_indices, dtype=int)[candidates.container_index]
+    order = np.lexsort((
+        candidates.positions[:, 0],
+        candidates.positions[:, 2],
+        candidates.positions[:, 1],
+        candidates.rotation_index,
+        global_index,
+        -candidates.scores
+    ))
+    # The first candidate of every container in that order is its best
+    _, first = np.unique(global_index[order], return_index=True)
+
+    bests = {}
+    for candidate in order[first]:
+        container_index = int(global_index[candidate])
+        rotation_index = int(candidates.rotation_index[candidate])
+        x, y, z = (float(v) for v in candidates.positions[candidate])
+        key = (-float(candidates.scores[candidate]), container_index, rotation_index, y, z, x)
+        bests[container_index] = (key, rotation_index, (x, y, z))
+    return bests
+
+
+def _evaluate_shard(
+    requests: List[FitRequest],
+    container_indices: List[int],
+    container_dims: np.ndarray,
+    free_refs: List[TableRef],
+    placed_refs: List[TableRef],
+    complexity_penalty: float
+) -> List[Dict[int, ContainerBest]]:
+    """Find the best candidate per container of a shard for a batch of items (runs in a worker)"""
+    free_tables = [_table(ref) for ref in free_refs]
+    placed_tables = [_table(ref) for ref in placed_refs]
+    results = []
+    for rotations, base_scores in requests:
+        candidates = evaluate_fit_candidates(
+            rotations,
+            container_dims,
+            free_tables,
+            placed_tables,
+            base_scores,
+            complexity_penalty=complexity_penalty
+        )
+        results.append(container_bests(candidates, container_indices))
+    return results
+
+
+class _SharedTable:
+    """A growable (n, 6) box table in shared memory"""
+
+    def __init__(self, slot: int):
+        self.slot = slot
+        self.block: Optional[shared_memory.SharedMemory] = None
+        self.rows = 0
+
+    def write(self, table: np.ndarray) -> None:
+        needed = max(1, len(table)) * 6 * 8
+        if self.block is None or self.block.size < needed:
+            self.close()
+            self.block = shared_memory.SharedMemory(create=True, size=needed * 2)
+        np.ndarray(table.shape, dtype=np.float64, buffer=self.block.buf)[:] = table
+        self.rows = len(table)
+
+    def ref(self) -> TableRef:
+        return self.slot, self.block.name, self.rows
+
+    def close(self) -> None:
+        if self.block is not None:
+            self.block.close()
+            self.block.unlink()
+            self.block = None
+
+
+def _release(executor: ProcessPoolExecutor, table_maps: List[Dict[str, _SharedTable]]) -> None:
+    """Stop an evaluator's workers and free its shared memory"""
+    executor.shutdown(wait=True)
+    for tables in table_maps:
+        for table in tables.values():
+            table.close()
+        tables.clear()
+
+
+class ParallelFitEvaluator:
+    """Run the fit kernel over shards of containers in a process pool
+
+    The evaluator is meant to live as long as its owner: the pool is started
+    once and the free space and placed box tables of every container stay
+    in shared memory, rewritten only for containers whose model changed. A
+    batch of items costs one round trip per shard, and each worker reports
+    the best candidate of every container of its shard, so the caller can
+    re-evaluate just the containers that change while it commits the batch.
+    Results do not depend on the number of workers. The workers and the
+    shared memory are released by close(), or when the evaluator is
+    garbage collected or the interpreter exits.
+
+    Args:
+        workers: number of worker processes
+        shards: number of container shards per batch (defaults to workers)
+    """
+
+    def __init__(self, workers: int, shards: Optional[int] = None):
+        self.workers = workers
+        self.shards = shards or workers
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+        self.free_tables: Dict[str, _SharedTable] = {}  # container key -> table
+        self.placed_tables: Dict[str, _SharedTable] = {}
+        self.versions: Dict[str, Tuple[int, int]] = {}  # container key -> (model id, version)
+        self._slots = itertools.count()
+        self.lock = threading.Lock()
+        self._finalizer = weakref.finalize(
+            self, _release, self.executor, [self.free_tables, self.placed_tables]
+        )
+
+    def __enter__(self) -> "ParallelFitEvaluator":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Stop the workers and free the shared memory"""
+        with self.lock:
+            self._finalizer()
+            self.versions.clear()
+
+    def _sync(self, key: str, space: Space3D) -> None:
+        """Copy a container's tables to shared memory if its model changed"""
+        stamp = (id(space), space.version)
+        if self.versions.get(key) == stamp:
+            return
+
+        if key not in self.free_tables:
+            self.free_tables[key] = _SharedTable(next(self._slots))
+            self.placed_tables[key] = _SharedTable(next(self._slots))
+        self.free_tables[key].write(space.free_space_array())
+        self.placed_tables[key].write(space.placed_array())
+        self.versions[key] = stamp
+
+    def evaluate(
+        self,
+        requests: List[FitRequest],
+        container_dims: np.ndarray,
+        spaces: List[Space3D],
+        keys: Sequence[str],
+        complexity_penalty: float = 50.0
+    ) -> List[Dict[int, ContainerBest]]:
+        """Get the best candidate per container index for every item of a batch
+
+        keys name the containers (e.g. their IDs) so their shared tables can
+        be reused across calls. Containers an item fits in nowhere, or whose
+        base score is -inf, are missing from its result.
+        """
+        usable = [
+            index for index in range(len(spaces))
+            if any(np.isfinite(base_scores[index]) for _, base_scores in requests)
+        ]
+        results: List[Dict[int, ContainerBest]] = [{} for _ in requests]
+        if not usable:
+            return results
+
+        with self.lock:
+            for index in usable:
+                self._sync(keys[index], spaces[index])
+
+            futures = []
+            for shard in np.array_split(np.array(usable, dtype=int), min(self.shards, len(usable))):
+                if len(shard) == 0:
+                    continue
+                shard = [int(index) for index in shard]
+                futures.append(self.executor.submit(
+                    _evaluate_shard,
+                    [(list(rotations), base_scores[shard]) for rotations, base_scores in requests],
+                    shard,
+                    container_dims[shard],
+                    [self.free_tables[keys[index]].ref() for index in shard],
+                    [self.placed_tables[keys[index]].ref() for index in shard],
+                    complexity_penalty
+                ))
+
+            for future in futures:
+                for result, shard_bests in zip(results, future.result()):
+                    result.update(shard_bests)
+        return results
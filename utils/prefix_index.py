@@ -0,0 +1,103 @@
+from bisect import bisect_left, insort
+from heapq import nsmallest
+from typing import Dict, Iterable, List, Tuple
+
+
+class PrefixIndex:
+    """Sorted array of short texts for ranked prefix completion
+
+    Every key (an item ID) has a few texts (its ID and name), matched case
+    insensitively, and a rank (lower is better). The texts matching a prefix
+    are one contiguous run of the array, found by bisection. Runs longer
+    than cache_threshold keep their best keys cached per prefix until one of
+    their keys changes, so each keystroke costs a lookup and a short sort.
+    """
+
+    def __init__(self, cache_threshold: int = 64, cache_size: int = 32):
+        self.cache_threshold = cache_threshold
+        self.cache_size = cache_size
+
+        self.entries: List[Tuple[str, str]] = []  # (text, key), sorted
+        self.texts: Dict[str, Tuple[str, ...]] = {}
+        self.ranks: Dict[str, tuple] = {}
+
+        # Best keys of the prefixes with long runs, best first
+        self.top_cache: Dict[str, List[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.texts
+
+    def add(self, key: str, texts: Iterable[str], rank: tuple) -> None:
+        """Index a key under its texts with a rank, replacing its old entries"""
+        texts = tuple(dict.fromkeys(text.lower() for text in texts))
+        if self.texts.get(key) == texts and self.ranks.get(key) == rank:
+            return
+        self.remove(key)
+
+        self.texts[key] = texts
+        self.ranks[key] = rank
+        for text in texts:
+            insort(self.entries, (text, key))
+        self._invalidate(texts)
+
+    def add_many(self, entries: Iterable[Tuple[str, Iterable[str], tuple]]) -> None:
+        """Index many (key, texts, rank) entries with a single sort of the array"""
+        pending = {key: (texts, rank) for key, texts, rank in entries}
+        for key in pending:
+            self.remove(key)
+
+        for key, (texts, rank) in pending.items():
+            texts = tuple(dict.fromkeys(text.lower() for text in texts))
+            self.texts[key] = texts
+            self.ranks[key] = rank
+            self.entries.extend((text, key) for text in texts)
+
+        self.entries.sort()
+        self.top_cache.clear()
+
+    def remove(self, key: str) -> None:
+        """Drop a key from the index (unknown keys are ignored)"""
+        texts = self.texts.pop(key, None)
+        if texts is None:
+            return
+
+        del self.ranks[key]
+        for text in texts:
+            del self.entries[bisect_left(self.entries, (text, key))]
+        self._invalidate(texts)
+
+    def complete(self, prefix: str, limit: int = 10) -> List[str]:
+        """Get up to limit keys with a text starting with the prefix, best rank first"""
+        prefix = prefix.lower()
+        cached = self.top_cache.get(prefix)
+        if cached is not None and limit <= self.cache_size:
+            return cached[:limit]
+
+        start = bisect_left(self.entries, (prefix, ""))
+        end = start
+        while end < len(self.entries) and self.entries[end][0].startswith(prefix):
+            end += 1
+            if end - start > self.cache_threshold:
+                # Long run: find its end by bisection instead
+                end = bisect_left(self.entries, (prefix + "\U0010ffff", ""), end)
+                break
+
+        keys = {key for _, key in self.entries[start:end]}
+        if end - start <= self.cache_threshold:
+            return sorted(keys, key=self._rank_key)[:limit]
+
+        best = nsmallest(max(limit, self.cache_size), keys, key=self._rank_key)
+        self.top_cache[prefix] = best[:self.cache_size]
+        return best[:limit]
+
+    def _rank_key(self, key: str) -> tuple:
+        return self.ranks[key] + (key,)
+
+    def _invalidate(self, texts: Tuple[str, ...]) -> None:
+        """Forget the cached completions of every prefix of the texts"""
+        for text in texts:
+            for length in range(len(text) + 1):
+                self.top_cache.pop(text[:length], None)
@@ -0,0 +1,417 @@
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+from utils.spatial_index import FootprintIndex
+from utils.depth_buffer import FrontDepthBuffer
+from utils.blocking_graph import BlockingGraph
+
+# Tolerance used for all floating point comparisons (cm)
+EPSILON = 1e-9
+
+Box = Tuple[float, float, float, float, float, float]
+
+
+def _containment_matrix(inner: np.ndarray, outer: np.ndarray) -> np.ndarray:
+    """For (m, 6) and (n, 6) box tables, get the (m, n) mask of inner[i] inside outer[j]"""
+    inner = inner[:, None, :]
+    outer = outer[None, :, :]
+    return np.all(
+        (outer[..., :3] <= inner[..., :3] + EPSILON) &
+        (inner[..., :3] + inner[..., 3:] <= outer[..., :3] + outer[..., 3:] + EPSILON),
+        axis=2
+    )
+
+
+class FreeSpace:
+    """An axis-aligned empty cuboid inside a container
+
+    Coordinates follow the rest of the system: x is width, y is depth
+    (the open face of the container is at y=0) and z is height.
+    """
+
+    __slots__ = ("x", "y", "z", "width", "depth", "height")
+
+    def __init__(self, x: float, y: float, z: float, width: float, depth: float, height: float):
+        self.x = x
+        self.y = y
+        self.z = z
+        self.width = width
+        self.depth = depth
+        self.height = height
+
+    def get_volume(self) -> float:
+        """Get the volume of the free space in cubic cm"""
+        return self.width * self.depth * self.height
+
+    def can_fit(self, width: float, depth: float, height: float) -> bool:
+        """Check if a box with the given (already rotated) dimensions fits"""
+        return (width <= self.width + EPSILON and
+                depth <= self.depth + EPSILON and
+                height <= self.height + EPSILON)
+
+    def intersects(self, x: float, y: float, z: float, width: float, depth: float, height: float) -> bool:
+        """Check if this space overlaps a box with positive volume"""
+        return (x < self.x + self.width - EPSILON and self.x < x + width - EPSILON and
+                y < self.y + self.depth - EPSILON and self.y < y + depth - EPSILON and
+                z < self.z + self.height - EPSILON and self.z < z + height - EPSILON)
+
+    def contains(self, x: float, y: float, z: float, width: float, depth: float, height: float) -> bool:
+        """Check if a box lies completely inside this space"""
+        return (self.x <= x + EPSILON and x + width <= self.x + self.width + EPSILON and
+                self.y <= y + EPSILON and y + depth <= self.y + self.depth + EPSILON and
+                self.z <= z + EPSILON and z + height <= self.z + self.height + EPSILON)
+
+    def contains_space(self, other: "FreeSpace") -> bool:
+        """Check if another free space lies completely inside this one"""
+        return self.contains(other.x, other.y, other.z, other.width, other.depth, other.height)
+
+    def as_tuple(self) -> Box:
+        """Get the space as an (x, y, z, width, depth, height) tuple"""
+        return (self.x, self.y, self.z, self.width, self.depth, self.height)
+
+    def __repr__(self) -> str:
+        return f"FreeSpace({self.x}, {self.y}, {self.z}, {self.width}, {self.depth}, {self.height})"
+
+
+class Space3D:
+    """3D occupancy model of a container backed by maximal empty spaces
+
+    Free space is kept as the set of maximal empty cuboids (EMS): every empty
+    box in the container lies inside at least one of them, and none of them
+    can be grown in any direction. Placing an item only splits the spaces it
+    overlaps and removing one only rebuilds the spaces around the freed box,
+    so ``find_position`` is a lookup over candidate free boxes instead of a
+    scan of the container.
+    """
+
+    def __init__(self, width: float, depth: float, height: float):
+        self.width = width
+        self.depth = depth
+        self.height = height
+
+        # Maximal empty spaces, initially the whole container
+        self.free_spaces: List[FreeSpace] = [FreeSpace(0, 0, 0, width, depth, height)]
+
+        # Placed boxes keyed by item ID (anonymous placements get a generated key)
+        self.placed_items: Dict[str, Box] = {}
+        self._anonymous_count = 0
+
+        # R-tree over the x-z footprints of the placed boxes, by starting depth
+        self.footprints = FootprintIndex(tolerance=EPSILON)
+
+        # Items stacked behind every 10 cm cell of the open face, by depth
+        self.depth_buffer = FrontDepthBuffer(tolerance=EPSILON)
+
+        # "A blocks B" edges between the placed boxes
+        self.blocking = BlockingGraph(tolerance=EPSILON)
+
+        # Incremented on every change so callers can cache derived data
+        self.version = 0
+        self._array_cache: Dict[str, Tuple[int, np.ndarray]] = {}
+
+    def find_position(self, width: float, depth: float, height: float) -> Optional[Tuple[float, float, float]]:
+        """Find the best position for a box with the given (rotated) dimensions
+
+        Candidates are the origins of the maximal empty spaces the box fits in.
+        The position closest to the open face (lowest y) wins, then the lowest
+        and left-most one. Returns None if the box does not fit anywhere.
+        """
+        best_space = None
+        best_key = None
+
+        for space in self.free_spaces:
+            if not space.can_fit(width, depth, height):
+                continue
+
+            key = (space.y, space.z, space.x)
+            if best_key is None or key < best_key:
+                best_key = key
+                best_space = space
+
+        if best_space is None:
+            return None
+
+        return (best_space.x, best_space.y, best_space.z)
+
+    def can_place(self, x: float, y: float, z: float, width: float, depth: float, height: float) -> bool:
+        """Check if a box can be placed at the given position
+
+        A box is empty exactly when some maximal empty space contains it.
+        """
+        if (x < -EPSILON or y < -EPSILON or z < -EPSILON or
+                x + width > self.width + EPSILON or
+                y + depth > self.depth + EPSILON or
+                z + height > self.height + EPSILON):
+            return False
+
+        return any(space.contains(x, y, z, width, depth, height) for space in self.free_spaces)
+
+    def place_item(
+        self,
+        x: float,
+        y: float,
+        z: float,
+        width: float,
+        depth: float,
+        height: float,
+        item_id: Optional[str] = None
+    ) -> bool:
+        """Mark a box as occupied and update the free spaces incrementally
+
+        Returns False (and leaves the model untouched) if the box is out of
+        bounds or overlaps something already placed.
+        """
+        if item_id is not None and item_id in self.placed_items:
+            return False
+
+        if not self.can_place(x, y, z, width, depth, height):
+            return False
+
+        if item_id is None:
+            self._anonymous_count += 1
+            item_id = f"__anonymous_{self._anonymous_count}"
+
+        box = (x, y, z, width, depth, height)
+        self.placed_items[item_id] = box
+        self.footprints.insert(item_id, x, z, width, height, y)
+        self.depth_buffer.add(item_id, x, z, width, height, y)
+        self.blocking.add(item_id, box, self.footprints)
+        self._subtract_box(box)
+        return True
+
+    def copy(self) -> "Space3D":
+        """Independent copy of the model, e.g. for trial placements and removals
+
+        Free spaces and boxes are never changed in place, so only the lists,
+        dicts and indexes holding them are copied.
+        """
+        clone = Space3D.__new__(Space3D)
+        clone.__dict__.update(self.__dict__)
+        clone.free_spaces = list(self.free_spaces)
+        clone.placed_items = dict(self.placed_items)
+        clone.footprints = self.footprints.copy()
+        clone.depth_buffer = self.depth_buffer.copy()
+        clone.blocking = self.blocking.copy()
+        clone._array_cache = {}
+        return clone
+
+    def remove_item(self, item_id: str) -> bool:
+        """Free the box occupied by an item and update the free spaces incrementally
+
+        Spaces that do not touch the freed box stay maximal, so only the
+        maximal spaces overlapping the freed box are rebuilt. Those lie within
+        the freed box and the old spaces touching it, so only the placed boxes
+        the footprint index finds in that region are looked at. Spaces that
+        can now grow into the freed box are replaced by the rebuilt ones.
+        """
+        box = self.placed_items.pop(item_id, None)
+        if box is None:
+            return False
+
+        self.footprints.remove(item_id)
+        self.depth_buffer.remove(item_id)
+        self.blocking.remove(item_id)
+
+        # Region the rebuilt spaces can reach: every empty point of a space
+        # overlapping the freed box sees the box through an old space
+        free = self.free_space_array()
+        low = np.array(box[:3], dtype=float)
+        high = low + box[3:]
+        touching = ((free[:, :3] <= high + EPSILON) & (free[:, :3] + free[:, 3:] >= low - EPSILON)).all(axis=1)
+        if touching.any():
+            low = np.minimum(low, free[touching, :3].min(axis=0))
+            high = np.maximum(high, (free[touching, :3] + free[touching, 3:]).max(axis=0))
+        region = FreeSpace(*(float(v) for v in low), *(float(v) for v in high - low))
+
+        # Placed boxes overlapping the region, from the footprint index
+        neighbours = [
+            self.placed_items[other]
+            for _, other in self.footprints.query(
+                region.x, region.z, region.width, region.height, y_max=region.y + region.depth - EPSILON
+            )
+            if self.placed_items[other][1] + self.placed_items[other][4] > region.y + EPSILON
+        ]
+
+        # Rebuild the maximal spaces of the region, keeping only pieces that
+        # overlap the freed box (their sub-pieces never will either). Boxes
+        # nearest the freed one cut the pieces down first, so most of the
+        # others no longer touch any piece.
+        def gap(other):
+            return sum(
+                max(0.0, other[axis] - (box[axis] + box[axis + 3]), box[axis] - (other[axis] + other[axis + 3]))
+                for axis in range(3)
+            )
+
+        pieces = [region]
+        for other in sorted(neighbours, key=gap):
+            next_pieces = []
+            split = False
+            for piece in pieces:
+                if piece.intersects(*other):
+                    next_pieces.extend(
+                        p for p in self._split_space(piece, other) if p.intersects(*box)
+                    )
+                    split = True
+                else:
+                    next_pieces.append(piece)
+            if split:
+                pieces = self._maximal_only(next_pieces)
+
+        # Old spaces that can grow into the freed box are no longer maximal;
+        # only the freed box could have stopped them, so they touch it
+        swallowed = np.zeros(len(free), dtype=bool)
+        swallowed[touching] = _containment_matrix(free[touching], self._as_array(pieces)).any(axis=1)
+        kept = [space for space, gone in zip(self.free_spaces, swallowed) if not gone]
+
+        self._set_free_spaces(kept + pieces, np.vstack([free[~swallowed], self._as_array(pieces)]))
+        return True
+
+    def calculate_retrieval_complexity(
+        self,
+        x: float,
+        y: float,
+        z: float,
+        width: float,
+        depth: float,
+        height: float,
+        ignore_item_id: Optional[str] = None
+    ) -> int:
+        """Count placed boxes between a box and the open face of the container
+
+        A placed box blocks retrieval if it starts closer to the open face
+        (lower y) and overlaps the box in the x-z plane. Read from the front
+        face depth buffer, so the cost follows the area of the footprint.
+        """
+        in_front = self.depth_buffer.items_in_front(x, z, width, height, y - EPSILON)
+        in_front.discard(ignore_item_id)
+        return len(in_front)
+
+    def get_used_volume(self) -> float:
+        """Get the total volume of placed boxes in cubic cm"""
+        return sum(box[3] * box[4] * box[5] for box in self.placed_items.values())
+
+    def free_summary(self) -> Tuple[float, float, float, float]:
+        """Get the largest free (width, depth, height) along each axis and the largest free box volume
+
+        Every box that can still be placed fits inside one maximal empty
+        space, so it can be no larger than these bounds.
+        """
+        free = self.free_space_array()
+        if len(free) == 0:
+            return (0.0, 0.0, 0.0, 0.0)
+
+        extents = free[:, 3:6]
+        width, depth, height = (float(v) for v in extents.max(axis=0))
+        return (width, depth, height, float(extents.prod(axis=1).max()))
+
+    def get_free_spaces(self) -> List[FreeSpace]:
+        """Get the current maximal empty spaces"""
+        return list(self.free_spaces)
+
+    def free_space_array(self) -> np.ndarray:
+        """Get the maximal empty spaces as an (n, 6) array of x, y, z, width, depth, height
+
+        The array is cached until the model changes and must not be modified.
+        """
+        return self._cached_array("free", lambda: [space.as_tuple() for space in self.free_spaces])
+
+    def placed_array(self) -> np.ndarray:
+        """Get the placed boxes as an (n, 6) array of x, y, z, width, depth, height
+
+        The array is cached until the model changes and must not be modified.
+        """
+        return self._cached_array("placed", lambda: list(self.placed_items.values()))
+
+    def _cached_array(self, name: str, build_rows) -> np.ndarray:
+        """Build an (n, 6) box table once per model version"""
+        cached = self._array_cache.get(name)
+        if cached is not None and cached[0] == self.version:
+            return cached[1]
+
+        array = np.array(build_rows(), dtype=float).reshape(-1, 6)
+        self._array_cache[name] = (self.version, array)
+        return array
+
+    def _subtract_box(self, box: Box) -> None:
+        """Remove a newly occupied box from the set of maximal empty spaces, as a new model version"""
+        x, y, z, width, depth, height = box
+        free = self.free_space_array()
+        hit = (
+            (free[:, 0] < x + width - EPSILON) & (x < free[:, 0] + free[:, 3] - EPSILON) &
+            (free[:, 1] < y + depth - EPSILON) & (y < free[:, 1] + free[:, 4] - EPSILON) &
+            (free[:, 2] < z + height - EPSILON) & (z < free[:, 2] + free[:, 5] - EPSILON)
+        )
+
+        kept = []
+        pieces = []
+        for space, overlaps in zip(self.free_spaces, hit):
+            if overlaps:
+                pieces.extend(self._split_space(space, box))
+            else:
+                kept.append(space)
+
+        # A split piece may be swallowed by an untouched space or by another
+        # piece; untouched spaces can never be swallowed by a piece
+        pieces = self._maximal_only(pieces)
+        swallowed = _containment_matrix(self._as_array(pieces), free[~hit]).any(axis=1)
+        maximal_pieces = [piece for piece, gone in zip(pieces, swallowed) if not gone]
+
+        self._set_free_spaces(
+            kept + maximal_pieces, np.vstack([free[~hit], self._as_array(pieces)[~swallowed]])
+        )
+
+    def _set_free_spaces(self, spaces: List[FreeSpace], array: np.ndarray) -> None:
+        """Replace the maximal empty spaces as a new model version, with their box table cached"""
+        self.version += 1
+        self.free_spaces = spaces
+        self._array_cache["free"] = (self.version, array)
+
+    @staticmethod
+    def _split_space(space: FreeSpace, box: Box) -> List[FreeSpace]:
+        """Split a free space by an overlapping box into up to six maximal pieces"""
+        x, y, z, width, depth, height = box
+        pieces = []
+
+        # Left and right of the box (x-axis)
+        if x > space.x + EPSILON:
+            pieces.append(FreeSpace(space.x, space.y, space.z, x - space.x, space.depth, space.height))
+        if x + width < space.x + space.width - EPSILON:
+            pieces.append(FreeSpace(x + width, space.y, space.z,
+                                    space.x + space.width - (x + width), space.depth, space.height))
+
+        # In front of and behind the box (y-axis)
+        if y > space.y + EPSILON:
+            pieces.append(FreeSpace(space.x, space.y, space.z, space.width, y - space.y, space.height))
+        if y + depth < space.y + space.depth - EPSILON:
+            pieces.append(FreeSpace(space.x, y + depth, space.z,
+                                    space.width, space.y + space.depth - (y + depth), space.height))
+
+        # Below and above the box (z-axis)
+        if z > space.z + EPSILON:
+            pieces.append(FreeSpace(space.x, space.y, space.z, space.width, space.depth, z - space.z))
+        if z + height < space.z + space.height - EPSILON:
+            pieces.append(FreeSpace(space.x, space.y, z + height,
+                                    space.width, space.depth, space.z + space.height - (z + height)))
+
+        return pieces
+
+    @staticmethod
+    def _as_array(spaces: List[FreeSpace]) -> np.ndarray:
+        """Convert free spaces to an (n, 6) box table"""
+        return np.array([space.as_tuple() for space in spaces], dtype=float).reshape(-1, 6)
+
+    @staticmethod
+    def _maximal_only(spaces: List[FreeSpace]) -> List[FreeSpace]:
+        """Drop spaces contained in another space (keeping one copy of duplicates)"""
+        if len(spaces) < 2:
+            return list(spaces)
+
+        inside = _containment_matrix(Space3D._as_array(spaces), Space3D._as_array(spaces))
+        np.fill_diagonal(inside, False)
+
+        # Identical spaces contain each other; keep the first copy only
+        identical = inside & inside.T
+        later_copy = np.triu(np.ones_like(inside), k=1)
+        swallowed = (inside & ~(identical & later_copy)).any(axis=1)
+
+        return [space for space, gone in zip(spaces, swallowed) if not gone]
@@ -0,0 +1,204 @@
+from typing import Dict, List, Optional, Tuple
+
+# Bounding record of a node or entry: x0, z0, x1, z1, y_min, y_max
+Bounds = List[float]
+
+
+class _Node:
+    """R-tree node; leaf entries are (bounds, item_id) pairs, inner entries are nodes"""
+
+    __slots__ = ("leaf", "entries", "bounds")
+
+    def __init__(self, leaf: bool, entries: Optional[list] = None):
+        self.leaf = leaf
+        self.entries = entries if entries is not None else []
+        self.bounds: Optional[Bounds] = None
+        self.refresh()
+
+    def copy(self) -> "_Node":
+        """Copy of the subtree; leaf entries are shared, they are never changed in place"""
+        clone = _Node.__new__(_Node)
+        clone.leaf = self.leaf
+        clone.entries = list(self.entries) if self.leaf else [child.copy() for child in self.entries]
+        clone.bounds = self.bounds
+        return clone
+
+    def entry_bounds(self, entry) -> Bounds:
+        return entry[0] if self.leaf else entry.bounds
+
+    def refresh(self) -> None:
+        """Recompute the node's bounds from its entries"""
+        all_bounds = [self.entry_bounds(entry) for entry in self.entries]
+        if not all_bounds:
+            self.bounds = None
+            return
+        self.bounds = [
+            min(b[0] for b in all_bounds), min(b[1] for b in all_bounds),
+            max(b[2] for b in all_bounds), max(b[3] for b in all_bounds),
+            min(b[4] for b in all_bounds), max(b[5] for b in all_bounds)
+        ]
+
+
+def _area(bounds: Bounds) -> float:
+    return (bounds[2] - bounds[0]) * (bounds[3] - bounds[1])
+
+
+def _union(a: Bounds, b: Bounds) -> Bounds:
+    return [
+        min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]),
+        min(a[4], b[4]), max(a[5], b[5])
+    ]
+
+
+class FootprintIndex:
+    """R-tree over the x-z footprints of the boxes stowed in one container
+
+    Every entry also carries the depth (y) at which its box starts, and each
+    node keeps the depth range below it, so "what overlaps this footprint
+    between these depths" only visits the part of the tree near the query.
+
+    Args:
+        tolerance: footprints must overlap by more than this to match
+        max_entries: node capacity before it is split
+    """
+
+    def __init__(self, tolerance: float = 0.0, max_entries: int = 8):
+        self.tolerance = tolerance
+        self.max_entries = max_entries
+        self.root = _Node(leaf=True)
+        self.entries: Dict[str, Bounds] = {}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def insert(self, item_id: str, x: float, z: float, width: float, height: float, y: float) -> None:
+        """Add (or move) the footprint of a box starting at depth y"""
+        if item_id in self.entries:
+            self.remove(item_id)
+
+        bounds = [x, z, x + width, z + height, y, y]
+        self.entries[item_id] = bounds
+
+        sibling = self._insert(self.root, (bounds, item_id))
+        if sibling is not None:
+            self.root = _Node(leaf=False, entries=[self.root, sibling])
+
+    def copy(self) -> "FootprintIndex":
+        """Independent copy of the index, e.g. for trial edits"""
+        clone = FootprintIndex(self.tolerance, self.max_entries)
+        clone.root = self.root.copy()
+        clone.entries = dict(self.entries)
+        return clone
+
+    def remove(self, item_id: str) -> bool:
+        """Remove the footprint of a box; returns False if it is not indexed"""
+        bounds = self.entries.pop(item_id, None)
+        if bounds is None:
+            return False
+
+        self._remove(self.root, bounds, item_id)
+
+        # Shrink the tree while the root only forwards to a single child
+        while not self.root.leaf and len(self.root.entries) == 1:
+            self.root = self.root.entries[0]
+        if not self.root.leaf and not self.root.entries:
+            self.root = _Node(leaf=True)
+        return True
+
+    def query(
+        self,
+        x: float,
+        z: float,
+        width: float,
+        height: float,
+        y_min: float = float("-inf"),
+        y_max: float = float("inf")
+    ) -> List[Tuple[float, str]]:
+        """Find boxes whose footprint overlaps a rectangle in the x-z plane
+
+        Only boxes starting at a depth in [y_min, y_max) are returned, as
+        (y, item_id) pairs ordered by depth.
+        """
+        window = [x, z, x + width, z + height, y_min, y_max]
+        found = []
+        if self.root.bounds is not None:
+            self._query(self.root, window, found)
+        found.sort()
+        return found
+
+    def _query(self, node: _Node, window: Bounds, found: List[Tuple[float, str]]) -> None:
+        tolerance = self.tolerance
+        for entry in node.entries:
+            bounds = node.entry_bounds(entry)
+            if not (bounds[0] < window[2] - tolerance and window[0] < bounds[2] - tolerance and
+                    bounds[1] < window[3] - tolerance and window[1] < bounds[3] - tolerance and
+                    bounds[5] >= window[4] and bounds[4] < window[5]):
+                continue
+            if node.leaf:
+                found.append((bounds[4], entry[1]))
+            else:
+                self._query(entry, window, found)
+
+    def _insert(self, node: _Node, entry) -> Optional[_Node]:
+        """Insert below a node; returns the new sibling if the node was split"""
+        if node.leaf:
+            node.entries.append(entry)
+        else:
+            # Descend into the child needing the least enlargement
+            bounds = entry[0]
+            child = min(
+                node.entries,
+                key=lambda c: (_area(_union(c.bounds, bounds)) - _area(c.bounds), _area(c.bounds))
+            )
+            sibling = self._insert(child, entry)
+            if sibling is not None:
+                node.entries.append(sibling)
+
+        if len(node.entries) > self.max_entries:
+            return self._split(node)
+
+        if node.bounds is None:
+            node.refresh()
+        else:
+            node.bounds = _union(node.bounds, entry[0])
+        return None
+
+    def _split(self, node: _Node) -> _Node:
+        """Split an overflowing node in two halves along its wider axis"""
+        centers = [
+            ((b[0] + b[2]) / 2, (b[1] + b[3]) / 2)
+            for b in (node.entry_bounds(entry) for entry in node.entries)
+        ]
+        spread_x = max(c[0] for c in centers) - min(c[0] for c in centers)
+        spread_z = max(c[1] for c in centers) - min(c[1] for c in centers)
+        axis = 0 if spread_x >= spread_z else 1
+
+        order = sorted(range(len(node.entries)), key=lambda i: centers[i][axis])
+        half = len(order) // 2
+        entries = node.entries
+        node.entries = [entries[i] for i in order[:half]]
+        node.refresh()
+        return _Node(leaf=node.leaf, entries=[entries[i] for i in order[half:]])
+
+    def _remove(self, node: _Node, bounds: Bounds, item_id: str) -> bool:
+        """Remove an entry below a node, dropping emptied children"""
+        if node.leaf:
+            for index, entry in enumerate(node.entries):
+                if entry[1] == item_id:
+                    del node.entries[index]
+                    node.refresh()
+                    return True
+            return False
+
+        for index, child in enumerate(node.entries):
+            child_bounds = child.bounds
+            if not (child_bounds[0] <= bounds[0] and bounds[2] <= child_bounds[2] and
+                    child_bounds[1] <= bounds[1] and bounds[3] <= child_bounds[3] and
+                    child_bounds[4] <= bounds[4] <= child_bounds[5]):
+                continue
+            if self._remove(child, bounds, item_id):
+                if not child.entries:
+                    del node.entries[index]
+                node.refresh()
+                return True
+        return False
@@ -0,0 +1,96 @@
+from typing import Dict, Iterable, Set, Tuple
+
+
+class TrigramIndex:
+    """Inverted index from the character trigrams of short texts to their keys
+
+    Every key (an item ID) has a few texts (its ID and name), matched case
+    insensitively. A substring query of three or more characters intersects
+    the posting lists of its trigrams, smallest first, and only checks the
+    keys left over. Shorter queries read the posting lists of the trigrams
+    containing them, plus the keys with texts too short to have a trigram.
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, Set[str]] = {}
+        self.texts: Dict[str, Tuple[str, ...]] = {}
+
+        # Trigrams by the one- and two-character strings they contain
+        self.grams_by_part: Dict[str, Set[str]] = {}
+
+        # Keys with a text shorter than a trigram
+        self.short_keys: Set[str] = set()
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.texts
+
+    def add(self, key: str, texts: Iterable[str]) -> None:
+        """Index a key under its texts, replacing what it was indexed under before"""
+        texts = tuple(text.lower() for text in texts)
+        if self.texts.get(key) == texts:
+            return
+        self.remove(key)
+
+        self.texts[key] = texts
+        for text in texts:
+            if len(text) < 3:
+                self.short_keys.add(key)
+        for gram in self._trigrams(texts):
+            postings = self.postings.get(gram)
+            if postings is None:
+                postings = self.postings[gram] = set()
+                for part in {gram[0], gram[1], gram[2], gram[:2], gram[1:]}:
+                    self.grams_by_part.setdefault(part, set()).add(gram)
+            postings.add(key)
+
+    def remove(self, key: str) -> None:
+        """Drop a key from the index (unknown keys are ignored)"""
+        texts = self.texts.pop(key, None)
+        if texts is None:
+            return
+
+        self.short_keys.discard(key)
+        for gram in self._trigrams(texts):
+            postings = self.postings[gram]
+            postings.discard(key)
+            if not postings:
+                # Keep the vocabulary to the trigrams still in use
+                del self.postings[gram]
+                for part in {gram[0], gram[1], gram[2], gram[:2], gram[1:]}:
+                    grams = self.grams_by_part[part]
+                    grams.discard(gram)
+                    if not grams:
+                        del self.grams_by_part[part]
+
+    def search(self, query: str) -> Set[str]:
+        """Get the keys with a text containing the query (case insensitive)"""
+        query = query.lower()
+        if not query:
+            return set(self.texts)
+
+        if len(query) <= 3:
+            # A trigram containing the query is itself part of a text, so
+            # these keys match as they are; only the short texts are checked
+            found = {key for key in self.short_keys if any(query in text for text in self.texts[key])}
+            for gram in self.grams_by_part.get(query, ()) if len(query) < 3 else (query,):
+                found |= self.postings.get(gram, set())
+            return found
+
+        lists = []
+        for gram in self._trigrams((query,)):
+            postings = self.postings.get(gram)
+            if postings is None:
+                return set()
+            lists.append(postings)
+        lists.sort(key=len)
+        candidates = lists[0].intersection(*lists[1:])
+
+        # Trigrams can all occur without the query occurring as a whole
+        return {key for key in candidates if any(query in text for text in self.texts[key])}
+
+    @staticmethod
+    def _trigrams(texts: Iterable[str]) -> Set[str]:
+        return {text[i:i + 3] for text in texts for i in range(len(text) - 2)}
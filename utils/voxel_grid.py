@@ -0,0 +1,103 @@
+from typing import List, Tuple
+import numpy as np
+
+Shape = Tuple[int, int, int]
+
+# Number of set bits in every byte value
+_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+
+class PackedVoxelGrid:
+    """Bit-packed 3D occupancy grid with one bit per voxel
+
+    Voxels are indexed (width, depth, height). Every (width, depth) column is
+    packed along the height axis, 8 voxels per byte (bit k of byte b is
+    height 8 * b + k), so the grid takes an eighth of the memory of a
+    boolean array of the same shape.
+    """
+
+    def __init__(self, width: int, depth: int, height: int):
+        self.shape: Shape = (int(width), int(depth), int(height))
+        self.bits = np.zeros((self.shape[0], self.shape[1], (self.shape[2] + 7) // 8), dtype=np.uint8)
+
+    @property
+    def nbytes(self) -> int:
+        """Get the memory used by the occupancy bits"""
+        return self.bits.nbytes
+
+    def _height_mask(self, h_start: int, h_size: int) -> Tuple[slice, np.ndarray]:
+        """Get the byte range and bit mask covering heights [h_start, h_start + h_size)"""
+        first = h_start // 8
+        last = (h_start + h_size + 7) // 8
+        column = np.zeros((last - first) * 8, dtype=bool)
+        column[h_start - first * 8:h_start + h_size - first * 8] = True
+        return slice(first, last), np.packbits(column, bitorder="little")
+
+    def _box(self, start: Shape, dims: Shape) -> Tuple[np.ndarray, np.ndarray]:
+        """Get a view of the bytes under a box and the height mask to apply to them"""
+        w_start, d_start, h_start = start
+        w_size, d_size, h_size = dims
+        byte_range, mask = self._height_mask(h_start, h_size)
+        view = self.bits[w_start:w_start + w_size, d_start:d_start + d_size, byte_range]
+        return view, mask
+
+    def fill_box(self, start: Shape, dims: Shape) -> None:
+        """Mark every voxel of a box as occupied"""
+        if min(dims) <= 0:
+            return
+        view, mask = self._box(start, dims)
+        view |= mask
+
+    def any_in_box(self, start: Shape, dims: Shape) -> bool:
+        """Check if any voxel of a box is occupied"""
+        if min(dims) <= 0:
+            return False
+        view, mask = self._box(start, dims)
+        return bool((view & mask).any())
+
+    def count_in_box(self, start: Shape, dims: Shape) -> int:
+        """Count the occupied voxels of a box"""
+        if min(dims) <= 0:
+            return 0
+        view, mask = self._box(start, dims)
+        return int(_POPCOUNT[view & mask].sum(dtype=np.int64))
+
+    def count(self) -> int:
+        """Count all occupied voxels"""
+        return int(_POPCOUNT[self.bits].sum(dtype=np.int64))
+
+    def to_dense(self) -> np.ndarray:
+        """Unpack the grid into a (width, depth, height) boolean array"""
+        return np.unpackbits(self.bits, axis=2, count=self.shape[2], bitorder="little").astype(bool)
+
+    def slab(self, d_start: int, d_size: int) -> np.ndarray:
+        """Unpack the depth range [d_start, d_start + d_size) into a (width, d_size, height) boolean array"""
+        bits = self.bits[:, d_start:d_start + d_size, :]
+        return np.unpackbits(bits, axis=2, count=self.shape[2], bitorder="little").astype(bool)
+
+    def occupied_boxes(self) -> List[Tuple[Shape, Shape]]:
+        """Get the occupied voxels as (start, dims) boxes
+
+        Each box is a run of occupied voxels along the height axis, merged
+        with identical runs of neighbouring columns along the depth axis.
+        """
+        dense = self.to_dense()
+        padded = np.pad(dense, ((0, 0), (0, 0), (1, 1)))
+        edges = np.diff(padded.astype(np.int8), axis=2)
+        run_starts = np.argwhere(edges == 1)
+        run_ends = np.argwhere(edges == -1)
+
+        # argwhere walks the grid in (width, depth, height) order, so the
+        # k-th run start belongs with the k-th run end
+        boxes = []
+        open_runs = {}  # (w, h_start, h_end) -> index of the box still growing along depth
+        for (w, d, h_start), (_, _, h_end) in zip(run_starts.tolist(), run_ends.tolist()):
+            key = (w, h_start, h_end)
+            index = open_runs.get(key)
+            if index is not None and boxes[index][0][1] + boxes[index][1][1] == d:
+                start, dims = boxes[index]
+                boxes[index] = (start, (1, dims[1] + 1, dims[2]))
+            else:
+                open_runs[key] = len(boxes)
+                boxes.append(((w, d, h_start), (1, 1, h_end - h_start)))
+        return boxes